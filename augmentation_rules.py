@@ -0,0 +1,104 @@
+import numpy as np
+
+from utils import INF
+
+# Circuit augmentation rules of the augmentation scheme. The circuit model (PolyhedralModel) computes the
+# circuit g minimizing c^T g / ||g||_w, where the 1-norm ||g||_w weighs (Bg)^+ and (Bg)^- of the rows of B
+# and g^+ and g^- of the variables (see PolyhedralModel.set_norm_weights). A rule chooses these weights
+# before each oracle call. Since all weights are positive, every rule finds an improving circuit as long
+# as there is one, and the scheme stops at an optimal point with any rule.
+
+# the greatest-improvement weights are 1/slack for slacks between GI_MIN_SLACK times the largest finite
+# slack and the largest finite slack (non-blocking sides of the rows and bounds get the smallest weight)
+GI_MIN_SLACK = 1e-6
+# weight of the rows of B in the Dantzig-like norm (with weight 0, y_pos_i and y_neg_i of the circuit model
+# would form a free pair of zero cost, on which the simplex method can stall)
+DANTZIG_ROW_WEIGHT = 1e-6
+# the random rule draws each weight uniformly from RANDOM_WEIGHT_RANGE (times the steepest-descent weight)
+RANDOM_WEIGHT_RANGE = (0.1, 1.0)
+
+
+class AugmentationRule():
+    name = None
+    # whether the rule weighs the free variables as well (the model then splits them, see PolyhedralModel)
+    split_all = False
+
+    def __init__(self, rng=None):
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    # weights (row_pos, row_neg, col_pos, col_neg) of the 1-norm of the circuit model pm for the next oracle
+    # call at the point x of P, or None to keep the current weights
+    def norm_weights(self, P, pm, x):
+        return None
+
+
+# steepest descent: |Bg| plus |g_j| for each finite bound of x_j (the default weights of the model)
+class SteepestDescentRule(AugmentationRule):
+    name = 'steepest'
+
+
+# Dantzig-like rule: the circuit of most negative c^T g / ||g||_1, i.e. every variable has weight 1 and the
+# rows of B have (almost) weight 0, as Dantzig's pivot rule compares the reduced costs per unit of the entering
+# variable
+class DantzigRule(AugmentationRule):
+    name = 'dantzig'
+    split_all = True
+
+    def __init__(self, rng=None):
+        super(DantzigRule, self).__init__(rng)
+        self.weights_set = False
+
+    def norm_weights(self, P, pm, x):
+        if self.weights_set:
+            return None
+        self.weights_set = True
+        n_split = len(pm.split_cols)
+        row_weights = np.full(pm.m_B, DANTZIG_ROW_WEIGHT)
+        return row_weights, row_weights, np.ones(n_split), np.ones(n_split)
+
+
+# Approximation of the greatest-improvement rule, which takes the circuit whose maximal step improves the
+# objective most. Each side of an inactive row or bound that blocks the step is weighted by 1/slack, so that
+# the step to the first blocking constraint of a circuit of norm 1 has length at least 1 (exactly 1 if a
+# single constraint blocks it), and -c^T g is a lower bound on the improvement of the maximal step.
+# The weights change at every point, so each oracle call first updates the norm of the model
+class GreatestImprovementRule(AugmentationRule):
+    name = 'greatest_improvement'
+
+    def norm_weights(self, P, pm, x):
+        split = pm.split_cols
+        row_slack = np.where(pm.active_mask[:pm.m_B], INF, P.d - P.B.dot(x))
+        ub_active = pm.active_mask[pm.m_B + split]
+        lb_active = pm.active_mask[pm.m_B + pm.n + split]
+        ub_slack = np.where(P.has_ub[split] & ~ub_active, P.var_ub[split] - x[split], INF)
+        lb_slack = np.where(P.has_lb[split] & ~lb_active, x[split] - P.var_lb[split], INF)
+        slacks = np.concatenate((row_slack, ub_slack, lb_slack))
+        max_slack = max(slacks[slacks < INF].max(initial=0.0), 1.0)
+        weights = 1 / np.clip(slacks, GI_MIN_SLACK * max_slack, max_slack)
+        n_split = len(split)
+        row_pos, col_pos, col_neg = weights[:pm.m_B], weights[pm.m_B:pm.m_B + n_split], weights[pm.m_B + n_split:]
+        return row_pos, np.full(pm.m_B, 1 / max_slack), col_pos, col_neg
+
+
+# random improving circuit: the steepest-descent weights are multiplied by random factors at every point, so
+# the oracle returns the steepest circuit for a random norm (an improving circuit as long as there is one)
+class RandomRule(AugmentationRule):
+    name = 'random'
+
+    def norm_weights(self, P, pm, x):
+        low, high = RANDOM_WEIGHT_RANGE
+        n_split = len(pm.split_cols)
+        return (self.rng.uniform(low, high, pm.m_B), self.rng.uniform(low, high, pm.m_B),
+                pm.bound_weights * self.rng.uniform(low, high, n_split),
+                pm.bound_weights * self.rng.uniform(low, high, n_split))
+
+
+AUGMENTATION_RULES = {rule.name: rule for rule in (SteepestDescentRule, DantzigRule, GreatestImprovementRule,
+                                                    RandomRule)}
+
+
+# create the augmentation rule with the given name (rng is used by the random rule)
+def make_rule(name='steepest', rng=None):
+    if name not in AUGMENTATION_RULES:
+        raise ValueError('Unknown augmentation rule: {}. Options: {}'.format(name, ', '.join(AUGMENTATION_RULES)))
+    return AUGMENTATION_RULES[name](rng=rng)
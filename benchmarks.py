@@ -0,0 +1,592 @@
+import os
+import io
+import time
+import contextlib
+import tempfile
+import timeit
+import numpy as np
+
+from problem_cache import read_mps_cached, generated_instance
+from polyhedron import Polyhedron, ANTI_STALLING
+from partition_polytope import PartitionPolytope, random_partition_instance
+from spindle import Spindle, spindle_facets
+from steepest_descent import steepest_descent_augmentation_scheme as sdac, CROSSOVER_THRESHOLDS
+from polyhedral_model import PHASE_MODES
+from profiling import Profiler
+from iteration_log import MemorySink
+from augmentation_rules import make_rule, AUGMENTATION_RULES
+from exact_kernel import sympy_kernel_vector
+from utils import get_row, to_dense, INF, EPS
+
+
+PROBLEM_DIR = 'netlib_lp_subset'
+# steps shorter than this are counted as tiny in the degeneracy benchmark
+TINY_STEP = 1e-5
+
+
+# build a Polyhedron for an MPS file without printing progress information
+# (with the variable bounds as rows of B, or as vectors if bound_rows is False)
+def load_polyhedron(mps_fn, backend='gurobi', bound_rows=True):
+    with contextlib.redirect_stdout(io.StringIO()):
+        if bound_rows:
+            c, B, d, A, b = read_mps_cached(mps_fn)
+            P = Polyhedron(B, d, A, b, c, backend=backend)
+        else:
+            c, B, d, A, b, lb, ub = read_mps_cached(mps_fn, bound_rows=False)
+            P = Polyhedron(B, d, A, b, c, backend=backend, lb=lb, ub=ub)
+    return P
+
+
+# reference implementation: one constraint per row with every (dense) coefficient
+def build_gurobi_model_dense_loop(P):
+    import gurobipy as gp
+    model = gp.Model()
+    x = [model.addVar(lb=-INF, ub=INF, name='x_{}'.format(i)) for i in range(P.n)]
+    A, B = to_dense(P.A), to_dense(P.B)
+    for i in range(P.m_A):
+        model.addConstr(gp.LinExpr(A[i], x) == P.b[i], name='A_{}'.format(i))
+    for i in range(P.m_B):
+        model.addConstr(gp.LinExpr(B[i], x) <= P.d[i], name='B_{}'.format(i))
+    model.update()
+    return model
+
+
+# reference implementation: one constraint per row using only the nonzero coefficients
+def build_gurobi_model_row_loop(P):
+    import gurobipy as gp
+    model = gp.Model()
+    x = [model.addVar(lb=-INF, ub=INF, name='x_{}'.format(i)) for i in range(P.n)]
+    for i in range(P.m_A):
+        coeffs, inds = get_row(P.A, i)
+        model.addConstr(gp.LinExpr(coeffs, [x[j] for j in inds]) == P.b[i], name='A_{}'.format(i))
+    for i in range(P.m_B):
+        coeffs, inds = get_row(P.B, i)
+        model.addConstr(gp.LinExpr(coeffs, [x[j] for j in inds]) <= P.d[i], name='B_{}'.format(i))
+    model.update()
+    return model
+
+
+def build_gurobi_model_matrix(P):
+    P.build_lp_model(c=P.c)
+    P.model.model.update()
+    return P.model
+
+
+# compare the time to build the simplex model of each problem
+# with the per-row loops and with the matrix-form builder
+def bench_model_build(problems, problem_dir=PROBLEM_DIR, repeats=3):
+    builders = [('dense_loop', build_gurobi_model_dense_loop),
+                ('row_loop', build_gurobi_model_row_loop),
+                ('matrix', build_gurobi_model_matrix)]
+    print('{:<12} {:>7} {:>7} {:>9} {:>12} {:>12} {:>12} {:>9}'.format(
+          'problem', 'n', 'm', 'nnz', 'dense_loop', 'row_loop', 'matrix', 'speedup'))
+    for problem in problems:
+        P = load_polyhedron(os.path.join(problem_dir, problem))
+        nnz = np.count_nonzero(to_dense(P.B)) + np.count_nonzero(to_dense(P.A))
+        times = {}
+        for name, build in builders:
+            best = float('inf')
+            for _ in range(repeats):
+                t0 = time.perf_counter()
+                build(P)
+                best = min(best, time.perf_counter() - t0)
+            times[name] = best
+        print('{:<12} {:>7} {:>7} {:>9} {:>12.4f} {:>12.4f} {:>12.4f} {:>8.1f}x'.format(
+              problem, P.n, P.m_B + P.m_A, nnz, times['dense_loop'], times['row_loop'], times['matrix'],
+              times['dense_loop'] / times['matrix']))
+
+
+# reference implementation: per-row active constraint scan
+def get_active_constraints_loop(P, x):
+    B_x = P.B.dot(x)
+    inds = []
+    for i in range(P.m_B):
+        if P.d[i] - B_x[i] <= EPS:
+            inds.append(i)
+    active_inds = [False] * P.m_B
+    for i in inds:
+        active_inds[i] = True
+    return inds, active_inds
+
+
+# reference implementation: per-row ratio test on a list of active flags (modified in place)
+def ratio_test_loop(P, B_x, active_inds, y_pos, y_neg):
+    B_g = y_pos - y_neg
+    alpha = float('inf')
+    stopping_inds = []
+    for i in range(P.m_B):
+        B_g_i = B_g[i]
+        if abs(B_g_i) <= EPS: 
+            continue
+        elif B_g_i > 0:
+            if active_inds[i]: 
+                continue
+            a = (P.d[i] - B_x[i]) / float(B_g_i)
+            if abs(alpha - a) < EPS:
+                active_inds[i] = True
+                stopping_inds.append(i)
+            elif a < alpha:
+                alpha = a
+                for j in stopping_inds:
+                    active_inds[j] = False
+                stopping_inds = [i]
+                active_inds[i] = True
+        elif B_g_i < 0:
+            active_inds[i] = False   
+    return alpha, [i for i in range(P.m_B) if active_inds[i]]
+
+
+# run steepest-descent iterations on each problem and time the ratio test and
+# active set computation of each iteration with the per-row loops and the vectorized methods
+def bench_ratio_test(problems, problem_dir=PROBLEM_DIR, iterations=20, method='dual_simplex'):
+    print('{:<12} {:>7} {:>7} {:>6} {:>14} {:>14} {:>9} {:>11}'.format(
+          'problem', 'n', 'm_B', 'iters', 'loop (ms/it)', 'numpy (ms/it)', 'speedup', 'mismatches'))
+    for problem in problems:
+        P = load_polyhedron(os.path.join(problem_dir, problem))
+        with contextlib.redirect_stdout(io.StringIO()):
+            x = np.asarray(P.find_feasible_solution())
+            
+            t0 = time.perf_counter()
+            inds_loop, _ = get_active_constraints_loop(P, x)
+            active_loop_time = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            inds = P.get_active_constraints(np.copy(x))
+            active_numpy_time = time.perf_counter() - t0
+            mismatches = int(list(inds) != inds_loop)
+            
+            pm = P.build_polyhedral_model(active_inds=inds, method=method)
+            loop_times, numpy_times = [], []
+            for _ in range(iterations):
+                g, y_pos, y_neg, steepness = pm.compute_sd_direction()[:4]
+                if abs(steepness) <= EPS:
+                    break
+                
+                active_list = P.active_inds.tolist()
+                B_x = np.copy(P.B_x_current)
+                t0 = time.perf_counter()
+                alpha_loop, inds_loop = ratio_test_loop(P, B_x, active_list, y_pos, y_neg)
+                loop_times.append(time.perf_counter() - t0)
+                
+                t0 = time.perf_counter()
+                _, alpha, changed = P.take_maximal_step(g, y_pos, y_neg)
+                numpy_times.append(time.perf_counter() - t0)
+                inds = np.flatnonzero(P.active_inds)
+                mismatches += int(list(inds) != inds_loop or not np.isclose(alpha, alpha_loop))
+                
+                if np.isinf(alpha):
+                    break
+                pm.update_active_inds(changed, P.active_inds)
+        
+        n_iters = len(loop_times)
+        loop_ms = 1000 * (active_loop_time + sum(loop_times)) / max(n_iters, 1)
+        numpy_ms = 1000 * (active_numpy_time + sum(numpy_times)) / max(n_iters, 1)
+        print('{:<12} {:>7} {:>7} {:>6} {:>14.3f} {:>14.3f} {:>8.1f}x {:>11}'.format(
+              problem, P.n, P.m_B, n_iters, loop_ms, numpy_ms, loop_ms / numpy_ms, mismatches))
+
+
+# run the steepest-descent scheme on each problem with each LP backend
+# and compare the latency of the circuit oracle per iteration
+def bench_backends(problems, backends, problem_dir=PROBLEM_DIR, method='dual_simplex', max_time=300):
+    print('{:<12} {:<8} {:>6} {:>16} {:>16} {:>14} {:>12} {:>18}'.format(
+          'problem', 'backend', 'iters', 'oracle mean (ms)', 'oracle med (ms)', 'simplex iters', 'total (s)', 'objective'))
+    for problem in problems:
+        for backend in backends:
+            P = load_polyhedron(os.path.join(problem_dir, problem), backend=backend)
+            with contextlib.redirect_stdout(io.StringIO()):
+                x = P.find_feasible_solution()
+                r = sdac(P, x, method=method, max_time=max_time)
+            if r.status != 0:
+                print('{:<12} {:<8} {}'.format(problem, backend, 'unbounded' if r.status == 1 else 'time limit reached'))
+                continue
+            print('{:<12} {:<8} {:>6} {:>16.3f} {:>16.3f} {:>14.1f} {:>12.3f} {:>18.6g}'.format(
+                  problem, backend, r.n_iters, 1000 * np.mean(r.solve_times), 1000 * np.median(r.solve_times),
+                  np.mean(r.simplex_iters), r.solve_time, r.obj))
+
+
+# run the steepest-descent scheme on each problem with each way of measuring the phase times
+# and compare the wall time of the oracle calls (solve and callback overhead)
+def bench_callback(problems, problem_dir=PROBLEM_DIR, method='dual_simplex', max_time=300, backend='gurobi'):
+    print('{:<12} {:<8} {:>6} {:>14} {:>16} {:>18} {:>16}'.format(
+          'problem', 'mode', 'iters', 'simplex iters', 'solve mean (ms)', 'overhead mean (ms)', 'oracle total (s)'))
+    for problem in problems:
+        for phase_mode in PHASE_MODES:
+            P = load_polyhedron(os.path.join(problem_dir, problem), backend=backend)
+            profiler = Profiler()
+            with contextlib.redirect_stdout(io.StringIO()):
+                x = P.find_feasible_solution()
+                r = sdac(P, x, method=method, max_time=max_time, profiler=profiler, phase_mode=phase_mode)
+            if r.status != 0:
+                print('{:<12} {:<8} {}'.format(problem, phase_mode, 'unbounded' if r.status == 1 else 'time limit reached'))
+                continue
+            solve, overhead = profiler.totals['oracle_solve'], profiler.totals['oracle_overhead']
+            n_calls = profiler.counts['oracle_solve']
+            print('{:<12} {:<8} {:>6} {:>14} {:>16.3f} {:>18.3f} {:>16.3f}'.format(
+                  problem, phase_mode, r.n_iters, r.stats['total_simplex_iters'], 1000 * solve / n_calls,
+                  1000 * overhead / n_calls, solve + overhead))
+
+
+# run the steepest-descent scheme on each problem with the variable bounds as rows of B and handled
+# per variable, and compare the size of the circuit model and the time per iteration
+def bench_bounds(problems, problem_dir=PROBLEM_DIR, method='dual_simplex', max_time=300, backend='gurobi'):
+    print('{:<12} {:<7} {:>7} {:>7} {:>6} {:>16} {:>16} {:>12} {:>18}'.format(
+          'problem', 'bounds', 'm_B', 'n_vars', 'iters', 'oracle mean (ms)', 'step mean (ms)', 'total (s)', 'objective'))
+    for problem in problems:
+        for bound_rows in (True, False):
+            P = load_polyhedron(os.path.join(problem_dir, problem), backend=backend, bound_rows=bound_rows)
+            mode = 'rows' if bound_rows else 'native'
+            profiler = Profiler()
+            with contextlib.redirect_stdout(io.StringIO()):
+                x = P.find_feasible_solution()
+                r = sdac(P, x, method=method, max_time=max_time, profiler=profiler, primal=True)
+                n_vars = P.build_polyhedral_model(primal=True).n_cols
+            if r.status != 0:
+                print('{:<12} {:<7} {}'.format(problem, mode, 'unbounded' if r.status == 1 else 'time limit reached'))
+                continue
+            oracle = profiler.totals['oracle_solve'] + profiler.totals['oracle_overhead']
+            step = profiler.totals['ratio_test'] + profiler.totals['bound_update']
+            n_calls = profiler.counts['oracle_solve']
+            print('{:<12} {:<7} {:>7} {:>7} {:>6} {:>16.3f} {:>16.3f} {:>12.3f} {:>18.6g}'.format(
+                  problem, mode, P.m_B, n_vars, r.n_iters, 1000 * oracle / n_calls,
+                  1000 * step / max(profiler.counts['ratio_test'], 1), r.solve_time, r.obj))
+
+
+# run the steepest-descent scheme on each problem with the primal and the dual circuit model
+# and compare the model size and the time of the oracle
+def bench_formulation(problems, problem_dir=PROBLEM_DIR, method='dual_simplex', max_time=300, backend='gurobi'):
+    print('{:<12} {:<7} {:>7} {:>7} {:>6} {:>14} {:>16} {:>12} {:>18}'.format(
+          'problem', 'model', 'rows', 'cols', 'iters', 'simplex iters', 'oracle mean (ms)', 'total (s)', 'objective'))
+    for problem in problems:
+        P = load_polyhedron(os.path.join(problem_dir, problem), backend=backend, bound_rows=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            x = P.find_feasible_solution()
+        for primal in (True, False):
+            profiler = Profiler()
+            with contextlib.redirect_stdout(io.StringIO()):
+                pm = P.build_polyhedral_model(active_inds=P.get_active_constraints(np.copy(x)), method=method,
+                                              primal=primal)
+                r = sdac(P, np.copy(x), method=method, max_time=max_time, profiler=profiler, pm=pm)
+            mode = 'primal' if primal else 'dual'
+            if r.status != 0:
+                print('{:<12} {:<7} {}'.format(problem, mode, 'unbounded' if r.status == 1 else 'time limit reached'))
+                continue
+            oracle = profiler.totals['oracle_solve'] + profiler.totals['oracle_overhead']
+            print('{:<12} {:<7} {:>7} {:>7} {:>6} {:>14} {:>16.3f} {:>12.3f} {:>18.6g}'.format(
+                  problem, mode, pm.n_rows, pm.n_cols, r.n_iters, r.stats['total_simplex_iters'],
+                  1000 * oracle / profiler.counts['oracle_solve'], r.solve_time, r.obj))
+
+
+# reference implementation: rows orthogonal to g stacked in a loop and the kernel computed with sympy
+# (returns None if an entry of the circuit is below EPS, which makes the kernel trivial)
+def get_normalized_circuit_sympy(P, g):
+    B = to_dense(P.B)
+    B_g = B.dot(g)
+    B_0 = np.zeros((1, P.n), dtype=int)
+    for i in range(P.m_B):
+        if abs(B_g[i]) <= EPS:
+            B_0 = np.concatenate((B_0, B[i,:].reshape((1 ,P.n))))
+    bounded = np.flatnonzero((P.has_lb | P.has_ub) & (np.abs(g) <= EPS))
+    B_0 = np.concatenate((B_0, np.eye(P.n, dtype=int)[bounded]))
+    if P.A is not None:
+        B_0 = np.concatenate((to_dense(P.A), B_0), axis=0)
+    circuit = sympy_kernel_vector(B_0)
+    if circuit is None:
+        return None
+    circuit = np.array(circuit, dtype=object)
+    for i in range(P.n):
+        if abs(g[i]) >= EPS:
+            if (circuit[i] > 0) != (g[i] > 0):
+                circuit = -1*circuit
+            break
+    return circuit
+
+
+# normalize the circuits of the first steepest-descent iterations of each problem with sympy
+# and with Polyhedron.get_normalized_circuit, and compare the time per circuit
+def bench_normalize(problems, problem_dir=PROBLEM_DIR, iterations=20, method='dual_simplex', backend='gurobi'):
+    print('{:<12} {:>6} {:>8} {:>16} {:>16} {:>10} {:>13} {:>11}'.format(
+          'problem', 'n', 'circuits', 'sympy mean (ms)', 'exact mean (ms)', 'speedup', 'sympy failed', 'mismatches'))
+    for problem in problems:
+        P = load_polyhedron(os.path.join(problem_dir, problem), backend=backend, bound_rows=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            x = P.find_feasible_solution()
+            # a steepest-descent iteration only changes P.active_inds, which the normalization does not use
+            r = sdac(P, x, method=method, max_time=INF, sink=MemorySink(keep_circuits=True))
+        circuits = [g for g in r.circuits if g is not None][:iterations]
+        times = {'sympy': 0.0, 'exact': 0.0}
+        failed, mismatches = 0, 0
+        for g in circuits:
+            t0 = time.perf_counter()
+            reference = get_normalized_circuit_sympy(P, g)
+            t1 = time.perf_counter()
+            circuit = P.get_normalized_circuit(g)
+            t2 = time.perf_counter()
+            times['sympy'] += t1 - t0
+            times['exact'] += t2 - t1
+            if reference is None:
+                failed += 1
+            else:
+                mismatches += int(not all(int(a) == int(b) for a, b in zip(reference, circuit)))
+        n_circuits = max(len(circuits), 1)
+        print('{:<12} {:>6} {:>8} {:>16.3f} {:>16.3f} {:>10.1f} {:>13} {:>11}'.format(
+              problem, P.n, len(circuits), 1000 * times['sympy'] / n_circuits, 1000 * times['exact'] / n_circuits,
+              times['sympy'] / max(times['exact'], 1e-12), failed, mismatches))
+
+
+# random partition polytope with n items and k clusters, generated as in main.py
+def random_partition_polytope(n, k, backend='gurobi', seed=0):
+    ub, lb, c = random_partition_instance(n, k, np.random.default_rng(seed))
+    with contextlib.redirect_stdout(io.StringIO()):
+        P = PartitionPolytope(n, k, ub, lb, c, backend=backend)
+    return P
+
+
+# run the steepest-descent scheme on random partition polytopes with n items (for each n in sizes)
+# and k clusters with the circuit model and with the cluster exchange oracle
+def bench_partition(sizes, k=10, method='dual_simplex', max_time=300, backend='gurobi', seed=0):
+    print('{:<8} {:>4} {:<9} {:>6} {:>16} {:>14} {:>12} {:>12}'.format(
+          'n', 'k', 'oracle', 'iters', 'oracle mean (ms)', 'step mean (ms)', 'total (s)', 'objective'))
+    for n in sizes:
+        for oracle in ('lp', 'exchange'):
+            P = random_partition_polytope(n, k, backend=backend, seed=seed)
+            profiler = Profiler()
+            with contextlib.redirect_stdout(io.StringIO()):
+                x = P.find_feasible_solution()
+                pm = P.build_exchange_oracle() if oracle == 'exchange' else None
+                r = sdac(P, x, method=method, max_time=max_time, profiler=profiler, pm=pm)
+            if r.status != 0:
+                print('{:<8} {:>4} {:<9} {}'.format(n, k, oracle, 'time limit reached'))
+                continue
+            oracle_time = profiler.totals['oracle_solve'] + profiler.totals['oracle_overhead']
+            step = profiler.totals['ratio_test'] + profiler.totals['bound_update']
+            print('{:<8} {:>4} {:<9} {:>6} {:>16.3f} {:>14.3f} {:>12.3f} {:>12.6g}'.format(
+                  n, k, oracle, r.n_iters, 1000 * oracle_time / profiler.counts['oracle_solve'],
+                  1000 * step / max(profiler.counts['ratio_test'], 1), r.solve_time, r.obj))
+
+
+# time to optimality of the simplex method (from scratch), of steepest descent and of the hybrid mode with each
+# of the given crossover triggers (see CROSSOVER_THRESHOLDS). The times of steepest descent and of the hybrid
+# mode start at the feasible point (as in main.py), and include the simplex solve after the switch
+def bench_hybrid(problems, triggers, problem_dir=PROBLEM_DIR, method='dual_simplex', max_time=300, backend='gurobi'):
+    print('{:<12} {:<20} {:>8} {:>8} {:>14} {:>10} {:>18} {:>10}'.format(
+          'problem', 'mode', 'iters', 'switch', 'simplex iters', 'time (s)', 'objective', 'rel. error'))
+    for problem in problems:
+        P = load_polyhedron(os.path.join(problem_dir, problem), backend=backend, bound_rows=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            P.build_lp_model()
+            lp = P.solve_lp(record_objs=False)
+        rows = [('simplex', '', '', lp.n_iters, lp.solve_time, lp.obj)]
+        for trigger in ['off'] + triggers:
+            Q = load_polyhedron(os.path.join(problem_dir, problem), backend=backend, bound_rows=False)
+            mode = 'steepest descent' if trigger == 'off' else 'hybrid ' + trigger
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    x = Q.find_feasible_solution()
+                    r = sdac(Q, x, method=method, max_time=max_time, crossover=trigger)
+            except RuntimeError as e:
+                print('{:<12} {:<20} failed: {}'.format(problem, mode, e))
+                continue
+            if r.status != 0:
+                print('{:<12} {:<20} {}'.format(problem, mode, 'unbounded' if r.status == 1 else 'time limit reached'))
+                continue
+            switch = r.stats.get('crossover')
+            rows.append((mode, r.n_iters, switch['iteration'] if switch else '-',
+                         switch['simplex_iters'] if switch else '-', r.solve_time, r.obj))
+        for mode, iters, switch, simplex_iters, solve_time, obj in rows:
+            print('{:<12} {:<20} {:>8} {:>8} {:>14} {:>10.3f} {:>18.10g} {:>10.1e}'.format(
+                  problem, mode, iters, switch, simplex_iters, solve_time, obj,
+                  abs(obj - lp.obj) / max(abs(lp.obj), 1)))
+
+# iterations and time to optimality of the augmentation scheme with each of the given circuit augmentation rules
+# (see augmentation_rules), with the mean time per oracle call and per norm update (part of bound_update);
+# the random rule is seeded with seed
+def bench_rules(problems, rules, problem_dir=PROBLEM_DIR, method='dual_simplex', max_time=300, backend='gurobi',
+                seed=0):
+    print('{:<12} {:<22} {:>8} {:>10} {:>16} {:>16} {:>18} {:>10}'.format(
+          'problem', 'rule', 'iters', 'time (s)', 'oracle mean (ms)', 'update mean (ms)', 'objective', 'rel. error'))
+    for problem in problems:
+        P = load_polyhedron(os.path.join(problem_dir, problem), backend=backend, bound_rows=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            x = P.find_feasible_solution()
+            P.build_lp_model()
+            lp = P.solve_lp(record_objs=False)
+        for rule in rules:
+            profiler = Profiler()
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    r = sdac(P, np.copy(x), method=method, max_time=max_time, profiler=profiler,
+                             rule=make_rule(rule, np.random.default_rng(seed)))
+            except RuntimeError as e:
+                print('{:<12} {:<22} failed: {}'.format(problem, rule, e))
+                continue
+            if r.status != 0:
+                print('{:<12} {:<22} {}'.format(problem, rule, 'unbounded' if r.status == 1 else 'time limit reached'))
+                continue
+            n_calls = profiler.counts['oracle_solve']
+            oracle_time = profiler.totals['oracle_solve'] + profiler.totals['oracle_overhead']
+            print('{:<12} {:<22} {:>8} {:>10.3f} {:>16.3f} {:>16.3f} {:>18.10g} {:>10.1e}'.format(
+                  problem, rule, r.n_iters, r.solve_time, 1000 * oracle_time / n_calls,
+                  1000 * profiler.totals['bound_update'] / n_calls, r.obj,
+                  abs(r.obj - lp.obj) / max(abs(lp.obj), 1)))
+
+
+# iterations, degenerate steps, steps shorter than TINY_STEP, total oracle time, simplex iterations of the
+# clean-up of the perturb mode and time to optimality of steepest descent with each of the given anti-stalling
+# modes (see polyhedron.ANTI_STALLING)
+def bench_degeneracy(problems, modes, problem_dir=PROBLEM_DIR, method='dual_simplex', max_time=300, backend='gurobi'):
+    print('{:<12} {:<8} {:>8} {:>11} {:>8} {:>11} {:>9} {:>10} {:>18} {:>10}'.format(
+          'problem', 'mode', 'iters', 'degenerate', 'tiny', 'oracle (s)', 'clean-up', 'time (s)', 'objective',
+          'rel. error'))
+    for problem in problems:
+        P = load_polyhedron(os.path.join(problem_dir, problem), backend=backend, bound_rows=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            x = P.find_feasible_solution()
+            P.build_lp_model()
+            lp = P.solve_lp(record_objs=False)
+        for mode in modes:
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    r = sdac(P, np.copy(x), method=method, max_time=max_time, anti_stalling=mode)
+            except RuntimeError as e:
+                print('{:<12} {:<8} failed: {}'.format(problem, mode, e))
+                continue
+            if r.status != 0:
+                print('{:<12} {:<8} {}'.format(problem, mode, 'unbounded' if r.status == 1 else 'time limit reached'))
+                continue
+            clean_up = r.stats['perturbation']['simplex_iters'] if 'perturbation' in r.stats else 0
+            print('{:<12} {:<8} {:>8} {:>11} {:>8} {:>11.3f} {:>9} {:>10.3f} {:>18.10g} {:>10.1e}'.format(
+                  problem, mode, r.n_iters, r.stats['n_degenerate_steps'], int(np.sum(np.array(r.steps) < TINY_STEP)),
+                  r.stats['total_solve_time'], clean_up, r.solve_time, r.obj,
+                  abs(r.obj - lp.obj) / max(abs(lp.obj), 1)))
+
+
+# time to generate random partition polytopes with n items (for each n in sizes) and k clusters and spindles
+# of dimension n (for each n in dims) with n/4 cone facets and pairs of parallel facets, drawn and loaded
+# from the instance cache
+def bench_generate(sizes, dims, k=10, repeats=3, seed=0):
+    print('{:<10} {:<8} {:>12} {:>12} {:>14}'.format('instance', 'n', 'draw (s)', 'cache (s)', 'polyhedron (s)'))
+    instances = []
+    for n in sizes:
+        instances.append(('partition', n, 'partition_n-{}_k-{}'.format(n, k),
+                          lambda rng, n=n: dict(zip(('ub', 'lb', 'c'), random_partition_instance(n, k, rng))),
+                          lambda a, n=n: PartitionPolytope(n, k, a['ub'], a['lb'], a['c'])))
+    for n in dims:
+        instances.append(('spindle', n, 'spindle_n-{}_c-{}_p-{}'.format(n, n//4, n//4),
+                          lambda rng, n=n: dict(zip(('B', 'd'), spindle_facets(n, n//4, n//4, rng))),
+                          lambda a, n=n: Spindle(n, n//4, n//4, facets=(a['B'], a['d']))))
+    for name, n, key, generate, build in instances:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            draw = min(timeit.repeat(lambda: generated_instance(key, seed, generate, cache=False),
+                                     number=1, repeat=repeats))
+            arrays = generated_instance(key, seed, generate, cache_dir=cache_dir)
+            load = min(timeit.repeat(lambda: generated_instance(key, seed, generate, cache_dir=cache_dir),
+                                     number=1, repeat=repeats))
+        with contextlib.redirect_stdout(io.StringIO()):
+            polyhedron = min(timeit.repeat(lambda: build(arrays), number=1, repeat=repeats))
+        print('{:<10} {:<8} {:>12.4f} {:>12.4f} {:>14.4f}'.format(name, n, draw, load, polyhedron))
+
+
+# solve each problem for n_objectives random perturbations of its objective, once by rebuilding
+# everything for each objective (as separate runs of main.py do) and with Polyhedron.solve_batch
+# (1 process with and without warm starts, n_workers processes), and compare the objectives per hour
+def bench_batch(problems, problem_dir=PROBLEM_DIR, n_objectives=8, n_workers=4, method='dual_simplex',
+                max_time=300, backend='gurobi'):
+    print('{:<12} {:<14} {:>12} {:>16} {:>11} {:>10}'.format(
+          'problem', 'mode', 'time (s)', 'objectives/hour', 'max error', 'unbounded'))
+    for problem in problems:
+        mps_fn = os.path.join(problem_dir, problem)
+        P = load_polyhedron(mps_fn, backend=backend)
+        rng = np.random.RandomState(0)
+        C = P.c * rng.uniform(0.5, 1.5, size=(n_objectives, P.n))
+        
+        t0 = time.perf_counter()
+        rebuild_objs = []
+        for c in C:
+            Q = load_polyhedron(mps_fn, backend=backend)
+            with contextlib.redirect_stdout(io.StringIO()):
+                x = Q.find_feasible_solution()
+                rebuild_objs.append(sdac(Q, x, c=c, method=method, max_time=max_time).obj)
+        times = [('rebuild', time.perf_counter() - t0, rebuild_objs)]
+        
+        for workers, warm_start in ((1, False), (1, True), (n_workers, False)):
+            t0 = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = P.solve_batch(C, n_workers=workers, method=method, max_time=max_time, warm_start=warm_start)
+            mode = 'batch x{}{}'.format(workers, ' warm' if warm_start else '')
+            times.append((mode, time.perf_counter() - t0, [r.obj for r in results]))
+        
+        # objectives for which the problem is unbounded have no objective value
+        for mode, t, objs in times:
+            errors = [abs(o - r) for o, r in zip(objs, rebuild_objs) if o is not None and r is not None]
+            print('{:<12} {:<14} {:>12.3f} {:>16.0f} {:>11.2e} {:>10}'.format(
+                  problem, mode, t, 3600 * n_objectives / t, max(errors, default=0.0), objs.count(None)))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmarks for the steepest-descent implementation')
+    parser.add_argument('benchmark', help='benchmark to run', choices=['model_build', 'ratio_test', 'backends', 'callback', 'batch',
+                                                                      'bounds', 'formulation', 'normalize', 'partition',
+                                                                      'generate', 'hybrid', 'rules', 'degeneracy'])
+    parser.add_argument('--problems', help='netlib problems to use (default is all problems in problem_dir)', nargs='*')
+    parser.add_argument('--problem_dir', help='directory containing the MPS files', default=PROBLEM_DIR)
+    parser.add_argument('--repeats', help='number of timed repetitions per measurement', type=int, default=3)
+    parser.add_argument('--iterations', help='number of steepest-descent iterations to time (or circuits to normalize)',
+                        type=int, default=20)
+    parser.add_argument('--sd_method', help='algorithm for computing s.d. directions', type=str, default='dual_simplex')
+    parser.add_argument('--backends', help='LP backends to compare', nargs='*', default=['gurobi', 'highs'])
+    parser.add_argument('--max_time', help='max time for steepest descent algorithm in seconds', type=float, default=300)
+    parser.add_argument('--backend', help='LP backend for the callback, batch, bounds, formulation, normalize, partition '
+                                          'and hybrid benchmarks', type=str, default='gurobi')
+    parser.add_argument('--n_objectives', help='number of objectives solved in the batch benchmark', type=int, default=8)
+    parser.add_argument('--workers', help='number of worker processes in the batch benchmark', type=int, default=4)
+    parser.add_argument('--sizes', help='numbers of items of the partition polytopes', type=int, nargs='*',
+                        default=[100, 500, 2000])
+    parser.add_argument('--k', help='number of clusters of the partition polytopes', type=int, default=10)
+    parser.add_argument('--triggers', help='crossover triggers compared in the hybrid benchmark', nargs='*',
+                        choices=list(CROSSOVER_THRESHOLDS), default=list(CROSSOVER_THRESHOLDS))
+    parser.add_argument('--rules', help='augmentation rules compared in the rules benchmark', nargs='*',
+                        choices=list(AUGMENTATION_RULES), default=list(AUGMENTATION_RULES))
+    parser.add_argument('--modes', help='anti-stalling modes compared in the degeneracy benchmark', nargs='*',
+                        choices=ANTI_STALLING, default=ANTI_STALLING)
+    parser.add_argument('--seed', help='seed of the random rule in the rules benchmark and of the generated instances', type=int, default=0)
+    parser.add_argument('--dims', help='dimensions of the spindles in the generate benchmark', type=int, nargs='*',
+                        default=[100, 500, 1000])
+    args = parser.parse_args()
+
+    # the problem cache is kept in problem_dir/.cache
+    problems = args.problems or [fn for fn in sorted(os.listdir(args.problem_dir)) if not fn.startswith('.')]
+    if args.benchmark == 'model_build':
+        bench_model_build(problems, problem_dir=args.problem_dir, repeats=args.repeats)
+    elif args.benchmark == 'ratio_test':
+        bench_ratio_test(problems, problem_dir=args.problem_dir, iterations=args.iterations, method=args.sd_method)
+    elif args.benchmark == 'backends':
+        bench_backends(problems, args.backends, problem_dir=args.problem_dir, method=args.sd_method,
+                       max_time=args.max_time)
+    elif args.benchmark == 'callback':
+        bench_callback(problems, problem_dir=args.problem_dir, method=args.sd_method, max_time=args.max_time,
+                       backend=args.backend)
+    elif args.benchmark == 'batch':
+        bench_batch(problems, problem_dir=args.problem_dir, n_objectives=args.n_objectives, n_workers=args.workers,
+                    method=args.sd_method, max_time=args.max_time, backend=args.backend)
+    elif args.benchmark == 'bounds':
+        bench_bounds(problems, problem_dir=args.problem_dir, method=args.sd_method, max_time=args.max_time,
+                     backend=args.backend)
+    elif args.benchmark == 'formulation':
+        bench_formulation(problems, problem_dir=args.problem_dir, method=args.sd_method, max_time=args.max_time,
+                          backend=args.backend)
+    elif args.benchmark == 'normalize':
+        bench_normalize(problems, problem_dir=args.problem_dir, iterations=args.iterations, method=args.sd_method,
+                        backend=args.backend)
+    elif args.benchmark == 'partition':
+        bench_partition(args.sizes, k=args.k, method=args.sd_method, max_time=args.max_time, backend=args.backend)
+    elif args.benchmark == 'generate':
+        bench_generate(args.sizes, args.dims, k=args.k, repeats=args.repeats, seed=args.seed)
+    elif args.benchmark == 'hybrid':
+        bench_hybrid(problems, args.triggers, problem_dir=args.problem_dir, method=args.sd_method,
+                     max_time=args.max_time, backend=args.backend)
+    elif args.benchmark == 'rules':
+        bench_rules(problems, args.rules, problem_dir=args.problem_dir, method=args.sd_method,
+                    max_time=args.max_time, backend=args.backend, seed=args.seed)
+    elif args.benchmark == 'degeneracy':
+        bench_degeneracy(problems, args.modes, problem_dir=args.problem_dir, method=args.sd_method,
+                         max_time=args.max_time, backend=args.backend)
@@ -0,0 +1,238 @@
+import math
+import numpy as np
+
+# Exact integer kernel vectors of matrices with a one-dimensional kernel, as used to normalize circuits.
+# The kernel is computed modulo primes below 2^31 (so that products of two residues fit in int64)
+# by Gaussian elimination on NumPy arrays, lifted to the integers by Chinese remaindering and
+# verified exactly. sympy is only imported if this fails.
+
+# rows are scaled by powers of ten up to 10^MAX_DECIMALS to make them integral
+MAX_DECIMALS = 12
+# number of primes tried before the kernel of a matrix is taken to be of dimension > 1 (or trivial)
+MAX_UNLUCKY_PRIMES = 3
+
+_primes = []
+
+
+# deterministic Miller-Rabin test for n < 3,215,031,751
+def _is_prime(n):
+    if n < 2:
+        return False
+    for p in (2, 3, 5, 7):
+        if n % p == 0:
+            return n == p
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d, s = d // 2, s + 1
+    for a in (2, 3, 5, 7):
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+# the i-th largest prime below 2^31 (generated on first use)
+def _prime(i):
+    while len(_primes) <= i:
+        p = _primes[-1] - 2 if _primes else 2**31 - 1
+        while not _is_prime(p):
+            p -= 2
+        _primes.append(p)
+    return _primes[i]
+
+
+# scale each row of M by the smallest power of ten that makes it integral and divide it by the gcd of
+# its entries; returns an int64 array, or None if some row has more than MAX_DECIMALS decimals or does not fit in int64
+def integer_rows(M, max_decimals=MAX_DECIMALS):
+    M = np.asarray(M, dtype=float)
+    M_int = np.zeros(M.shape, dtype=np.int64)
+    todo = np.arange(M.shape[0])
+    for k in range(max_decimals + 1):
+        scaled = M[todo] * 10.0**k
+        if np.abs(scaled).max(initial=0) >= 2**62:
+            return None
+        rounded = np.round(scaled)
+        integral = np.all(np.abs(scaled - rounded) <= 1e-9 * np.maximum(np.abs(scaled), 1), axis=1)
+        M_int[todo[integral]] = rounded[integral]
+        todo = todo[~integral]
+        if len(todo) == 0:
+            # smaller entries need fewer primes
+            divisors = np.gcd.reduce(M_int, axis=1)
+            divisors[divisors == 0] = 1
+            return M_int // divisors[:, None]
+    return None
+
+
+# Gaussian elimination of M modulo p with row swaps: returns the pivot rows (in pivot order), the pivot
+# columns and the free column, or None if the kernel of M modulo p is not one-dimensional
+def _pivots_mod(M, p):
+    M = M % p
+    m, s = M.shape
+    order = np.arange(m)
+    pivots = []
+    row = 0
+    for col in range(s):
+        if row == m:
+            break
+        nonzero = np.flatnonzero(M[row:, col])
+        if len(nonzero) == 0:
+            continue
+        k = row + nonzero[0]
+        M[[row, k]] = M[[k, row]]
+        order[[row, k]] = order[[k, row]]
+        M[row] = M[row] * pow(int(M[row, col]), p - 2, p) % p
+        inds = row + 1 + np.flatnonzero(M[row+1:, col])
+        M[inds] = (M[inds] - np.outer(M[inds, col], M[row])) % p
+        pivots.append(col)
+        row += 1
+    if s - len(pivots) != 1:
+        return None
+    free = np.setdiff1d(np.arange(s), pivots)[0]
+    return order[:row], np.array(pivots), free
+
+
+# kernel vectors of the (s-1) x s matrix S = [P | c] (P nonsingular) modulo each of the primes p:
+# (-adj(P) c, det(P)), which is the integer kernel vector of Cramer's rule. The elimination is
+# fraction-free and without row swaps, so that only one inverse per prime is needed: S is reduced to
+# [D | w] with D diagonal by scaling rows, and z_i = -w_i prod_{j != i} d_j / s, det(P) = prod_j d_j / s,
+# where s is the product of the row scalings. Returns a mask of the primes for which P has no zero
+# pivot (only those kernel vectors are valid) and the kernel vectors
+def _cramer_kernel_mod(S, p):
+    r = S.shape[0]
+    M = S[None, :, :] % p[:, None, None]
+    scale = np.ones(len(p), dtype=np.int64)
+    lucky = np.ones(len(p), dtype=bool)
+    for t in range(r):
+        pivot = M[:, t, t].copy()
+        lucky &= pivot != 0
+        pivot[pivot == 0] = 1
+        factors = M[:, :, t].copy()
+        factors[:, t] = 0
+        inds = np.flatnonzero(factors.any(axis=0))
+        M[:, inds] = (pivot[:, None, None] * M[:, inds] - factors[:, inds, None] * M[:, t, None, :]) % p[:, None, None]
+        scale = scale * _pow_mod(pivot, len(inds), p) % p
+    d = np.ascontiguousarray(M[:, np.arange(r), np.arange(r)])
+    d[~lucky] = 1
+    # products of all diagonal entries but one, from prefix and suffix products
+    prefix = np.ones((len(p), r + 1), dtype=np.int64)
+    suffix = np.ones((len(p), r + 1), dtype=np.int64)
+    for i in range(r):
+        prefix[:, i+1] = prefix[:, i] * d[:, i] % p
+        suffix[:, r-i-1] = suffix[:, r-i] * d[:, r-i-1] % p
+    inv_scale = np.array([pow(int(a), int(q) - 2, int(q)) for a, q in zip(scale, p)], dtype=np.int64)
+    V = np.empty((len(p), r + 1), dtype=np.int64)
+    V[:, :r] = prefix[:, :r] * suffix[:, 1:] % p[:, None] * inv_scale[:, None] % p[:, None]
+    V[:, :r] = (-M[:, :, r] % p[:, None]) * V[:, :r] % p[:, None]
+    V[:, r] = prefix[:, r] * inv_scale % p
+    return lucky, V
+
+
+# a^e modulo p for arrays a and p and an integer e >= 0
+def _pow_mod(a, e, p):
+    result = np.ones(len(p), dtype=np.int64)
+    while e:
+        if e & 1:
+            result = result * a % p
+        a = a * a % p
+        e >>= 1
+    return result
+
+
+# number of primes for the Cramer kernel vector (-adj(P) c, det(P)) of S = [P | c], from the size
+# of det(P) and of the solution of P x = c in floating point (one more prime for the sign and rounding)
+def _estimate_primes(S):
+    P, c = S[:, :-1].astype(float), S[:, -1].astype(float)
+    _, logdet = np.linalg.slogdet(P)
+    try:
+        x = np.linalg.solve(P, c)
+    except np.linalg.LinAlgError:
+        return 4
+    bits = logdet / np.log(2) + np.log2(max(np.abs(x).max(initial=0), 1))
+    if not np.isfinite(bits):
+        return 4
+    return int(bits / 31) + 2
+
+
+# primitive integer kernel vector of the integer matrix M (int64 array) by modular elimination,
+# or None if the kernel of M is not one-dimensional (or the primes tried were unlucky)
+def modular_kernel_vector(M):
+    M = M[np.any(M != 0, axis=1)]
+    s = M.shape[1]
+    if s == 1:
+        return [1] if M.shape[0] == 0 else None
+    # rows and columns of a nonsingular (s-1) x (s-1) submatrix; the rank drops modulo few primes only
+    for i in range(MAX_UNLUCKY_PRIMES):
+        pivots = _pivots_mod(M, _prime(i))
+        if pivots is not None:
+            break
+    else:
+        return None
+    rows, cols, free = pivots
+    cols = np.append(cols, free)
+    S = M[rows][:, cols]
+    # the entries of the Cramer kernel vector are (s-1)-minors of S, bounded (Hadamard) by its row norms
+    log2_bound = float(np.sum(np.log2(np.maximum(np.linalg.norm(S.astype(float), axis=1), 1))))
+    M_obj = M.astype(object)
+    
+    z, N = None, 1
+    batch = _estimate_primes(S)
+    while True:
+        p = np.array([_prime(j) for j in range(i, i + batch)], dtype=np.int64)
+        i += batch
+        lucky, V = _cramer_kernel_mod(S, p)
+        for q, v in zip(p[lucky].tolist(), V[lucky]):
+            if z is None:
+                z = [int(a) for a in v]
+            else:
+                # Chinese remaindering of the residues modulo N and q
+                inv = pow(N % q, q - 2, q)
+                z = [u + N * ((int(a) - u) * inv % q) for u, a in zip(z, v)]
+            N *= q
+        if z is not None:
+            # the symmetric residues are the kernel vector once N exceeds twice the bound, and usually earlier
+            kernel = [0] * s
+            for j, u in zip(cols, z):
+                kernel[j] = u - N if u > N // 2 else u
+            divisor = math.gcd(*kernel)
+            if divisor != 0 and not np.any(M_obj.dot(np.array(kernel, dtype=object))):
+                return [a // divisor for a in kernel]
+            if math.log2(N) > log2_bound + 1:
+                return None
+        batch = i
+
+
+# primitive integer kernel vector of M with sympy (entries are read as the decimals they print as),
+# or None if the kernel of M is trivial
+def sympy_kernel_vector(M):
+    import sympy
+    M = np.asarray(M)
+    D = sympy.Matrix(M.shape[0], M.shape[1], lambda i, j: sympy.Rational(str(float(M[i, j]))))
+    ker_D = D.nullspace()
+    if len(ker_D) == 0:
+        return None
+    v = list(ker_D[0])
+    denominator = sympy.lcm([a.q for a in v if a != 0])
+    z = [int(a * denominator) for a in v]
+    divisor = math.gcd(*z)
+    return [a // divisor for a in z]
+
+
+# primitive integer vector spanning the kernel of M (dense, with decimal entries), up to sign.
+# Returns an int64 array (or an object array of Python ints if the entries do not fit in int64),
+# or None if the kernel of M is trivial
+def kernel_vector(M):
+    M_int = integer_rows(M)
+    z = modular_kernel_vector(M_int) if M_int is not None else None
+    if z is None:
+        z = sympy_kernel_vector(M)
+        if z is None:
+            return None
+    if max(abs(a) for a in z) < 2**63:
+        return np.array(z, dtype=np.int64)
+    return np.array(z, dtype=object)
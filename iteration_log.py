@@ -0,0 +1,191 @@
+import json
+import numpy as np
+
+from utils import EPS
+
+# Sinks for the per-iteration records of the steepest-descent scheme.
+# Record 0 describes the first oracle solve, and record i >= 1 describes step i
+# ('obj', 'time', 'step_size', 'step_time', 'bound_changes', 'circuit') followed by
+# the oracle solve for the next direction ('steepness', 'simplex_iters', 'solve_time',
+# 'phase_times', 'sd_time'). The last record of a run may only contain the step.
+# A step is degenerate if its step size is below EPS (the point does not move, only the active set changes).
+
+CIRCUIT_FORMATS = ['none', 'dense', 'sparse']
+
+
+# base sink: keeps running totals of a run, which take constant memory
+class IterationSink():
+
+    # attributes saved in checkpoints by get_state
+    state_keys = ['n_records', 'n_steps', 'n_solves', 'first_simplex_iters', 'total_simplex_iters',
+                  'first_solve_time', 'total_solve_time', 'total_bound_changes', 'last_obj', 'last_circuit',
+                  'n_degenerate_steps', 'degenerate_solve_time']
+
+    def __init__(self):
+        self.n_records = 0
+        self.n_steps = 0
+        self.n_solves = 0
+        self.first_simplex_iters = None
+        self.total_simplex_iters = 0
+        self.first_solve_time = None
+        self.total_solve_time = 0.0
+        self.total_bound_changes = 0
+        self.last_obj = None
+        self.last_circuit = None
+        self.n_degenerate_steps = 0
+        # time of the oracle solves after degenerate steps
+        self.degenerate_solve_time = 0.0
+
+    def write(self, record):
+        self.n_records += 1
+        if 'step_size' in record:
+            self.n_steps += 1
+            self.total_bound_changes += record.get('bound_changes') or 0
+            self.last_circuit = record.get('circuit')
+            if record['step_size'] < EPS:
+                self.n_degenerate_steps += 1
+                self.degenerate_solve_time += record.get('solve_time', 0.0)
+        if 'simplex_iters' in record:
+            if self.n_solves == 0:
+                self.first_simplex_iters = record['simplex_iters']
+                self.first_solve_time = record['solve_time']
+            self.n_solves += 1
+            self.total_simplex_iters += record['simplex_iters']
+            self.total_solve_time += record['solve_time']
+        self.last_obj = record.get('obj', self.last_obj)
+
+    def stats(self):
+        return {'n_steps': self.n_steps,
+                'n_solves': self.n_solves,
+                'first_simplex_iters': self.first_simplex_iters,
+                'total_simplex_iters': self.total_simplex_iters,
+                'first_solve_time': self.first_solve_time,
+                'total_solve_time': self.total_solve_time,
+                'total_bound_changes': self.total_bound_changes,
+                'n_degenerate_steps': self.n_degenerate_steps,
+                'degenerate_solve_time': self.degenerate_solve_time,
+                'last_obj': self.last_obj}
+
+    # keyword arguments for the result object of the run
+    def result_fields(self):
+        circuits = [self.last_circuit] if self.last_circuit is not None else []
+        return {'circuits': circuits, 'stats': self.stats()}
+
+    def close(self):
+        pass
+
+    # everything accumulated so far, so that a resumed run can continue the totals
+    def get_state(self):
+        return {key: getattr(self, key) for key in self.state_keys}
+
+    def set_state(self, state):
+        for key, value in state.items():
+            setattr(self, key, value)
+
+
+# keeps every record in memory, as lists with the layout used by result objects. The circuits take O(n)
+# memory per step, so only the last one is kept unless keep_circuits is True
+class MemorySink(IterationSink):
+
+    state_keys = IterationSink.state_keys + ['fields']
+    def __init__(self, keep_circuits=False):
+        super(MemorySink, self).__init__()
+        self.keep_circuits = keep_circuits
+        self.fields = {}
+
+    def write(self, record):
+        super(MemorySink, self).write(record)
+        for key, value in record.items():
+            if key == 'circuit' and not self.keep_circuits:
+                continue
+            self.fields.setdefault(key, []).append(value)
+
+    def result_fields(self):
+        get = lambda key: self.fields.get(key, [])
+        sub_times = {'sd': get('sd_time'), 'step': get('step_time'),
+                     'solve': get('solve_time'), 'phase_times': get('phase_times')}
+        circuits = get('circuit') if self.keep_circuits else super(MemorySink, self).result_fields()['circuits']
+        return {'iter_times': get('time'), 'circuits': circuits, 'steps': get('step_size'),
+                'simplex_iters': get('simplex_iters'), 'solve_times': get('solve_time'),
+                'sub_times': sub_times, 'obj_values': get('obj'), 'bound_changes': get('bound_changes'),
+                'stats': self.stats()}
+
+
+# streams every record to disk as a line of json, and the circuits (if circuit_format is
+# 'dense' or 'sparse') to a binary file fn + '.circuits'. Only running totals stay in memory.
+# If append is True, records are added to the end of existing files (used when resuming a run)
+class FileSink(IterationSink):
+    def __init__(self, fn, circuit_format='none', append=False):
+        super(FileSink, self).__init__()
+        assert circuit_format in CIRCUIT_FORMATS, 'Unknown circuit format: {}'.format(circuit_format)
+        self.fn = fn
+        self.circuit_format = circuit_format
+        self.f = open(fn, 'a' if append else 'w')
+        self.circuit_f = open(fn + '.circuits', 'ab' if append else 'wb') if circuit_format != 'none' else None
+
+    def write(self, record):
+        super(FileSink, self).write(record)
+        record = dict(record)
+        circuit = record.pop('circuit', None)
+        if circuit is not None and self.circuit_f is not None:
+            self.write_circuit(record['iteration'], np.asarray(circuit, dtype=float))
+        self.f.write(json.dumps(record, default=_to_json) + '\n')
+        self.f.flush()
+
+    # each circuit is written as (iteration, number of entries) followed by the entries;
+    # sparse circuits store the indices (int32) and values (float64) of their nonzeros
+    def write_circuit(self, iteration, circuit):
+        if self.circuit_format == 'sparse':
+            inds = np.flatnonzero(circuit)
+            np.array([iteration, len(inds)], dtype=np.int64).tofile(self.circuit_f)
+            inds.astype(np.int32).tofile(self.circuit_f)
+            circuit[inds].tofile(self.circuit_f)
+        else:
+            np.array([iteration, len(circuit)], dtype=np.int64).tofile(self.circuit_f)
+            circuit.tofile(self.circuit_f)
+        self.circuit_f.flush()
+
+    def result_fields(self):
+        fields = super(FileSink, self).result_fields()
+        fields['log_fn'] = self.fn
+        return fields
+
+    def close(self):
+        self.f.close()
+        if self.circuit_f is not None:
+            self.circuit_f.close()
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError('Cannot serialize {}'.format(type(value)))
+
+
+# load a log written by FileSink as a dict of lists (one entry per record containing the key)
+def load_iteration_log(fn):
+    fields = {}
+    with open(fn, 'r') as f:
+        for line in f:
+            for key, value in json.loads(line).items():
+                fields.setdefault(key, []).append(value)
+    return fields
+
+
+# iterate over the (iteration, circuit) pairs saved by FileSink, where n is the problem dimension
+def load_circuits(fn, n, circuit_format='sparse'):
+    with open(fn + '.circuits', 'rb') as f:
+        while True:
+            header = np.fromfile(f, dtype=np.int64, count=2)
+            if len(header) < 2:
+                return
+            iteration, length = int(header[0]), int(header[1])
+            if circuit_format == 'sparse':
+                inds = np.fromfile(f, dtype=np.int32, count=length)
+                circuit = np.zeros(n)
+                circuit[inds] = np.fromfile(f, dtype=np.float64, count=length)
+            else:
+                circuit = np.fromfile(f, dtype=np.float64, count=length)
+            yield iteration, circuit
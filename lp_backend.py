@@ -0,0 +1,430 @@
+import time
+import contextlib
+import numpy as np
+import scipy.sparse as sp
+
+from utils import METHODS, HIGHS_METHODS, INF
+
+try:
+    import gurobipy as gp
+except ImportError:
+    gp = None
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+
+# solve statuses reported by the backends
+OPTIMAL = 'optimal'
+INFEASIBLE = 'infeasible'
+UNBOUNDED = 'unbounded'
+OTHER = 'other'
+
+
+# Interface for the linear programming solvers used by Polyhedron and PolyhedralModel.
+# Models are built in matrix form, and variables/constraints are referred to
+# by their (0-based) index in the order they were added to the model.
+class LPBackend():
+
+    # True if optimize() calls the given callback during simplex iterations
+    supports_callbacks = False
+
+    # add variables with the given bounds and return their indices
+    def add_variables(self, lb, ub):
+        raise NotImplementedError
+
+    # add constraints M x (sense) rhs over the variables var_inds (default is all variables),
+    # where sense is one of '=', '<', '>'; returns the indices of the new constraints
+    def add_constraints(self, M, sense, rhs, var_inds=None):
+        raise NotImplementedError
+
+    # set a linear objective over the variables var_inds (all other variables get cost 0)
+    def set_objective(self, c, var_inds=None):
+        raise NotImplementedError
+
+    # change the lower and/or upper bounds of the given variables in one batch
+    def set_bounds(self, var_inds, lb=None, ub=None):
+        raise NotImplementedError
+
+    # change the coefficients of the variable var_ind in the given constraints
+    def set_coefficients(self, constr_inds, var_ind, values):
+        raise NotImplementedError
+
+    # change the coefficients of the given variables in the constraint constr_ind
+    def set_row_coefficients(self, constr_ind, var_inds, values):
+        raise NotImplementedError
+
+    def set_method(self, method):
+        raise NotImplementedError
+
+    def set_verbose(self, verbose):
+        raise NotImplementedError
+
+    def set_threads(self, threads):
+        raise NotImplementedError
+
+    # solve the model, warm starting from the previous solve if possible.
+    # If supported, callback(query) is called during simplex iterations, where query(name)
+    # returns the current value of 'obj', 'iter_count' or 'dual_inf'
+    def optimize(self, callback=None):
+        raise NotImplementedError
+
+    @property
+    def status(self):
+        raise NotImplementedError
+
+    # values of the given variables (default is all variables) in the last solution
+    def get_values(self, var_inds=None):
+        raise NotImplementedError
+
+    # dual values of the given constraints (default is all constraints) in the last solution
+    def get_duals(self, constr_inds=None):
+        raise NotImplementedError
+
+    @property
+    def obj_val(self):
+        raise NotImplementedError
+
+    @property
+    def iter_count(self):
+        raise NotImplementedError
+
+    @property
+    def runtime(self):
+        raise NotImplementedError
+
+    # return the current basis as a pair of integer arrays (variables, constraints)
+    def get_basis(self):
+        raise NotImplementedError
+
+    # set a basis previously returned by get_basis of the same kind of backend
+    def set_basis(self, vbasis, cbasis):
+        raise NotImplementedError
+
+    # warm start the next solve from a primal point of the variables var_inds (other variables start
+    # at 0); the solver pushes the point to a basis (crossover) instead of solving the model from scratch
+    def set_start(self, values, var_inds=None):
+        raise NotImplementedError
+
+    # discard the solution and basis information of the model
+    def reset(self):
+        raise NotImplementedError
+
+
+class GurobiBackend(LPBackend):
+
+    supports_callbacks = True
+
+    def __init__(self, verbose=False):
+        if gp is None:
+            raise ImportError('The gurobi backend requires gurobipy')
+        self.model = gp.Model()
+        self.vars = []
+        self.constrs = []
+        self.pushed_start = False
+        # Method and LPWarmStart before a pushed start, restored after its solve
+        self.saved_params = None
+        self.method = None
+        self.set_verbose(verbose)
+
+    def _var_list(self, var_inds):
+        if var_inds is None:
+            return self.vars
+        return [self.vars[j] for j in var_inds]
+
+    def add_variables(self, lb, ub):
+        mvar = self.model.addMVar(len(lb), lb=np.asarray(lb, dtype=float), ub=np.asarray(ub, dtype=float))
+        start = len(self.vars)
+        self.vars.extend(mvar.tolist())
+        return np.arange(start, len(self.vars))
+
+    def add_constraints(self, M, sense, rhs, var_inds=None):
+        x = gp.MVar.fromlist(self._var_list(var_inds))
+        mconstr = self.model.addMConstr(M, x, sense, np.asarray(rhs, dtype=float))
+        start = len(self.constrs)
+        self.constrs.extend(mconstr.tolist())
+        return np.arange(start, len(self.constrs))
+
+    def set_objective(self, c, var_inds=None):
+        obj = np.zeros(len(self.vars))
+        obj[slice(None) if var_inds is None else var_inds] = c
+        self.model.setAttr('Obj', self.vars, obj.tolist())
+
+    def set_bounds(self, var_inds, lb=None, ub=None):
+        var_list = self._var_list(var_inds)
+        if lb is not None:
+            self.model.setAttr('LB', var_list, np.broadcast_to(lb, len(var_list)).tolist())
+        if ub is not None:
+            self.model.setAttr('UB', var_list, np.broadcast_to(ub, len(var_list)).tolist())
+
+    def set_coefficients(self, constr_inds, var_ind, values):
+        self.model.update()
+        var = self.vars[var_ind]
+        for i, value in zip(constr_inds, values):
+            self.model.chgCoeff(self.constrs[i], var, float(value))
+
+    def set_row_coefficients(self, constr_ind, var_inds, values):
+        self.model.update()
+        constr = self.constrs[constr_ind]
+        for j, value in zip(var_inds, values):
+            self.model.chgCoeff(constr, self.vars[j], float(value))
+
+    # while a pushed start is pending (see set_start), the method is used from the solve after it
+    def set_method(self, method):
+        self.method = method
+        if self.pushed_start:
+            self.saved_params = (METHODS[method], self.saved_params[1])
+            return
+        with contextlib.redirect_stdout(None):
+            self.model.Params.Method = METHODS[method]
+
+    def set_verbose(self, verbose):
+        flag = 1 if verbose else 0
+        with contextlib.redirect_stdout(None):
+            self.model.setParam(gp.GRB.Param.OutputFlag, flag)
+
+    def set_threads(self, threads):
+        with contextlib.redirect_stdout(None):
+            self.model.Params.Threads = threads
+
+    def optimize(self, callback=None):
+        try:
+            self._optimize(callback)
+        finally:
+            # later solves warm start from the basis of this one with the method selected before the push
+            if self.pushed_start:
+                with contextlib.redirect_stdout(None):
+                    self.model.Params.Method, self.model.Params.LPWarmStart = self.saved_params
+                self.pushed_start = False
+
+    def _optimize(self, callback=None):
+        if callback is None:
+            self.model.optimize()
+            return
+        codes = {'obj': gp.GRB.Callback.SPX_OBJVAL,
+                 'iter_count': gp.GRB.Callback.SPX_ITRCNT,
+                 'dual_inf': gp.GRB.Callback.SPX_DUALINF}
+        def simplex_callback(model, where):
+            if where == gp.GRB.Callback.SIMPLEX:
+                callback(lambda name: model.cbGet(codes[name]))
+        self.model.optimize(simplex_callback)
+
+    @property
+    def status(self):
+        statuses = {gp.GRB.Status.OPTIMAL: OPTIMAL,
+                    gp.GRB.Status.INFEASIBLE: INFEASIBLE,
+                    gp.GRB.Status.UNBOUNDED: UNBOUNDED}
+        return statuses.get(self.model.status, OTHER)
+
+    def get_values(self, var_inds=None):
+        return np.asarray(self.model.getAttr('X', self._var_list(var_inds)))
+
+    def get_duals(self, constr_inds=None):
+        constrs = self.constrs if constr_inds is None else [self.constrs[i] for i in constr_inds]
+        return np.asarray(self.model.getAttr('Pi', constrs))
+
+    @property
+    def obj_val(self):
+        return self.model.ObjVal
+
+    @property
+    def iter_count(self):
+        return self.model.IterCount
+
+    @property
+    def runtime(self):
+        return self.model.Runtime
+
+    def get_basis(self):
+        return (np.asarray(self.model.getAttr('VBasis', self.vars), dtype=int),
+                np.asarray(self.model.getAttr('CBasis', self.constrs), dtype=int))
+
+    def set_basis(self, vbasis, cbasis):
+        self.model.update()
+        self.model.setAttr('VBasis', self.vars, [int(v) for v in vbasis])
+        self.model.setAttr('CBasis', self.constrs, [int(v) for v in cbasis])
+
+    # the start point is pushed to a basis of the presolved model (LPWarmStart=2), which gurobi
+    # only does with primal simplex, so the next solve uses primal simplex whatever the method.
+    # Method and LPWarmStart are restored after that solve
+    def set_start(self, values, var_inds=None):
+        self.model.update()
+        start = np.zeros(len(self.vars))
+        start[slice(None) if var_inds is None else var_inds] = values
+        self.model.setAttr('PStart', self.vars, start.tolist())
+        with contextlib.redirect_stdout(None):
+            if not self.pushed_start:
+                self.saved_params = (self.model.Params.Method, self.model.Params.LPWarmStart)
+            self.model.Params.LPWarmStart = 2
+            self.model.Params.Method = METHODS['primal_simplex']
+        self.pushed_start = True
+
+    def reset(self):
+        self.model.reset()
+
+
+class HighsBackend(LPBackend):
+
+    def __init__(self, verbose=False):
+        if highspy is None:
+            raise ImportError('The highs backend requires highspy')
+        self.highs = highspy.Highs()
+        self.lb = np.zeros(0)
+        self.ub = np.zeros(0)
+        self.n_constrs = 0
+        self._runtime = 0.0
+        self.start = None
+        self.set_verbose(verbose)
+
+    @property
+    def n_vars(self):
+        return len(self.lb)
+
+    # map the INF value used by the rest of the code to the HiGHS infinity
+    def _to_highs(self, values):
+        values = np.array(values, dtype=float)
+        values[values >= INF] = highspy.kHighsInf
+        values[values <= -INF] = -highspy.kHighsInf
+        return values
+
+    def add_variables(self, lb, ub):
+        k = len(lb)
+        lb = self._to_highs(lb)
+        ub = self._to_highs(ub)
+        empty_int = np.zeros(0, dtype=np.int32)
+        self.highs.addCols(k, np.zeros(k), lb, ub, 0, empty_int, empty_int, np.zeros(0))
+        start = self.n_vars
+        self.lb = np.concatenate((self.lb, lb))
+        self.ub = np.concatenate((self.ub, ub))
+        return np.arange(start, self.n_vars)
+
+    def add_constraints(self, M, sense, rhs, var_inds=None):
+        M = sp.csr_matrix(M, dtype=float)
+        m = M.shape[0]
+        indices = M.indices if var_inds is None else np.asarray(var_inds)[M.indices]
+        rhs = self._to_highs(np.broadcast_to(rhs, m))
+        lower = rhs if sense in ('=', '>') else np.full(m, -highspy.kHighsInf)
+        upper = rhs if sense in ('=', '<') else np.full(m, highspy.kHighsInf)
+        self.highs.addRows(m, lower, upper, M.nnz, M.indptr[:-1].astype(np.int32),
+                           indices.astype(np.int32), M.data)
+        start = self.n_constrs
+        self.n_constrs += m
+        return np.arange(start, self.n_constrs)
+
+    def set_objective(self, c, var_inds=None):
+        obj = np.zeros(self.n_vars)
+        obj[slice(None) if var_inds is None else var_inds] = c
+        self.highs.changeColsCost(self.n_vars, np.arange(self.n_vars, dtype=np.int32), obj)
+
+    def set_bounds(self, var_inds, lb=None, ub=None):
+        var_inds = np.arange(self.n_vars) if var_inds is None else np.asarray(var_inds, dtype=int)
+        if lb is not None:
+            self.lb[var_inds] = self._to_highs(np.broadcast_to(lb, len(var_inds)))
+        if ub is not None:
+            self.ub[var_inds] = self._to_highs(np.broadcast_to(ub, len(var_inds)))
+        self.highs.changeColsBounds(len(var_inds), var_inds.astype(np.int32),
+                                    self.lb[var_inds], self.ub[var_inds])
+
+    def set_coefficients(self, constr_inds, var_ind, values):
+        for i, value in zip(constr_inds, values):
+            self.highs.changeCoeff(int(i), int(var_ind), float(value))
+
+    def set_row_coefficients(self, constr_ind, var_inds, values):
+        for j, value in zip(var_inds, values):
+            self.highs.changeCoeff(int(constr_ind), int(j), float(value))
+
+    def set_method(self, method):
+        for option, value in HIGHS_METHODS[method].items():
+            self.highs.setOptionValue(option, value)
+
+    def set_verbose(self, verbose):
+        self.highs.setOptionValue('output_flag', bool(verbose))
+
+    def set_threads(self, threads):
+        self.highs.setOptionValue('threads', int(threads))
+
+    # HiGHS does not report simplex progress through its callbacks, so callback is ignored
+    def optimize(self, callback=None):
+        t0 = time.perf_counter()
+        if self.start is not None:
+            self.highs.setSolution(self.start)
+            self.start = None
+        self.highs.run()
+        self._runtime = time.perf_counter() - t0
+
+    @property
+    def status(self):
+        model_status = self.highs.getModelStatus()
+        statuses = {highspy.HighsModelStatus.kOptimal: OPTIMAL,
+                    highspy.HighsModelStatus.kInfeasible: INFEASIBLE,
+                    highspy.HighsModelStatus.kUnbounded: UNBOUNDED}
+        return statuses.get(model_status, OTHER)
+
+    def get_values(self, var_inds=None):
+        values = np.asarray(self.highs.getSolution().col_value)
+        return values if var_inds is None else values[var_inds]
+
+    def get_duals(self, constr_inds=None):
+        duals = np.asarray(self.highs.getSolution().row_dual)
+        return duals if constr_inds is None else duals[constr_inds]
+
+    @property
+    def obj_val(self):
+        return self.highs.getInfo().objective_function_value
+
+    @property
+    def iter_count(self):
+        return self.highs.getInfo().simplex_iteration_count
+
+    @property
+    def runtime(self):
+        return self._runtime
+
+    def get_basis(self):
+        basis = self.highs.getBasis()
+        return (np.array([int(s) for s in basis.col_status], dtype=int),
+                np.array([int(s) for s in basis.row_status], dtype=int))
+
+    def set_basis(self, vbasis, cbasis):
+        basis = highspy.HighsBasis()
+        basis.col_status = [highspy.HighsBasisStatus(int(v)) for v in vbasis]
+        basis.row_status = [highspy.HighsBasisStatus(int(v)) for v in cbasis]
+        basis.valid = True
+        self.highs.setBasis(basis)
+
+    def set_start(self, values, var_inds=None):
+        start = np.zeros(self.n_vars)
+        start[slice(None) if var_inds is None else var_inds] = values
+        solution = highspy.HighsSolution()
+        solution.col_value = start.tolist()
+        solution.value_valid = True
+        # HiGHS drops the solution when the model changes (e.g. its objective), so it is set right before the solve
+        self.start = solution
+
+    def reset(self):
+        self.highs.clearSolver()
+
+
+BACKENDS = {'gurobi': GurobiBackend,
+            'highs': HighsBackend}
+
+# number of threads used by every model created in this process (None keeps the solver default)
+default_threads = None
+
+
+# pin the number of solver threads for all models created afterwards in this process
+def set_default_threads(threads):
+    global default_threads
+    default_threads = threads
+
+
+# create an empty model for the LP solver with the given name
+def make_backend(name='gurobi', verbose=False):
+    if name not in BACKENDS:
+        raise ValueError('Unknown LP backend: {}. Options: {}'.format(name, ', '.join(BACKENDS)))
+    model = BACKENDS[name](verbose=verbose)
+    if default_threads is not None:
+        model.set_threads(default_threads)
+    return model
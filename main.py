@@ -1,72 +1,158 @@
 import time
-import random
 import os
 import numpy as np
 
-from mps_reader_preprocessor import read_mps_preprocess
-from polyhedron import Polyhedron
-from steepest_descent import steepest_descent_augmentation_scheme as sdac
-from partition_polytope import PartitionPolytope
-from spindle import Spindle
+from mps_reader_preprocessor import read_mps_preprocess, add_bound_rows
+from problem_cache import read_mps_cached, generated_instance
+from presolve import presolve as presolve_lp
+from polyhedron import Polyhedron, ANTI_STALLING, PERTURB_TOL
+from steepest_descent import steepest_descent_augmentation_scheme as sdac, load_checkpoint, CROSSOVER_THRESHOLDS
+from partition_polytope import PartitionPolytope, random_partition_instance
+from spindle import Spindle, spindle_facets
+from iteration_log import FileSink
+from profiling import Profiler
+from augmentation_rules import make_rule, AUGMENTATION_RULES
+from results_store import ResultsStore
 
 
 def main(mps_fn='', results_dir='results',
-         max_time=300, sd_method='dual_simplex', reset=False,
+         max_time=300, sd_method='dual_simplex', reset=False, backend='gurobi',
          partition_polytope=False, n=0, k=0,
-         spindle=False, spindle_dim=0, n_cone_facets=0, n_parallel_facets=0):
+         spindle=False, spindle_dim=0, n_cone_facets=0, n_parallel_facets=0, seed=None,
+         stream_log=False, circuit_format='none', checkpoint=False, checkpoint_interval=None, resume=False,
+         profile=False, cprofile=False, trace_memory=False, phase_mode='off', cache=True, presolve=False,
+         bound_rows=False, formulation='auto', normalize_circuits=False, partition_oracle='lp',
+         crossover='off', crossover_threshold=None, rule='steepest', anti_stalling='off', perturb_tol=None,
+         results_db=None):
     
+    postsolve = None
     if mps_fn:
         print('Reading {}...'.format(mps_fn))
-        c, B, d, A, b = read_mps_preprocess(mps_fn)
+        read = read_mps_cached if cache else read_mps_preprocess
+        c, B, d, A, b, lb, ub = read(mps_fn, bound_rows=False)
+        if presolve:
+            print('Presolving...')
+            (c, B, d, A, b, lb, ub), postsolve = presolve_lp(c, B, d, A, b, lb, ub, bound_rows=False)
+        if bound_rows:
+            B, d, A, b = add_bound_rows(B, d, A, b, lb, ub)
+            lb = ub = None
         print('Building polyhedron...')
-        P = Polyhedron(B, d, A, b, c)
+        P = Polyhedron(B, d, A, b, c, backend=backend, lb=lb, ub=ub)
     elif partition_polytope:
         print('Constructing partition polytope with n={} and k={}'.format(n, k))
         # randomly generate cluster size bounds and objective function
-        v1 = np.random.randint(0, n, size=k)
-        v2 = np.random.randint(0, n//k, size=k)
-        ub = [max(v1[i], v2[i]) for i in range(k)]
-        lb = [min(v1[i], v2[i]) for i in range(k)]
-        c = np.random.randint(0, 1000, size=n*k)
-        P = PartitionPolytope(n, k, ub, lb, c)
+        instance = generated_instance('partition_n-{}_k-{}'.format(n, k), seed,
+                                      lambda rng: dict(zip(('ub', 'lb', 'c'), random_partition_instance(n, k, rng))),
+                                      cache=cache)
+        c = instance['c']
+        P = PartitionPolytope(n, k, instance['ub'], instance['lb'], c, backend=backend)
     elif spindle:
         print('Constructing spindle with dimension n={}, with {} cone facets,'
               'and with {} pairs of parallel facets'.format(
               spindle_dim, n_cone_facets, n_parallel_facets))
-        P = Spindle(spindle_dim, n_cone_facets, n_parallel_facets)
+        instance = generated_instance('spindle_n-{}_c-{}_p-{}'.format(spindle_dim, n_cone_facets, n_parallel_facets),
+                                      seed, lambda rng: dict(zip(('B', 'd'), spindle_facets(
+                                          spindle_dim, n_cone_facets, n_parallel_facets, rng))), cache=cache)
+        P = Spindle(spindle_dim, n_cone_facets, n_parallel_facets, backend=backend,
+                    facets=(instance['B'], instance['d']))
         c = P.c
     else:
         raise RuntimeError('Provide arguments for constructing polyhedron.')
     
-    print('Finding feasible solution...')
-    x_feasible = P.find_feasible_solution(verbose=False)
-    if partition_polytope or spindle:
-        print('Building gurobi model for simplex...')
-        P.build_gurobi_model(c=c)
-        P.set_solution(x_feasible)
+    # the result files are named by the problem and the seed and rule of the run
+    if mps_fn:
+        problem = os.path.basename(mps_fn).split('.')[0]
+    elif partition_polytope: 
+        problem = 'n-{}_k-{}'.format(n, k)
+    elif spindle:
+        problem = 'n-{}_c-{}_p-{}'.format(spindle_dim, n_cone_facets, n_parallel_facets)
+    prefix = problem
+    if not mps_fn and seed is not None:
+        prefix += '_s-{}'.format(seed)
+    if rule != 'steepest':
+        prefix += '_r-{}'.format(rule)
+    
+    # checkpoints are saved to results_dir and a resumed run skips the simplex baseline
+    checkpoint_fn = None
+    if (checkpoint or resume) and results_dir:
+        if not os.path.exists(results_dir): os.mkdir(results_dir)
+        checkpoint_fn = os.path.join(results_dir, prefix + '_sd_checkpoint.p')
+    if resume:
+        if checkpoint_fn is None or not os.path.exists(checkpoint_fn):
+            raise RuntimeError('No checkpoint found in results_dir to resume from.')
+        print('Loading checkpoint {}...'.format(checkpoint_fn))
+        sd_checkpoint = load_checkpoint(checkpoint_fn)
+        x_feasible = None
+        lp_result = None
+    else:
+        sd_checkpoint = None
+        print('Finding feasible solution...')
+        x_feasible = P.find_feasible_solution(verbose=False)
+        if partition_polytope or spindle:
+            print('Building LP model for simplex...')
+            P.build_lp_model(c=c)
+            P.set_solution(x_feasible)
+        
+        print('\nSolving with simplex method...')
+        lp_result = P.solve_lp(verbose=False, record_objs=True)
+        if postsolve is not None:
+            postsolve.postsolve_result(lp_result)
+        print('\nSolution using simplex method:')
+        print(lp_result)
+    
+    # stream the steepest-descent iterations to results_dir instead of keeping them in memory
+    sink = None
+    if stream_log and results_dir:
+        if not os.path.exists(results_dir): os.mkdir(results_dir)
+        sink = FileSink(os.path.join(results_dir, prefix + '_sd_log.jsonl'), circuit_format=circuit_format,
+                        append=resume)
     
-    print('\nSolving with simplex method...')
-    lp_result = P.solve_lp(verbose=False, record_objs=True)
-    print('\nSolution using simplex method:')
-    print(lp_result)
+    profiler = Profiler(cprofile=cprofile, trace_memory=trace_memory) if profile or cprofile or trace_memory else None
+    # the exchange oracle replaces the circuit model for partition polytopes
+    pm = None
+    if partition_polytope and partition_oracle == 'exchange':
+        pm = P.build_exchange_oracle()
     
     print('\nSolving with steepest descent...')
-    sd_result = sdac(P, x_feasible, c=c, method=sd_method, max_time=max_time, reset=reset)
+    sd_result = sdac(P, x_feasible, c=c, method=sd_method, max_time=max_time, reset=reset, sink=sink,
+                     checkpoint_fn=checkpoint_fn, checkpoint_interval=checkpoint_interval, resume=sd_checkpoint,
+                     profiler=profiler, phase_mode=phase_mode, pm=pm,
+                     primal={'auto': 'auto', 'primal': True, 'dual': False}[formulation],
+                     normalize_circuits=normalize_circuits, crossover=crossover,
+                     crossover_threshold=crossover_threshold, rule=make_rule(rule, np.random.default_rng(seed)),
+                     anti_stalling=anti_stalling, perturb_tol=perturb_tol)
+    if postsolve is not None:
+        postsolve.postsolve_result(sd_result)
     print('\nSolution for {} using steepest-descent augmentation:'.format(os.path.basename(mps_fn)))
     print(sd_result)
+    if profiler is not None:
+        print('\nTime per iteration section:')
+        print(profiler.summary())
     
     if results_dir:
         if not os.path.exists(results_dir): os.mkdir(results_dir)
-        if mps_fn:
-            prefix = os.path.basename(mps_fn).split('.')[0]
-        elif partition_polytope: 
-            prefix = 'n-{}_k-{}'.format(n, k)
-        elif spindle:
-            prefix = 'n-{}_c-{}_p-{}'.format(spindle_dim, n_cone_facets, n_parallel_facets)
         lp_fn = os.path.join(results_dir, prefix + '_lp.p')
         sd_fn = os.path.join(results_dir, prefix + '_sd.p')
-        lp_result.save(lp_fn)
+        if lp_result is not None:
+            lp_result.save(lp_fn)
         sd_result.save(sd_fn)
+        if profiler is not None:
+            with open(os.path.join(results_dir, prefix + '_sd_profile.txt'), 'w') as f:
+                f.write(profiler.summary())
+    
+    # append both runs (and their iterations) to the results database
+    if results_db:
+        store = ResultsStore(results_db)
+        params = {'problem': problem, 'backend': backend, 'presolve': presolve,
+                  'seed': None if mps_fn else seed}
+        if lp_result is not None:
+            store.add_run(lp_result, source=os.path.abspath(lp_fn) if results_dir else None, **params)
+        store.add_run(sd_result, source=os.path.abspath(sd_fn) if results_dir else None, sd_method=sd_method,
+                      rule=rule, anti_stalling=anti_stalling, formulation=formulation, crossover=crossover,
+                      reset=reset, max_time=max_time, **params)
+        store.close()
+        
+    return P, lp_result, sd_result
 
 
 if __name__ == "__main__":   
@@ -76,21 +162,77 @@ if __name__ == "__main__":
     parser.add_argument('--mps_fn', help='mps filename for problem to solve', default='')
     parser.add_argument('--sd_method', help='algorithm for computing s.d. directions', type=str, default='dual_simplex')
     parser.add_argument('--reset', help='reset polyhedral model at each iteration (no warm starts)', action='store_true')
+    parser.add_argument('--backend', help='LP solver used for all models (gurobi or highs)', type=str, default='gurobi')
     
     parser.add_argument('--partition-polytope', help='use bounded/fixed-size partition polytope', action='store_true')
     parser.add_argument('--n', help='num items for partition polytope', type=int, default=0)
     parser.add_argument('--k', help='num clusters for partition polytope', type=int, default=0)
+    parser.add_argument('--partition_oracle', help='s.d. direction oracle for partition polytope: the circuit model (lp) '
+                                                   'or minimum mean cycles of the cluster exchange graph (exchange)',
+                        choices=['lp', 'exchange'], default='lp')
     
     parser.add_argument('--spindle', help='use a spindle', action='store_true')
     parser.add_argument('--spindle_dim', help='dimension of spindle', type=int, default=0)
     parser.add_argument('--n_cone_facets', help='number of facets per cone of the spindle', type=int, default=0)
     parser.add_argument('--n_parallel_facets', help='number of pairs of parallel facet in spindle', type=int, default=0)
+    parser.add_argument('--seed', help='seed of the random partition polytope or spindle (cached by parameters and seed)',
+                        type=int, default=None)
     
     parser.add_argument('--results_dir', help='directory for saving results', default='results')
-    parser.add_argument('--max_time', help='max time for steepest descent algorithm in seconds', default=300)
+    parser.add_argument('--max_time', help='max time for steepest descent algorithm in seconds', type=float, default=300)
+    parser.add_argument('--stream_log', help='stream s.d. iterations to results_dir/<problem>_sd_log.jsonl '
+                                             'instead of keeping them in memory', action='store_true')
+    parser.add_argument('--circuit_format', help='how to save circuits in the streamed log', 
+                        choices=['none', 'dense', 'sparse'], default='none')
+    parser.add_argument('--normalize_circuits', help='record the circuits as primitive integer vectors',
+                        action='store_true')
+    parser.add_argument('--checkpoint', help='save a checkpoint to results_dir when max_time is reached', action='store_true')
+    parser.add_argument('--checkpoint_interval', help='also save a checkpoint every this many seconds', type=float,
+                        default=None)
+    parser.add_argument('--resume', help='continue the s.d. run from the checkpoint in results_dir', action='store_true')
+    parser.add_argument('--profile', help='print and save the time spent in each section of the s.d. iterations',
+                        action='store_true')
+    parser.add_argument('--cprofile', help='also profile the s.d. iterations with cProfile', action='store_true')
+    parser.add_argument('--presolve', help='run steepest descent on the presolved problem (MPS files only)',
+                        action='store_true')
+    parser.add_argument('--bound_rows', help='add the variable bounds of the MPS file as rows of B instead of handling '
+                                             'them per variable', action='store_true')
+    parser.add_argument('--no_cache', help='parse the MPS file (or generate the random instance) instead of loading it '
+                                           'from the problem cache',
+                        action='store_true')
+    parser.add_argument('--phase_mode', help='measure the simplex phase times of the s.d. oracle with a solver callback',
+                        choices=['off', 'sampled', 'full'], default='off')
+    parser.add_argument('--formulation', help='circuit model solved at each iteration (auto chooses by problem shape)',
+                        choices=['auto', 'primal', 'dual'], default='auto')
+    parser.add_argument('--crossover', help='hybrid mode: switch from steepest descent to the simplex method when '
+                                            'this trigger fires', choices=['off'] + list(CROSSOVER_THRESHOLDS),
+                        default='off')
+    parser.add_argument('--crossover_threshold', help='threshold of the crossover trigger (default depends on the '
+                                                      'trigger)', type=float, default=None)
+    parser.add_argument('--rule', help='circuit augmentation rule: the norm of the circuits chosen at each iteration '
+                                       '(random is seeded by --seed)', choices=list(AUGMENTATION_RULES),
+                        default='steepest')
+    parser.add_argument('--anti_stalling', help='anti-stalling mode against runs of degenerate and tiny steps: perturb '
+                                                'shifts the right hand sides of near-tight constraints and cleans up '
+                                                'with simplex', choices=ANTI_STALLING, default='off')
+    parser.add_argument('--perturb_tol', help='slack up to which constraints are made tight by the perturb mode '
+                                              '(default is {})'.format(PERTURB_TOL), type=float, default=None)
+    parser.add_argument('--results_db', help='also append the runs and their iterations to this SQLite results '
+                                             'database (see results_store.py)', default=None)
+    parser.add_argument('--trace_memory', help='also report the peak memory traced by tracemalloc', action='store_true')
 
     args = parser.parse_args()
     
     main(mps_fn=args.mps_fn, results_dir=args.results_dir, max_time=args.max_time, 
-         sd_method=args.sd_method, reset=args.reset,
-         partition_polytope=args.partition_polytope, n=args.n, k=args.k)
\ No newline at end of file
+         sd_method=args.sd_method, reset=args.reset, backend=args.backend,
+         partition_polytope=args.partition_polytope, n=args.n, k=args.k, partition_oracle=args.partition_oracle,
+         spindle=args.spindle, spindle_dim=args.spindle_dim, n_cone_facets=args.n_cone_facets,
+         n_parallel_facets=args.n_parallel_facets, seed=args.seed,
+         stream_log=args.stream_log, circuit_format=args.circuit_format,
+         normalize_circuits=args.normalize_circuits, checkpoint=args.checkpoint or args.checkpoint_interval is not None,
+         checkpoint_interval=args.checkpoint_interval, resume=args.resume,
+         profile=args.profile, cprofile=args.cprofile, trace_memory=args.trace_memory,
+         phase_mode=args.phase_mode, cache=not args.no_cache,
+         bound_rows=args.bound_rows, presolve=args.presolve, formulation=args.formulation,
+         crossover=args.crossover, crossover_threshold=args.crossover_threshold, rule=args.rule,
+         anti_stalling=args.anti_stalling, perturb_tol=args.perturb_tol, results_db=args.results_db)
\ No newline at end of file
@@ -1,39 +1,210 @@
-#source: https://github.com/sschnug/scipy_lp_dev
+from array import array
 import numpy as np
-from cvxopt.base import matrix, spmatrix
-from cvxopt.modeling import op
-
-
-def read_mps_preprocess(filepath):
-    problem = op()
-    problem.fromfile(filepath)
-    mat_form = problem._inmatrixform(format='dense')
-    format = 'dense'
-    assert mat_form
-    lp, vmap, mmap = mat_form
-
-    variables = lp.variables()
-    x = variables[0]
-    c = lp.objective._linear._coeff[x]
-    inequalities = lp._inequalities
-    G = inequalities[0]._f._linear._coeff[x]
-    h = -inequalities[0]._f._constant
-    equalities = lp._equalities
-    A, b = None, None
-    if equalities:
-        A = equalities[0]._f._linear._coeff[x]
-        b = -equalities[0]._f._constant
-    elif format == 'dense':
-        A = matrix(0.0, (0,len(x)))
-        b = matrix(0.0, (0,1))
-    else:
-        A = spmatrix(0.0, [], [],  (0,len(x)))  # CRITICAL
-        b = matrix(0.0, (0,1))
-
-    c = np.array(c).flatten()
-    G = np.array(G)
-    h = np.array(h).flatten()
-    A = np.array(A)
-    b = np.array(b).flatten()
-
-    return c, G, h, A, b
\ No newline at end of file
+import scipy.sparse as sp
+
+
+# reads a fixed-format MPS file and returns the linear program
+#   min c^T x  s.t.  Bx <= d,  Ax = b
+# with B and A as scipy CSR matrices (or dense numpy arrays if format='dense').
+# Variable bounds are returned as rows of B (and fixed variables as rows of A) and ranges are split
+# into two rows, following the conventions of cvxopt's op.fromfile. With bound_rows=False the bounds
+# are returned as vectors instead, as (c, B, d, A, b, lb, ub) with infinite entries for missing bounds.
+# The file is streamed line by line, and only the nonzeros of the
+# constraint matrix are stored, so memory and time scale with nnz rather than m*n.
+def read_mps_preprocess(filepath, format='sparse', bound_rows=True):
+    assert format in ('sparse', 'dense'), 'Unknown matrix format: {}'.format(format)
+
+    row_types = {}      # {row label: 'E', 'L' or 'G'}
+    row_index = {}      # {row label: row number}
+    obj_label = None
+    col_index = {}      # {column label: column number}
+    c_entries = {}
+
+    # constraint matrix in coordinate form
+    rows = array('l')
+    cols = array('l')
+    vals = array('d')
+
+    rhs = {}
+    ranges = {}
+    bounds = {}         # {column number: [lower bound, upper bound]}
+    rhs_label = range_label = bound_label = None
+
+    section = None
+    with open(filepath, 'r') as f:
+        for s in f:
+            if not s.strip() or s[0] == '*':
+                continue
+            if s[0] != ' ':
+                section = s.split()[0]
+                if section == 'ENDATA':
+                    break
+                continue
+
+            if section == 'ROWS':
+                row_type = s[1:3].strip()
+                label = s[4:12].strip()
+                if row_type in ('E', 'L', 'G'):
+                    row_index[label] = len(row_types)
+                    row_types[label] = row_type
+                elif row_type == 'N':
+                    # first occurrence of 'N' is the objective
+                    if obj_label is None:
+                        obj_label = label
+                else:
+                    raise ValueError("unknown row type '{}'".format(row_type))
+
+            elif section == 'COLUMNS':
+                if s[4:12].strip():
+                    col_label = s[4:12].strip()
+                    if col_label not in col_index:
+                        col_index[col_label] = len(col_index)
+                j = col_index[col_label]
+                for label, value in ((s[14:22].strip(), s[24:36]), (s[39:47].strip(), s[49:61])):
+                    if not label:
+                        continue
+                    if label == obj_label:
+                        c_entries[j] = float(value)
+                    elif label in row_index:
+                        rows.append(row_index[label])
+                        cols.append(j)
+                        vals.append(float(value))
+                    else:
+                        raise KeyError("no row label '{}'".format(label))
+
+            elif section in ('RHS', 'RANGES'):
+                # only the first rhs/range vector encountered is used
+                label = s[4:12].strip()
+                if section == 'RHS':
+                    if rhs_label is None:
+                        rhs_label = label
+                    if label != rhs_label:
+                        continue
+                    target = rhs
+                else:
+                    if range_label is None:
+                        range_label = label
+                    if label != range_label:
+                        continue
+                    target = ranges
+                for row_label, value in ((s[14:22].strip(), s[24:36]), (s[39:47].strip(), s[49:61])):
+                    if not row_label:
+                        continue
+                    if row_label in row_index:
+                        target[row_label] = float(value)
+                    elif row_label != obj_label or section == 'RANGES':
+                        raise KeyError("no row label '{}'".format(row_label))
+
+            elif section == 'BOUNDS':
+                label = s[4:12].strip()
+                if bound_label is None:
+                    bound_label = label
+                if label != bound_label:
+                    continue
+                bound_type = s[1:3].strip()
+                col_label = s[14:22].strip()
+                if col_label not in col_index:
+                    raise ValueError("unknown column label '{}'".format(col_label))
+                bnds = bounds.setdefault(col_index[col_label], [0.0, None])
+                if bound_type == 'LO':
+                    bnds[0] = float(s[24:36])
+                elif bound_type == 'UP':
+                    bnds[1] = float(s[24:36])
+                elif bound_type == 'FX':
+                    bnds[0] = bnds[1] = float(s[24:36])
+                elif bound_type == 'FR':
+                    bnds[0] = bnds[1] = None
+                elif bound_type == 'MI':
+                    bnds[0] = None
+                elif bound_type != 'PL':
+                    raise ValueError("unknown bound type '{}'".format(bound_type))
+
+    n = len(col_index)
+    c = np.zeros(n)
+    for j, value in c_entries.items():
+        c[j] = value
+    M = sp.csr_matrix((np.frombuffer(vals), (np.frombuffer(rows, dtype=np.int64), np.frombuffer(cols, dtype=np.int64))),
+                      shape=(len(row_types), n))
+    M.sum_duplicates()
+
+    # sort each row into inequality rows of B (with sign) and equality rows of A
+    B_rows, B_signs, d = [], [], []
+    A_rows, b = [], []
+    for label, row_type in row_types.items():
+        i = row_index[label]
+        rhs_i = rhs.get(label, 0.0)
+        r = ranges.get(label)
+        if row_type == 'L':
+            B_rows.append(i); B_signs.append(1.0); d.append(rhs_i)
+            if r is not None:
+                B_rows.append(i); B_signs.append(-1.0); d.append(-(rhs_i - abs(r)))
+        elif row_type == 'G':
+            B_rows.append(i); B_signs.append(-1.0); d.append(-rhs_i)
+            if r is not None:
+                B_rows.append(i); B_signs.append(1.0); d.append(rhs_i + abs(r))
+        elif r is None or r == 0.0:
+            A_rows.append(i); b.append(rhs_i)
+        elif r > 0.0:
+            B_rows.append(i); B_signs.append(-1.0); d.append(-rhs_i)
+            B_rows.append(i); B_signs.append(1.0); d.append(rhs_i + r)
+        else:
+            B_rows.append(i); B_signs.append(1.0); d.append(rhs_i)
+            B_rows.append(i); B_signs.append(-1.0); d.append(-(rhs_i + r))
+
+    # remove constraints with no variables
+    row_nnz = np.diff(M.indptr)
+    keep_B = [k for k, i in enumerate(B_rows) if row_nnz[i] > 0]
+    keep_A = [k for k, i in enumerate(A_rows) if row_nnz[i] > 0]
+    for k in set(range(len(B_rows))) - set(keep_B):
+        if d[k] < 0.0:
+            raise ValueError('inequality constraint has no variables and a negative righthand side')
+    for k in set(range(len(A_rows))) - set(keep_A):
+        if b[k] != 0.0:
+            raise ValueError('equality constraint has no variables and a nonzero righthand side')
+    B_rows = [B_rows[k] for k in keep_B]
+    B_signs = [B_signs[k] for k in keep_B]
+    d = [d[k] for k in keep_B]
+    A_rows = [A_rows[k] for k in keep_A]
+    b = [b[k] for k in keep_A]
+
+    # variable bounds (default bounds are 0 <= x < inf)
+    lb, ub = np.zeros(n), np.full(n, np.inf)
+    for j, (lb_j, ub_j) in bounds.items():
+        lb[j] = lb_j if lb_j is not None else -np.inf
+        ub[j] = ub_j if ub_j is not None else np.inf
+
+    B = sp.diags(B_signs, format='csr', shape=(len(B_rows), len(B_rows))).dot(M[B_rows])
+    A = M[A_rows]
+    d = np.asarray(d, dtype=float)
+    b = np.asarray(b, dtype=float)
+    if bound_rows:
+        B, d, A, b = add_bound_rows(B, d, A, b, lb, ub)
+
+    if format == 'dense':
+        B = B.toarray()
+        A = A.toarray()
+    if bound_rows:
+        return c, B, d, A, b
+    return c, B, d, A, b, lb, ub
+
+
+# add the variable bounds lb <= x <= ub to B (one row per finite bound, the lower bound of each
+# variable first) and fixed variables (lb == ub) to A, in the order used by read_mps_preprocess
+def add_bound_rows(B, d, A, b, lb, ub):
+    n = len(lb)
+    fixed = np.flatnonzero(np.isfinite(lb) & (lb == ub))
+    is_fixed = np.zeros(n, dtype=bool)
+    is_fixed[fixed] = True
+    has_lb = np.flatnonzero(np.isfinite(lb) & ~is_fixed)
+    has_ub = np.flatnonzero(np.isfinite(ub) & ~is_fixed)
+    cols = np.concatenate((has_lb, has_ub))
+    order = np.lexsort((np.repeat([0, 1], [len(has_lb), len(has_ub)]), cols))
+    cols = cols[order]
+    signs = np.concatenate((-np.ones(len(has_lb)), np.ones(len(has_ub))))[order]
+    rhs = np.concatenate((-lb[has_lb], ub[has_ub]))[order]
+
+    B = sp.vstack([sp.csr_matrix(B), sp.csr_matrix((signs, (np.arange(len(cols)), cols)), shape=(len(cols), n))],
+                  format='csr')
+    A = sp.vstack([sp.csr_matrix(A), sp.csr_matrix((np.ones(len(fixed)), (np.arange(len(fixed)), fixed)),
+                                                   shape=(len(fixed), n))], format='csr')
+    return B, np.concatenate((d, rhs)), A, np.concatenate((b, lb[fixed]))
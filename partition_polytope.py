@@ -1,4 +1,6 @@
+import time
 import numpy as np
+import scipy.sparse as sp
 from utils import EPS
 
 from polyhedron import Polyhedron
@@ -7,68 +9,53 @@ from polyhedron import Polyhedron
 # n is number of items,  k is the number of clusters,
 # ub are cluster size upper bounds, and lb are cluster size lower bounds
 class PartitionPolytope(Polyhedron):
-    def __init__(self, n_items, k, ub, lb, c=None):
+    def __init__(self, n_items, k, ub, lb, c=None, backend='gurobi'):
         assert len(ub) == k and len(lb) == k, 'Invalid cluster size bounds'
         self.n_items = n_items
         self.k = k
         self.ub = ub
         self.lb = lb
-
-        self.A = []
-        self.b = []
-        self.B = []
-        self.d = []
         self.c = c
 
-        # unique item assignment constraints
-        for j in range(n_items):
-            row = np.zeros(n_items*k, dtype=np.int16)
-            for i in range(k):
-                row[i*n_items + j] = 1
-            self.A.append(row)
-            self.b.append(1)
-
-        # cluster size constraints
-        self.fixed_cluster_inds = []
-        self.bounded_cluster_inds = []
-        for i in range(k):
-            row = np.zeros(n_items*k, dtype=np.int16)
-            for j in range(n_items):
-                row[i*n_items + j] = 1
-            if ub[i] == lb[i]:
-                self.A.append(row)
-                self.b.append(ub[i])
-                self.fixed_cluster_inds.append(i)
-            elif ub[i] > lb[i]:
-                self.B.append(row)
-                self.B.append(-1*row)
-                self.d.append(ub[i])
-                self.d.append(-1*lb[i])
-                self.bounded_cluster_inds.append(i)
-            else:
-                raise ValueError('Invalid cluster size bounds')
+        self.fixed_cluster_inds = [i for i in range(k) if ub[i] == lb[i]]
+        self.bounded_cluster_inds = [i for i in range(k) if ub[i] > lb[i]]
+        if len(self.fixed_cluster_inds) + len(self.bounded_cluster_inds) < k:
+            raise ValueError('Invalid cluster size bounds')
         self.n_fixed_clusters = len(self.fixed_cluster_inds)
         self.n_bounded_clusters = len(self.bounded_cluster_inds)
+        # first of the two rows of B of each bounded cluster (-1 for fixed clusters)
+        self.bound_rows = np.full(k, -1, dtype=int)
+        self.bound_rows[self.bounded_cluster_inds] = 2*np.arange(self.n_bounded_clusters)
+        # nonzero entries of the next circuit, when the direction oracle knows them (see ClusterExchangeOracle)
+        self.circuit_support = None
 
-        # variable nonnegativity constraints
-        for i in range(n_items*k):
-            row = np.zeros(n_items*k, dtype=np.int16)
-            row[i] = -1
-            self.B.append(row)
-            self.d.append(0)
+        # variable y[i*n_items + j] assigns item j to cluster i. A has the unique item assignment
+        # constraints and the sizes of fixed clusters, B the upper and lower size bounds of the other clusters
+        cluster_cols = np.arange(k*n_items).reshape(k, n_items)
+        self.A = sp.vstack((_indicator_rows(cluster_cols.T, k*n_items),
+                            _indicator_rows(cluster_cols[self.fixed_cluster_inds], k*n_items)), format='csr')
+        self.b = np.concatenate((np.ones(n_items, dtype=np.int64),
+                                 np.asarray(ub, dtype=np.int64)[self.fixed_cluster_inds]))
+        signs = np.tile([1, -1], self.n_bounded_clusters)
+        self.B = _indicator_rows(np.repeat(cluster_cols[self.bounded_cluster_inds], 2, axis=0), k*n_items, signs)
+        bounded_ub = np.asarray(ub, dtype=np.int64)[self.bounded_cluster_inds]
+        bounded_lb = np.asarray(lb, dtype=np.int64)[self.bounded_cluster_inds]
+        self.d = np.column_stack((bounded_ub, -bounded_lb)).ravel()
+        # variable nonnegativity constraints are lower bounds of the variables
+        super(PartitionPolytope, self).__init__(self.B, self.d, self.A, self.b, self.c, backend=backend,
+                                                lb=np.zeros(n_items*k))
 
-        self.A = np.asarray(self.A, dtype=np.int16)
-        self.b = np.asarray(self.b, dtype=np.int16)
-        self.B = np.asarray(self.B, dtype=np.int16)
-        self.d = np.asarray(self.d, dtype=np.int16)        
-        super(PartitionPolytope, self).__init__(self.B, self.d, self.A, self.b, self.c)
+    # combinatorial steepest-descent direction oracle, which can be passed to the steepest-descent
+    # scheme instead of the circuit model (see ClusterExchangeOracle)
+    def build_exchange_oracle(self):
+        return ClusterExchangeOracle(self)
 
     def get_constraint_matrices(self):
         return (self.A, self.b, self.B, self.d)
     
     def find_feasible_solution(self, verbose=False):
-        y = np.zeros(self.n_items*self.k, dtype=np.int16)
-        self.cluster_sizes = np.zeros(self.k, dtype=np.int16)
+        y = np.zeros(self.n_items*self.k, dtype=np.int8)
+        self.cluster_sizes = np.zeros(self.k, dtype=np.int64)
         items_assigned = 0
         for i in range(self.k):
             for _ in range(self.lb[i]):
@@ -92,61 +79,229 @@ class PartitionPolytope(Polyhedron):
         self.y_current = y
         return y
     
+    # active cluster size bounds and nonnegativity constraints of the clustering y_current
+    # (active_inds is kept as a boolean mask over the rows of B and the variable bounds, as in Polyhedron)
     def get_active_constraints(self, y_current=None):
-        if y_current is not None: self.y_current = y_current
-        inds = []
-        for j, i in enumerate(self.bounded_cluster_inds):
-            if self.cluster_sizes[i] == self.ub[i]:
-                inds.append(2*j)
-            elif self.cluster_sizes[i] == self.lb[i]:
-                inds.append(2*j + 1)
-        n_cluster_ineqs = 2*(self.n_bounded_clusters)
-        for j in range(self.n_items*self.k):
-            if self.y_current[j] == 0:
-                inds.append(n_cluster_ineqs + j)
-        self.active_inds = [False]*self.m_B
-        for i in inds:
-            self.active_inds[i] = True
-        return inds
+        if y_current is not None: 
+            self.y_current = y_current
+            self.cluster_sizes = y_current.reshape(self.k, self.n_items).sum(axis=1, dtype=np.int64)
+        bounded = np.asarray(self.bounded_cluster_inds, dtype=int)
+        sizes = self.cluster_sizes[bounded]
+        self.active_inds = np.zeros(self.n_constraints, dtype=bool)
+        self.active_inds[0:self.m_B:2] = sizes == np.asarray(self.ub)[bounded]
+        self.active_inds[1:self.m_B:2] = sizes == np.asarray(self.lb)[bounded]
+        lb_offset = self.m_B + self.n
+        self.active_inds[lb_offset:] = self.y_current == 0
+        self.circuit_support = None
+        return np.flatnonzero(self.active_inds)
     
+    # take a step of size 1 along the circuit g (a scaled 0/+-1-vector of item moves). Only the entries
+    # of the moved items and the bounds of the clusters they move between are updated, and only these
+    # constraints are returned (as the ones that may have entered or left the active set), so a step costs
+    # O(size of the circuit) when the oracle provides the support of g in circuit_support
     def take_maximal_step(self, g, y_pos, y_neg):
         assert hasattr(self, 'y_current') and hasattr(self, 'active_inds') 
         
         # normalize g to be a 0/1-vector
-        scale = 0
-        for g_i in g:
-            if g_i > 0:
-                scale = (1./g_i)
-                break
-        g_normalized = np.round(scale*g).astype(np.int16)
+        if self.circuit_support is not None:
+            moved = self.circuit_support
+            self.circuit_support = None
+        else:
+            moved = np.flatnonzero(np.abs(g) > EPS)
+        scale = 1. / g[moved][g[moved] > 0][0] if len(moved) else 0
+        step = np.round(scale*g[moved]).astype(np.int8)
         
-        # take step with size 1
+        # take step with size 1; the nonnegativity constraint of every moved item changes
         alpha = 1
-        self.y_current += g_normalized
-        assert np.sum(self.y_current) == self.n_items
+        self.y_current[moved] += step
+        if step.sum() != 0 or np.any((self.y_current[moved] != 0) & (self.y_current[moved] != 1)):
+            raise RuntimeError('Invalid step')
+        lb_offset = self.m_B + self.n
+        self.active_inds[lb_offset + moved] = self.y_current[moved] == 0
+        changed = [lb_offset + moved]
 
-        for j, i in enumerate(self.bounded_cluster_inds):
-            if y_pos[2*j] > EPS:
-                self.cluster_sizes[i] += 1
-                self.active_inds[2*j + 1] = False
+        clusters, changes = np.unique(moved // self.n_items, return_inverse=True)
+        changes = np.bincount(changes, weights=step).astype(np.int64)
+        for i, change in zip(clusters, changes):
+            if change == 0:
+                continue
+            self.cluster_sizes[i] += change
+            j = self.bound_rows[i]
+            if j < 0:
+                raise RuntimeError('Invalid step')
+            if change > 0:
+                self.active_inds[j + 1] = False
                 if self.cluster_sizes[i] == self.ub[i]:
-                    self.active_inds[2*j] = True
+                    self.active_inds[j] = True
                 elif self.cluster_sizes[i] > self.ub[i]:
                     raise RuntimeError('Invalid step')
-            elif y_neg[2*j] > EPS:
-                self.cluster_sizes[i] -= 1
-                self.active_inds[2*j] = False
+            else:
+                self.active_inds[j] = False
                 if self.cluster_sizes[i] == self.lb[i]:
-                    self.active_inds[2*j + 1] = True
+                    self.active_inds[j + 1] = True
                 elif self.cluster_sizes[i] < self.lb[i]:
                     raise RuntimeError('Invalid step')
-        
-        n_cluster_ineqs = 2*(self.n_bounded_clusters)
-        for j in range(self.n_items*self.k):
-            if self.y_current[j] == 0:
-                self.active_inds[n_cluster_ineqs + j] = True
-            elif self.y_current[j] == 1:
-                self.active_inds[n_cluster_ineqs + j] = False
+            changed.append([j, j + 1])
                 
-        return self.y_current, alpha, [i for i in range(self.m_B) if self.active_inds[i]]
+        return self.y_current, alpha, np.concatenate(changed)
 
+# sparse matrix with n columns and one row per row of cols, with the entry sign (1 by default) in the columns of the row
+def _indicator_rows(cols, n, signs=None):
+    m, row_nnz = cols.shape
+    signs = np.ones(m) if signs is None else signs
+    return sp.csr_matrix((np.repeat(np.asarray(signs, dtype=float), row_nnz), cols.ravel(),
+                          np.arange(m + 1)*row_nnz), shape=(m, n))
+
+
+# random cluster size bounds and objective of a partition polytope with n items and k clusters, drawn with
+# the numpy.random.Generator rng: each cluster gets the bounds min and max of a random size below n and one
+# below n/k, and the costs are integers below 1000
+def random_partition_instance(n, k, rng):
+    v = np.column_stack((rng.integers(0, n, size=k), rng.integers(0, max(n//k, 1), size=k)))
+    ub = v.max(axis=1)
+    lb = v.min(axis=1)
+    c = rng.integers(0, 1000, size=n*k)
+    return ub, lb, c
+
+
+# minimum mean cycle of the digraph with arc weights W (np.inf for missing arcs) by Karp's algorithm.
+# Returns the nodes of the cycle in order, or None if the graph has no cycle
+def min_mean_cycle(W):
+    N = W.shape[0]
+    # D[l, v] is the minimum weight of a walk with l arcs ending in v (starting anywhere)
+    D = np.full((N + 1, N), np.inf)
+    D[0] = 0
+    pred = np.zeros((N + 1, N), dtype=int)
+    for l in range(1, N + 1):
+        walks = D[l-1][:, None] + W
+        pred[l] = walks.argmin(axis=0)
+        D[l] = walks[pred[l], np.arange(N)]
+    finite = np.isfinite(D[N])
+    if not finite.any():
+        return None
+    with np.errstate(invalid='ignore'):
+        ratios = (D[N] - D[:N]) / (N - np.arange(N))[:, None]
+    means = np.where(finite, np.nanmax(np.where(finite, ratios, -np.inf), axis=0), np.inf)
+    
+    # the walk with N arcs ending in the minimizer contains a minimum mean cycle
+    walk = [int(np.argmin(means))]
+    for l in range(N, 0, -1):
+        walk.append(pred[l][walk[-1]])
+    walk.reverse()
+    best, best_mean = None, np.inf
+    stack, pos = [], {}
+    for v in walk:
+        if v in pos:
+            cycle = stack[pos[v]:]
+            mean = sum(W[a, b] for a, b in zip(cycle, cycle[1:] + cycle[:1])) / len(cycle)
+            if mean < best_mean:
+                best, best_mean = cycle, mean
+            for u in cycle:
+                del pos[u]
+            del stack[len(stack) - len(cycle):]
+        pos[v] = len(stack)
+        stack.append(v)
+    return best
+
+
+# Steepest-descent direction oracle for a PartitionPolytope that works on the cluster exchange graph
+# instead of solving the circuit model. Its circuits at a clustering are the simple cycles of the graph on
+# the k clusters with an arc a -> b for moving an item from cluster a to cluster b (using the cheapest item,
+# at cost c_bj - c_aj), and the simple paths from a cluster that can shrink to a cluster that can grow
+# (bounded clusters above their lower / below their upper size bound). A circuit with t moves has 1-norm 2t
+# for cycles and 2t + 4 for paths (the size of each end cluster is in two rows of B), as in PolyhedralModel.
+# The paths are closed into cycles by an extra node with 0-cost arcs to the clusters that can shrink and
+# from the clusters that can grow, so that both norms are twice the number of arcs and a steepest-descent
+# circuit is a minimum mean cycle of the graph on k + 1 nodes (Karp's algorithm, O(k^3)). After a step
+# only the arcs leaving the clusters changed by the circuit are updated, in O(n + k * cluster size) each.
+# It has the interface of PolyhedralModel used by the steepest-descent scheme (without an LP model)
+class ClusterExchangeOracle():
+    def __init__(self, P):
+        self.P = P
+        self.k, self.n_items = P.k, P.n_items
+        self.lb, self.ub = np.asarray(P.lb), np.asarray(P.ub)
+        self.bounded = P.bound_rows >= 0
+        self.bound_row = P.bound_rows
+        self.primal = None
+        self.model = None
+        self.moved = None
+        self.set_objective(P.c)
+    
+    # costs of the arcs leaving cluster a and the items they move
+    def _update_cluster(self, a):
+        items = np.flatnonzero(self.assignment == a)
+        self.W[a] = np.inf
+        if len(items):
+            delta = self.C[:, items] - self.C[a, items]
+            best = delta.argmin(axis=1)
+            self.W[a] = delta[np.arange(self.k), best]
+            self.J[a] = items[best]
+            self.W[a, a] = np.inf
+    
+    # build the exchange graph for the current clustering of P
+    def reset(self):
+        self.assignment = self.P.y_current.reshape(self.k, self.n_items).argmax(axis=0)
+        self.W = np.full((self.k, self.k), np.inf)
+        self.J = np.zeros((self.k, self.k), dtype=int)
+        for a in range(self.k):
+            self._update_cluster(a)
+        self.moved = None
+    
+    def set_objective(self, c):
+        self.C = np.asarray(c, dtype=float).reshape(self.k, self.n_items)
+        self.reset()
+    
+    # the active constraints follow from the clustering of P, so a new active set rebuilds the graph
+    def set_active_inds(self, active_inds):
+        self.reset()
+        return self.k
+    
+    # update the graph after the step along the last circuit (changed and active_mask are not needed, the
+    # moved items are known); returns the number of clusters whose arcs were updated
+    def update_active_inds(self, changed, active_mask):
+        if self.moved is None:
+            return 0
+        items, clusters = self.moved
+        self.assignment[items] = self.P.y_current.reshape(self.k, self.n_items)[:, items].argmax(axis=0)
+        for a in clusters:
+            self._update_cluster(a)
+        self.moved = None
+        return len(clusters)
+    
+    def compute_sd_direction(self, verbose=False):
+        t0 = time.perf_counter()
+        k, n_items = self.k, self.n_items
+        sizes = np.asarray(self.P.cluster_sizes)
+        W = np.full((k + 1, k + 1), np.inf)
+        W[:k, :k] = self.W
+        W[k, :k] = np.where(self.bounded & (sizes > self.lb), 0, np.inf)
+        W[:k, k] = np.where(self.bounded & (sizes < self.ub), 0, np.inf)
+        cycle = min_mean_cycle(W)
+        
+        g = np.zeros(k*n_items)
+        B_g = np.zeros(self.P.m_B)
+        steepness = 0.0
+        if cycle is not None:
+            arcs = list(zip(cycle, cycle[1:] + cycle[:1]))
+            norm = 2*len(arcs)
+            cost = sum(W[a, b] for a, b in arcs)
+            if cost / norm < -EPS:
+                moves = [(a, b, self.J[a, b]) for a, b in arcs if a < k and b < k]
+                for a, b, j in moves:
+                    g[b*n_items + j] += 1
+                    g[a*n_items + j] -= 1
+                for a, b in arcs:
+                    # a path from the cluster b that shrinks, or to the cluster a that grows
+                    if a == k:
+                        B_g[self.bound_row[b]:self.bound_row[b] + 2] = (-1, 1)
+                    elif b == k:
+                        B_g[self.bound_row[a]:self.bound_row[a] + 2] = (1, -1)
+                g, B_g = g / norm, B_g / norm
+                steepness = cost / norm
+                self.moved = (np.array([j for _, _, j in moves]), sorted({a for a, _ in arcs if a < k}
+                                                                         | {b for _, b in arcs if b < k}))
+                self.P.circuit_support = np.array([b*n_items + j for a, b, j in moves]
+                                                  + [a*n_items + j for a, b, j in moves], dtype=int)
+        
+        solve_time = time.perf_counter() - t0
+        return g, np.maximum(B_g, 0), np.maximum(-B_g, 0), steepness, 0, solve_time, (None, None)
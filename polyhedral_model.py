@@ -1,153 +1,346 @@
 import numpy as np
-import gurobipy as gp
-import contextlib
+import scipy.sparse as sp
 import time
 
-from utils import METHODS, INF, EPS
+from lp_backend import make_backend, OPTIMAL
+from utils import INF, EPS
+
+PHASE_MODES = ['off', 'sampled', 'full']
+
+# upper bound of the scale mu of the dual model, so that it is bounded at optimal points
+# (where the steepness is 0); the steepness -1/mu at this bound is -EPS/2
+MU_MAX = 2 / EPS
 
 class PolyhedralModel():
     
-    # Given matrices B and A (and optional inds argument / objective function),
+    # Given matrices B and A (dense or sparse) and optional inds argument / objective function,
     # builds a polyhedral model for computing steepest-descent circuits
-    # as a gurobi linear program model
-    def __init__(self, B, A=None, active_inds=[], c=None, primal=True, method='dual_simplex'):
+    # as a linear program model of the given LP backend. All variables and constraints are added
+    # with sparse matrix calls, so build time is proportional to nnz(B) + nnz(A)
+    # phase_mode selects how the time of the two simplex phases of each solve is measured, see set_phase_mode.
+    # Variable bounds lb <= x <= ub (default is no bounds) are handled without rows in the model: the direction
+    # g_j of a variable with a finite bound is split into g_pos_j - g_neg_j, which enter the 1-norm constraint
+    # with one weight per finite bound (as |g_j| per bound row of B would), and an active upper (lower) bound
+    # fixes g_pos_j (g_neg_j) at 0. Active constraints are indexed as in Polyhedron: the rows of B, then the
+    # upper bounds and the lower bounds of the n variables.
+    # With primal=False the dual of this LP is solved instead (scaled so that the 1-norm becomes bounds
+    # of the dual variables, see _build_dual), which has n rows instead of m_B + m_A + 1
+    # The weights of the 1-norm can be changed with set_norm_weights (as the augmentation rules do). With
+    # split_all=True the free variables are split as well, so that the norm can weigh every |g_j|
+    def __init__(self, B, A=None, active_inds=[], c=None, primal=True, method='dual_simplex', backend='gurobi',
+                 phase_mode='off', lb=None, ub=None, split_all=False):
         
-        print('Building polyhedral model. Solve method: {}'.format(method))
+        print('Building polyhedral model ({}). Solve method: {}'.format('primal' if primal else 'dual', method))
         
-        self.model = gp.Model()
+        self.model = make_backend(backend)
         self.primal = primal
+        self.B = B
         
         # add variables and constraints to the model
         self.m_B, self.n = B.shape
+        self.m_A = A.shape[0] if A is not None else 0
+        self.has_lb = lb > -INF if lb is not None else np.zeros(self.n, dtype=bool)
+        self.has_ub = ub < INF if ub is not None else np.zeros(self.n, dtype=bool)
+        self.split_all = split_all
+        is_split = np.ones(self.n, dtype=bool) if split_all else self.has_lb | self.has_ub
+        self.free_cols = np.flatnonzero(~is_split)
+        self.split_cols = np.flatnonzero(is_split)
+        self.bound_weights = self.has_lb[self.split_cols].astype(float) + self.has_ub[self.split_cols]
+        # weights of (Bg)^+, (Bg)^- and of g^+, g^- of the split variables in the 1-norm
+        self.norm_weights = (np.ones(self.m_B), np.ones(self.m_B), self.bound_weights, self.bound_weights)
+        # positions in split_cols of the variables with an upper (lower) bound
+        self.ub_pos = np.flatnonzero(self.has_ub[self.split_cols])
+        self.lb_pos = np.flatnonzero(self.has_lb[self.split_cols])
+
+        # each constraint is made active by setting one bound of one variable of the model
+        # (constraint_vars is -1 for missing bounds)
+        self.n_constraints = self.m_B + 2*self.n
+        self.constraint_vars = np.full(self.n_constraints, -1, dtype=int)
+        self.constraint_is_ub = np.ones(self.n_constraints, dtype=bool)
+        self.inactive_bounds = np.zeros(self.n_constraints)
+        self.active_bounds = np.zeros(self.n_constraints)
         if self.primal:
-            self.x = []
-            self.y_pos = []
-            self.y_neg = []
-            for i in range(self.n):
-                self.x.append(self.model.addVar(lb=-INF, ub=INF, name='x_{}'.format(i)))
-            for i in range(self.m_B):
-                self.y_pos.append(self.model.addVar(lb=0.0, ub=1.0, name='y_pos_{}'.format(i)))
-                self.y_neg.append(self.model.addVar(lb=0.0, ub=1.0, name='y_neg_{}'.format(i)))
-                self.model.addConstr(gp.LinExpr(list(B[i]) + [-1, 1], 
-                                                self.x + [self.y_pos[i], self.y_neg[i]]) == 0, 
-                                                name='B_{}'.format(i))
-    
-            self.model.addConstr(gp.LinExpr([1]*(2*self.m_B), self.y_pos + self.y_neg) == 1, 
-                                 name='1_norm')
+            self._build_primal(B, A)
+        else:
+            self._build_dual(B, A)
+        self.n_rows = self.m_B + self.m_A + 1 if self.primal else self.n
+        self.n_cols = len(self.vars)
+
+        if c is not None:
+            self.set_objective(c)
+        self.active_mask = np.zeros(self.n_constraints, dtype=bool)
+        self.set_active_inds(active_inds)
+        self.set_method(method)
+        self.set_phase_mode(phase_mode)
+
+        print('Polyhedral model built!')
+
+    # min c^T g  s.t.  Bg = y_pos - y_neg,  Ag = 0,  sum(y_pos + y_neg) <= 1,  y_pos_i = 0 for active rows
+    def _build_primal(self, B, A):
+        n_free, n_split = len(self.free_cols), len(self.split_cols)
+        self.n_x = n_free + 2*n_split
+        # g = D (g_free, g_pos, g_neg)
+        self.D = sp.csr_matrix((np.concatenate((np.ones(n_free + n_split), -np.ones(n_split))),
+                                (np.concatenate((self.free_cols, self.split_cols, self.split_cols)),
+                                 np.arange(self.n_x))), shape=(self.n, self.n_x))
+            
+        # variables (g_free, g_pos, g_neg, y_pos, y_neg) are added as a single block. The upper bounds of 1
+        # are implied by the norm constraint with the default weights (see set_norm_weights for other weights)
+        lb = np.concatenate((np.full(n_free, -INF), np.zeros(2*n_split + 2*self.m_B)))
+        ub = np.concatenate((np.full(n_free, INF), np.ones(2*n_split + 2*self.m_B)))
+        self.vars = self.model.add_variables(lb, ub)
+        self.x = self.vars[:self.n_x]
+        self.y_pos = self.vars[self.n_x:self.n_x + self.m_B]
+        self.y_neg = self.vars[self.n_x + self.m_B:]
                 
-            if A is not None:
-                self.m_A = A.shape[0]
-                for i in range(self.m_A):
-                    self.model.addConstr(gp.LinExpr(A[i], self.x) == 0, 
-                                         name='A_{}'.format(i))
-            else:
-                self.m_A = 0
+        # constraints [BD | -I | I] (g_free, g_pos, g_neg, y_pos, y_neg) = 0 and the 1-norm constraint
+        # (an inequality, since g_pos and g_neg cannot both be positive when a bound is active, so g = 0 is
+        # not always feasible with '='; the norm of a direction with negative steepness is still 1)
+        I = sp.identity(self.m_B, format='csr')
+        self.model.add_constraints(sp.hstack((sp.csr_matrix(B).dot(self.D), -I, I), format='csr'), '=',
+                                   np.zeros(self.m_B), self.vars)
+        self.norm_vars = self.vars[n_free:]
+        self.norm_coefficients = self._norm_coefficients(self.norm_weights)
+        self.norm_row = self.model.add_constraints(sp.csr_matrix(self.norm_coefficients.reshape(1, -1)), '<',
+                                                  np.ones(1), self.norm_vars)[0]
+        if A is not None:
+            self.model.add_constraints(sp.csr_matrix(A).dot(self.D), '=', np.zeros(self.m_A), self.x)
                 
-            if c is not None:
-                self.set_objective(c)
+        # an active row fixes y_pos_i at 0, an active upper (lower) bound fixes g_pos_j (g_neg_j) at 0
+        g_pos, g_neg = self.vars[n_free:n_free + n_split], self.vars[n_free + n_split:self.n_x]
+        self.constraint_vars[:self.m_B] = self.y_pos
+        self.constraint_vars[self.m_B + self.split_cols[self.ub_pos]] = g_pos[self.ub_pos]
+        self.constraint_vars[self.m_B + self.n + self.split_cols[self.lb_pos]] = g_neg[self.lb_pos]
+        self.inactive_bounds[:] = 1.0
+        self.unit_bounds = True
+            
+    # Dual of the primal model, with the dual values u of the rows of B divided by the dual value
+    # lambda = -steepness of the 1-norm constraint, and mu = 1/lambda:
+    #   max mu  s.t.  B^T v + A^T w - r - mu c = 0,  -1 <= v_i <= 1,  -weight_j <= r_j <= weight_j
+    # where r_j is only defined for the split variables (the weights of the 1-norm are the bounds of v and r,
+    # -1 and 1 are those of y_pos_i and y_neg_i). An active row drops the bound v_i >= -1, and an
+    # active upper (lower) bound of x_j drops r_j <= weight_j (r_j >= -weight_j). The steepness is -1/mu,
+    # and the steepest-descent direction g is given by the dual values of the n rows (scaled to norm 1)
+    def _build_dual(self, B, A):
+        n_split = len(self.split_cols)
+        E = sp.csr_matrix((np.ones(n_split), (self.split_cols, np.arange(n_split))), shape=(self.n, n_split))
                   
-            self.set_active_inds(active_inds)
-            self.set_method(method)
+        # variables (v, w, r, mu) are added as a single block
+        lb = np.concatenate((-np.ones(self.m_B), np.full(self.m_A, -INF), -self.bound_weights, np.zeros(1)))
+        ub = np.concatenate((np.ones(self.m_B), np.full(self.m_A, INF), self.bound_weights, np.full(1, MU_MAX)))
+        self.vars = self.model.add_variables(lb, ub)
+        self.v = self.vars[:self.m_B]
+        self.r = self.vars[self.m_B + self.m_A:-1]
+        self.mu = self.vars[-1]
                 
-        else:
-            raise RuntimeError('Not yet implemented')
+        # the coefficients of mu are set by set_objective
+        blocks = [sp.csr_matrix(B).T] + ([sp.csr_matrix(A).T] if A is not None else [])
+        blocks += [-E, sp.csr_matrix((self.n, 1))]
+        self.rows = self.model.add_constraints(sp.hstack(blocks, format='csr'), '=', np.zeros(self.n), self.vars)
+        self.model.set_objective(-np.ones(1), [self.mu])
             
-        self.model.update()
-        print('Polyhedral model built!')
+        self.constraint_vars[:self.m_B] = self.v
+        self.constraint_vars[self.m_B + self.split_cols[self.ub_pos]] = self.r[self.ub_pos]
+        self.constraint_vars[self.m_B + self.n + self.split_cols[self.lb_pos]] = self.r[self.lb_pos]
+        self.constraint_is_ub[:self.m_B] = False
+        self.constraint_is_ub[self.m_B + self.n:] = False
+        self._set_dual_inactive_bounds()
+        self.active_bounds[:] = np.where(self.constraint_is_ub, INF, -INF)
+    
+    # bounds of the model variables of the inactive constraints of the dual model from the norm weights
+    def _set_dual_inactive_bounds(self):
+        row_pos, _, col_pos, col_neg = self.norm_weights
+        self.inactive_bounds[:self.m_B] = -row_pos
+        self.inactive_bounds[self.m_B + self.split_cols[self.ub_pos]] = col_pos[self.ub_pos]
+        self.inactive_bounds[self.m_B + self.n + self.split_cols[self.lb_pos]] = -col_neg[self.lb_pos]
+    
+    # coefficients of the variables (g_pos, g_neg, y_pos, y_neg) in the 1-norm constraint of the primal model
+    def _norm_coefficients(self, weights):
+        row_pos, row_neg, col_pos, col_neg = weights
+        return np.concatenate((col_pos, col_neg, row_pos, row_neg))
+    
+    # Change the weights of the 1-norm: weights (row_pos, row_neg, col_pos, col_neg) of (Bg)^+ and (Bg)^- of
+    # the rows of B and of g^+ and g^- of the split variables (split_cols), all positive. The model then
+    # computes the circuit minimizing c^T g / ||g||_w. In the primal model the coefficients of the norm
+    # constraint that changed are set and the upper bounds of 1 of its variables are dropped (they are
+    # not implied by weights below 1); in the dual model the weights are the bounds of v and r
+    def set_norm_weights(self, weights):
+        self.norm_weights = tuple(np.asarray(w, dtype=float) for w in weights)
+        if self.primal:
+            coefficients = self._norm_coefficients(self.norm_weights)
+            changed = np.flatnonzero(coefficients != self.norm_coefficients)
+            self.model.set_row_coefficients(self.norm_row, self.norm_vars[changed], coefficients[changed])
+            self.norm_coefficients = coefficients
+            if self.unit_bounds:
+                self.inactive_bounds[:] = INF
+                ub = np.full(len(self.norm_vars), INF)
+                active_vars = self.constraint_vars[self.active_mask & (self.constraint_vars >= 0)]
+                ub[active_vars - self.norm_vars[0]] = 0.0
+                self.model.set_bounds(self.norm_vars, ub=ub)
+                self.unit_bounds = False
+        else:
+            row_pos, row_neg, col_pos, col_neg = self.norm_weights
+            self._set_dual_inactive_bounds()
+            lb_v, lb_r, ub_r = -row_pos, -col_neg, np.copy(col_pos)
+            lb_v[self.active_mask[:self.m_B]] = -INF
+            ub_r[self.ub_pos[self.active_mask[self.m_B + self.split_cols[self.ub_pos]]]] = INF
+            lb_r[self.lb_pos[self.active_mask[self.m_B + self.n + self.split_cols[self.lb_pos]]]] = -INF
+            self.model.set_bounds(self.v, lb=lb_v, ub=row_neg)
+            self.model.set_bounds(self.r, lb=lb_r, ub=ub_r)
                 
                 
     def set_objective(self, c):
         self.c = c
-        self.model.setObjective(gp.LinExpr(c, self.x))
+        if self.primal:
+            self.model.set_objective(self.D.T.dot(c), self.x)
+        else:
+            self.model.set_coefficients(self.rows, self.mu, -np.asarray(c, dtype=float))
             
+    # set the active rows (bounds) of the model; only the bounds of the model variables of the rows that entered
+    # or left the active set since the previous call are changed. Returns the number of bounds changed
     def set_active_inds(self, active_inds):
-        self.active_inds = active_inds
-        for i in range(self.m_B):
-            self.y_pos[i].lb = 0.0
-            self.y_pos[i].ub = 1.0
-        for i in self.active_inds:
-            self.y_pos[i].ub = 0.0
+        active_mask = np.zeros(self.n_constraints, dtype=bool)
+        active_mask[np.asarray(active_inds, dtype=int)] = True
+        return self.update_active_inds(np.flatnonzero(active_mask != self.active_mask), active_mask)
+    
+    # update the bounds of the model variables of the rows (bounds) in changed to their state in active_mask
+    # with one batched bound change, without scanning the other rows (the delta returned by take_maximal_step);
+    # returns the number of bounds changed
+    def update_active_inds(self, changed, active_mask):
+        changed = np.asarray(changed, dtype=int)
+        changed = changed[(active_mask[changed] != self.active_mask[changed]) & (self.constraint_vars[changed] >= 0)]
+        if len(changed) > 0:
+            bounds = np.where(active_mask[changed], self.active_bounds[changed], self.inactive_bounds[changed])
+            is_ub = self.constraint_is_ub[changed]
+            if is_ub.any():
+                self.model.set_bounds(self.constraint_vars[changed[is_ub]], ub=bounds[is_ub])
+            if not is_ub.all():
+                self.model.set_bounds(self.constraint_vars[changed[~is_ub]], lb=bounds[~is_ub])
+            self.active_mask[changed] = active_mask[changed]
+        return len(changed)
                 
     def set_method(self, method):
         self.method = method
-        #with contextlib.redirect_stdout(None):
-        self.model.Params.method = METHODS[method]
+        self.model.set_method(method)
           
-    # warm start the model with the provided solution   
+    # 1-norm of a direction g in the primal model: |Bg| plus |g_j| for each finite bound of x_j
+    # (with the weights of set_norm_weights, if changed)
+    def get_norm(self, g, B_g):
+        row_pos, row_neg, col_pos, col_neg = self.norm_weights
+        g_split = g[self.split_cols]
+        return (row_pos.dot(np.maximum(B_g, 0)) + row_neg.dot(np.maximum(-B_g, 0))
+                + col_pos.dot(np.maximum(g_split, 0)) + col_neg.dot(np.maximum(-g_split, 0)))
+
+    # warm start the model with the provided solution. g is scaled to satisfy the 1-norm constraint
+    # and passed to the solver with y_pos, y_neg = (Bg)^+, (Bg)^- (and g_pos, g_neg = g^+, g^- for
+    # the split variables) as a start for the next solve. For the dual model, the start has the values
+    # of v, r and mu that are complementary to g: v_i = -1 (1) where (Bg)_i > 0 (< 0), and similarly for r
+    # (with the weights of the norm instead of 1)
     def set_solution(self, g):
-        print(g.shape)
-        print(self.n)
-        for i in range(self.n):
-            self.x[i].lb = g[i]
-            self.x[i].ub = g[i]
-        for i in range(self.m_B):
-            self.y_pos[i].ub = 1.0
-            
-        # solve the modified model to obtain desired solution    
-        self.model.Params.method = 0
-        self.model.optimize()
-        
-        # reset the model contraints back to its original state
-        for i in range(self.n):
-            self.x[i].lb = -INF
-            self.x[i].ub = INF
-        self.model.setObjective(gp.LinExpr(np.zeros(self.n), self.x))                
-        self.model.optimize()
-        if self.model.status != gp.GRB.Status.OPTIMAL:
+        B_g = self.B.dot(g)
+        g_free, g_split = g[self.free_cols], g[self.split_cols]
+        scale = self.get_norm(g, B_g)
+        if scale <= EPS:
             raise RuntimeError('Failed to set solution for polyhedral model') 
-            
-        self.set_objective(self.c)                
-        self.set_active_inds(self.active_inds)
-        self.set_method(self.method)
-        #self.model.update()
+        if self.primal:
+            start = np.concatenate((g_free, np.maximum(g_split, 0), np.maximum(-g_split, 0),
+                                    np.maximum(B_g, 0), np.maximum(-B_g, 0)))
+            self.model.set_start(start / scale, self.vars)
+        else:
+            row_pos, row_neg, col_pos, col_neg = self.norm_weights
+            c_g = np.dot(self.c, g)
+            mu = min(scale / -c_g, MU_MAX) if c_g < -EPS else 0.0
+            v = np.where(B_g > EPS, -row_pos, np.where(B_g < -EPS, row_neg, 0.0))
+            r = np.where(g_split > EPS, col_pos, np.where(g_split < -EPS, -col_neg, 0.0))
+            start = np.concatenate((v, np.zeros(self.m_A), r, [mu]))
+            self.model.set_start(start, self.vars)
         
                 
-    def compute_sd_direction(self, verbose=False):
-        flag = 1 if verbose else 0
-        self.model.setParam(gp.GRB.Param.OutputFlag, flag)
+    # Measuring the phase times needs a callback into Python at every simplex callback point of the
+    # solver, which is a noticeable part of the solve time for long solves. phase_mode is one of
+    #   'off': no callback, phase times are not measured
+    #   'sampled': the callback only queries the dual infeasibility every sample_interval calls
+    #   'full': the dual infeasibility is queried at every call
+    def set_phase_mode(self, phase_mode, sample_interval=10):
+        if phase_mode not in PHASE_MODES:
+            raise ValueError('Unknown phase mode: {}. Options: {}'.format(phase_mode, ', '.join(PHASE_MODES)))
+        self.phase_mode = phase_mode
+        self.sample_interval = sample_interval if phase_mode == 'sampled' else 1
+        self._callback = self._dualinf_callback if phase_mode != 'off' else None
+    
+    # records the time at which the solve first becomes dual feasible (end of phase 1)
+    def _dualinf_callback(self, query):
+        if self._is_dualinf:
+            self._n_callbacks += 1
+            if self._n_callbacks % self.sample_interval == 0 and query('dual_inf') < EPS:
+                self._phase1_time = time.perf_counter() - self._t_solve
+                self._is_dualinf = False
         
-        t0 = time.time()
-        self.model._phase1_time = None
-        self.model._is_dualinf = True
-        def dualinf_callback(model, where):
-            if where == gp.GRB.Callback.SIMPLEX:
-                if model._is_dualinf:
-                    dualinf = model.cbGet(gp.GRB.Callback.SPX_DUALINF)
-                    if dualinf < EPS:
-                        model._phase1_time = time.time() - t0
-                        model._is_dualinf = False
+    def compute_sd_direction(self, verbose=False):
+        self.model.set_verbose(verbose)
         
-        self.model.optimize(dualinf_callback)
-        if self.model.status != gp.GRB.Status.OPTIMAL:
+        self._t_solve = time.perf_counter()
+        self._phase1_time = None
+        self._is_dualinf = True
+        self._n_callbacks = 0
+        self.model.optimize(self._callback)
+        if self.model.status != OPTIMAL and not self.primal:
+            # the warm-started dual model can stall numerically after many changes of mu's column,
+            # so it is solved once more without the previous basis
+            self.model.reset()
+            self.model.optimize(self._callback)
+        if self.model.status != OPTIMAL:
             raise RuntimeError('Failed to find steepst-descent direction.')
         
-        phase2_time = time.time() - self.model._phase1_time
-        phase_times = (self.model._phase1_time, phase2_time)
-        g = self.model.getAttr('x', self.x)
-        y_pos = self.model.getAttr('x', self.y_pos)
-        y_neg = self.model.getAttr('x', self.y_neg)
-        steepness = self.model.objVal
-        num_steps = self.model.getAttr('IterCount')
-        solve_time = self.model.getAttr('Runtime')
+        # phase times are only available if measured and if the backend reports simplex progress
+        phase_times = (None, None)
+        if self._phase1_time is not None:
+            phase2_time = time.perf_counter() - self._t_solve - self._phase1_time
+            phase_times = (self._phase1_time, phase2_time)
+        if self.primal:
+            g = self.D.dot(self.model.get_values(self.x))
+            y_pos = self.model.get_values(self.y_pos)
+            y_neg = self.model.get_values(self.y_neg)
+            steepness = self.model.obj_val
+        else:
+            g, y_pos, y_neg, steepness = self._get_dual_direction()
+        num_steps = self.model.iter_count
+        solve_time = self.model.runtime
         
-        return np.asarray(g), np.asarray(y_pos), np.asarray(y_neg), steepness, num_steps, solve_time, phase_times
+        return g, y_pos, y_neg, steepness, num_steps, solve_time, phase_times
     
+    # steepest-descent direction from the row duals of the dual model (the sign of the duals
+    # depends on the solver, so g is chosen with c^T g < 0)
+    def _get_dual_direction(self):
+        mu = -self.model.obj_val
+        if mu <= EPS:
+            # mu = 0 only if there is a direction with Bg = 0 and c^T g < 0
+            raise RuntimeError('Failed to find steepst-descent direction.')
+        g = self.model.get_duals(self.rows)
+        if np.dot(self.c, g) > 0:
+            g = -g
+        B_g = self.B.dot(g)
+        norm = self.get_norm(g, B_g)
+        if norm <= EPS:
+            g, B_g, norm = np.zeros(self.n), np.zeros(self.m_B), 1.0
+        g, B_g = g / norm, B_g / norm
+        return g, np.maximum(B_g, 0), np.maximum(-B_g, 0), -1 / mu
+
     # find a feasible solution for the polyhedral model
     def find_feasible_solution(self, verbose=False):
+        if not self.primal:
+            raise RuntimeError('Not available for the dual model')
         c_orig = np.copy(self.c)
         c = np.zeros(self.n)
         self.set_objective(c)           
         
         self.model.optimize()
-        if self.model.status != gp.GRB.Status.OPTIMAL:
+        if self.model.status != OPTIMAL:
             raise RuntimeError('Failed to find feasible solution.')        
         
         self.set_objective(c_orig)
-        x_feasible = self.model.getAttr('x', self.x)  
+        x_feasible = self.D.dot(self.model.get_values(self.x))
         return x_feasible
                 
     def reset(self):
         self.model.reset()
-
-
-
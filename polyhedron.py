@@ -1,122 +1,248 @@
-import numpy as np
-import sympy
-import gurobipy as gp
-import contextlib
+import io
 import time
+import contextlib
+import multiprocessing as mp
+import numpy as np
+import scipy.sparse as sp
 
 from polyhedral_model import PolyhedralModel
-from utils import result, EPS, INF, METHODS
+from lp_backend import make_backend, set_default_threads, OPTIMAL
+from steepest_descent import steepest_descent_augmentation_scheme as sdac
+from iteration_log import IterationSink
+from exact_kernel import kernel_vector
+from utils import result, to_dense, EPS, INF
+
+# build_polyhedral_model uses the dual model if n < DUAL_ROW_RATIO * (m_B + m_A + 1). On Netlib the dual model
+# was faster when it had fewer rows (agg, agg2, israel, maros) and mostly slower otherwise (ken-07, fit1p, grow*)
+DUAL_ROW_RATIO = 1.0
+
+# tolerances below which entries of a circuit direction g and of B g are taken as 0 by get_normalized_circuit.
+# Circuits of badly scaled problems can have entries below EPS (e.g. 5e-8 on bandm), while the solver
+# noise is of the order of 1e-15, so the small tolerance is tried first
+CIRCUIT_TOLS = (1e-12, EPS)
+
+# anti-stalling modes of take_maximal_step. A step is degenerate (alpha < EPS) when an inactive constraint
+# with (almost) zero slack blocks it, and inactive constraints with small slack lead to runs of tiny steps
+# that each cost an oracle solve. With 'perturb', the right hand side of every inactive constraint with slack
+# at most PERTURB_TOL after a step is shifted to make it tight, and the constraint becomes active. The shifts
+# tighten P, so the points stay feasible, and since the steepest-descent norm bounds |B_i g| and |g_j| by 1,
+# no later step is shorter than PERTURB_TOL. Once the scheme converges for the shifted right hand sides, they
+# are restored and the simplex method finishes the solve from the current point (see remove_shifts)
+ANTI_STALLING = ['off', 'perturb']
+PERTURB_TOL = 1e-6
 
 
 #class for representing a general polyhedron of the form:
-# P = {x in R^n : Ax = b, Bx <= d}, with objective c
+# P = {x in R^n : Ax = b, Bx <= d, lb <= x <= ub}, with objective c
 class Polyhedron:
     
-    # initiallize with matrices and vectors given by numpy arrays
-    def __init__(self, B, d, A=None, b=None, c=None):
-        self.B = B
+    # initiallize with matrices given by numpy arrays or scipy sparse matrices
+    # (sparse matrices are stored in CSR format) and vectors given by numpy arrays.
+    # backend is the name of the LP solver used for all models of the polyhedron.
+    # Variable bounds lb and ub (default is no bounds, infinite entries for missing bounds)
+    # are stored as var_lb and var_ub and handled per variable instead of as rows of B
+    def __init__(self, B, d, A=None, b=None, c=None, backend='gurobi', lb=None, ub=None):
+        self.B = sp.csr_matrix(B) if sp.issparse(B) else B
         self.d = d
-        self.A = A
+        self.A = sp.csr_matrix(A) if sp.issparse(A) else A
         self.b = b
         self.c = c
+        self.backend = backend
         
         self.m_B, self.n = self.B.shape
         self.m_A = self.A.shape[0] if self.A is not None else 0
+        self.var_lb = np.asarray(lb, dtype=float) if lb is not None else np.full(self.n, -np.inf)
+        self.var_ub = np.asarray(ub, dtype=float) if ub is not None else np.full(self.n, np.inf)
+        self.has_lb = self.var_lb > -INF
+        self.has_ub = self.var_ub < INF
+        self.n_bounds = int(self.has_lb.sum() + self.has_ub.sum())
+        self.set_constraint_indexing()
+        self.anti_stalling = 'off'
+        self.perturb_tol = PERTURB_TOL
+        # right hand sides (d, var_ub, var_lb) before the shifts of the 'perturb' mode, and the number of shifts
+        self.unshifted = None
+        self.n_shifts = 0
         self.model = None
-        print('Problem size: n = {},  m_B = {},  m_A = {}'.format(self.n, self.m_B, self.m_A))
+        # circuit models copy B and the constraint indexing when they are built (see add_facets)
+        self.has_polyhedral_model = False
+        print('Problem size: n = {},  m_B = {},  m_A = {}'.format(self.n, self.m_B, self.m_A)
+              + (',  bounds = {}'.format(self.n_bounds) if self.n_bounds else ''))
         
-    # construct polyhedral model for computing circuits
-    def build_polyhedral_model(self, active_inds=[], primal=True, method='dual_simplex'):
-        pm = PolyhedralModel(B=self.B, A=self.A, c=self.c, active_inds=active_inds, method=method)
+    # constraints of P are indexed by the rows of B, followed by the upper bounds x_j <= ub_j
+    # and the lower bounds -x_j <= -lb_j of all n variables (missing bounds are never active)
+    def set_constraint_indexing(self):
+        self.m_B = self.B.shape[0]
+        self.n_constraints = self.m_B + 2*self.n
+        self.has_constraint = np.concatenate((np.ones(self.m_B, dtype=bool), self.has_ub, self.has_lb))
+    
+    # the solver model is not pickled (e.g. when the polyhedron is sent to worker processes)
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['model'] = None
+        return state
+        
+    # construct polyhedral model for computing circuits. With primal='auto' the dual model is used
+    # if it has fewer rows (n) than the primal model (m_B + m_A + 1), see DUAL_ROW_RATIO
+    def build_polyhedral_model(self, active_inds=[], primal='auto', method='dual_simplex', phase_mode='off',
+                               split_all=False):
+        if primal == 'auto':
+            primal = self.n > DUAL_ROW_RATIO * (self.m_B + self.m_A + 1)
+        pm = PolyhedralModel(B=self.B, A=self.A, c=self.c, active_inds=active_inds, primal=primal, method=method,
+                             backend=self.backend, phase_mode=phase_mode, lb=self.var_lb, ub=self.var_ub,
+                             split_all=split_all)
+        self.has_polyhedral_model = True
         return pm
     
     # set current problem solution and get active constraints
+    # (active_inds is kept as a boolean mask over the rows of B and the variable bounds)
     def get_active_constraints(self, x):
         B_x = self.B.dot(x)
-        inds = []
-        for i in range(self.m_B):
-            if self.d[i] - B_x[i] <= EPS:
-                inds.append(i)
         self.x_current = x
         self.B_x_current = B_x
-        self.active_inds = [False] * self.m_B
-        for i in inds:
-            self.active_inds[i] = True
-        return inds   
+        self.active_inds = np.concatenate((self.d - B_x <= EPS, self.has_ub & (self.var_ub - x <= EPS),
+                                           self.has_lb & (x - self.var_lb <= EPS)))
+        return np.flatnonzero(self.active_inds)
+    
+    # slack of the given constraints (sorted indices into the rows of B and the bounds) at x, where B_x = Bx
+    def get_slack(self, inds, x, B_x):
+        rows, bounds = inds[inds < self.m_B], inds[inds >= self.m_B] - self.m_B
+        ub_inds, lb_inds = bounds[bounds < self.n], bounds[bounds >= self.n] - self.n
+        return np.concatenate((self.d[rows] - B_x[rows], self.var_ub[ub_inds] - x[ub_inds],
+                               x[lb_inds] - self.var_lb[lb_inds]))
     
     #given a point x in P with feasible direction g, compute the maximum step size alpha
     def get_max_step_size(self, x, g, active_inds=None, y_pos=None):
-        inds = range(self.m_B)
-        if y_pos is not None:
-            inds = [i for i in range(self.m_B) if y_pos[i] > 0.0]
-        inds = [i for i in inds if i not in active_inds]
+        B_g = y_pos if y_pos is not None else self.B.dot(g)
+        candidates = (np.concatenate((B_g, g, -g)) > EPS) & self.has_constraint
+        if active_inds is not None:
+            candidates[np.asarray(active_inds, dtype=int)] = False
+        inds = np.flatnonzero(candidates)
+        if len(inds) == 0:
+            return float('inf'), None
 
-        alpha = float('inf')
-        active_ind = None
-        for i in inds:
-            B_g_i = y_pos[i] if y_pos is not None else self.B[i].dot(g)
-            if B_g_i <= EPS:
-                continue
-            B_x_i = self.B[i].dot(x)
-            a = (self.d[i] - B_x_i) / float(B_g_i)
-            if a <= alpha:
-                alpha = a 
-                active_ind = i
+        a = self.get_slack(inds, x, self.B.dot(x)) / np.concatenate((B_g, g, -g))[inds]
+        alpha = a.min()
+        # ties are resolved in favor of the last row, as in a sequential scan
+        active_ind = inds[np.flatnonzero(a == alpha)[-1]]
         return alpha, active_ind
     
+    # select the anti-stalling mode of take_maximal_step and the tolerance of the 'perturb' mode, see ANTI_STALLING
+    def set_anti_stalling(self, anti_stalling, perturb_tol=None):
+        if anti_stalling not in ANTI_STALLING:
+            raise ValueError('Unknown anti-stalling mode: {}. Options: {}'.format(anti_stalling,
+                                                                                ', '.join(ANTI_STALLING)))
+        self.anti_stalling = anti_stalling
+        self.perturb_tol = perturb_tol if perturb_tol is not None else PERTURB_TOL
+    
     # use saved information about active facets to compute maximal step size along given direction
     def take_maximal_step(self, g, y_pos, y_neg):
         assert hasattr(self, 'x_current') and hasattr(self, 'active_inds')  
         B_g = y_pos - y_neg
+        # change of the left hand sides of Bx <= d, x <= ub and -x <= -lb along g
+        C_g = np.concatenate((B_g, g, -g))
+        
+        # ratio test over the inactive constraints that the direction moves towards;
+        # all constraints within EPS of the minimum ratio become active. Slacks that rounding made slightly
+        # negative count as 0, so that the step never goes backwards
+        inds = np.flatnonzero((C_g > EPS) & ~self.active_inds & self.has_constraint)
         alpha = float('inf')
-        stopping_inds = []
-        for i in range(self.m_B):
-            B_g_i = B_g[i]
-            if abs(B_g_i) <= EPS: 
-                continue
-            elif B_g_i > 0:
-                if self.active_inds[i]: 
-                    continue
-                a = (self.d[i] - self.B_x_current[i]) / float(B_g_i)
-                if abs(alpha - a) < EPS:
-                    self.active_inds[i] = True
-                    stopping_inds.append(i)
-                elif a < alpha:
-                    alpha = a
-                    for j in stopping_inds:
-                        self.active_inds[j] = False
-                    stopping_inds = [i]
-                    self.active_inds[i] = True
-            elif B_g_i < 0:
-                self.active_inds[i] = False   
+        stopping_inds = inds[:0]
+        if len(inds) > 0:
+            a = np.maximum(self.get_slack(inds, self.x_current, self.B_x_current), 0) / C_g[inds]
+            alpha = a.min()
+            stopping_inds = inds[a - alpha < EPS]
+        leaving_inds = np.flatnonzero((C_g < -EPS) & self.active_inds)
+        self.active_inds[stopping_inds] = True
+        self.active_inds[leaving_inds] = False
+        changed = np.concatenate((stopping_inds, leaving_inds))
         
-        # take step with size alpha
-        if alpha < EPS:
-            print('Degenerate step computed. Changing active facets...')
-            for i in stopping_inds:
-                self.active_inds[i] = True           
-            #raise RuntimeError('Invalid step size: {}'.format(alpha))
+        # the direction is unbounded, so no step is taken
+        if np.isinf(alpha):
+            return self.x_current, alpha, changed
+        
+        # take step with size alpha (degenerate steps with alpha < EPS are counted by the iteration sinks)
         self.x_current += alpha * g
         self.B_x_current += alpha * B_g
+        if self.anti_stalling == 'perturb':
+            changed = np.concatenate((changed, self._shift_near_tight()))
         
-        # return solution, step size, and list of active constraints
-        return self.x_current, alpha, [i for i in range(self.m_B) if self.active_inds[i]]
+        # return solution, step size, and the constraints that entered or left the active set
+        # (the active set itself is self.active_inds)
+        return self.x_current, alpha, changed
+    
+
+    # make the inactive constraints with slack at most perturb_tol at the current point tight and active, by
+    # shifting their right hand sides to the current left hand sides ('perturb' mode, see ANTI_STALLING).
+    # Returns the number of shifted constraints
+    def shift_near_tight(self):
+        return len(self._shift_near_tight())
+    
+    # shift the right hand sides as in shift_near_tight and return the indices of the shifted constraints
+    def _shift_near_tight(self):
+        x, B_x = self.x_current, self.B_x_current
+        slack = np.concatenate((self.d - B_x, self.var_ub - x, x - self.var_lb))
+        shift = (slack <= self.perturb_tol) & ~self.active_inds & self.has_constraint
+        if not shift.any():
+            return np.flatnonzero(shift)
+        if self.unshifted is None:
+            self.unshifted = (self.d, self.var_ub, self.var_lb)
+            self.d, self.var_ub, self.var_lb = np.copy(self.d), np.copy(self.var_ub), np.copy(self.var_lb)
+        rows = np.flatnonzero(shift[:self.m_B])
+        ub_inds = np.flatnonzero(shift[self.m_B:self.m_B + self.n])
+        lb_inds = np.flatnonzero(shift[self.m_B + self.n:])
+        # rounding can leave slightly negative slacks, which are not loosened
+        self.d[rows] = np.minimum(self.d[rows], B_x[rows])
+        self.var_ub[ub_inds] = np.minimum(self.var_ub[ub_inds], x[ub_inds])
+        self.var_lb[lb_inds] = np.maximum(self.var_lb[lb_inds], x[lb_inds])
+        self.active_inds |= shift
+        shifted = np.flatnonzero(shift)
+        self.n_shifts += len(shifted)
+        return shifted
+    
+    def has_shifts(self):
+        return self.unshifted is not None
     
+    # right hand sides (d, var_ub, var_lb) of P without the shifts of the 'perturb' mode
+    def unshifted_rhs(self):
+        return self.unshifted if self.unshifted is not None else (self.d, self.var_ub, self.var_lb)
 
-    # build a gurobi LP for the polyhedron          
-    def build_gurobi_model(self, c=None, verbose=False, method='primal_simplex'):
+    # the shifted right hand sides (d, var_ub, var_lb) and the number of shifts, or None without shifts
+    # (saved with checkpoints and restored by set_shifts)
+    def get_shifts(self):
+        if self.unshifted is None:
+            return None
+        return np.copy(self.d), np.copy(self.var_ub), np.copy(self.var_lb), self.n_shifts
+
+    def set_shifts(self, shifts):
+        self.remove_shifts()
+        if shifts is not None:
+            self.unshifted = (self.d, self.var_ub, self.var_lb)
+            d, ub, lb, self.n_shifts = shifts
+            self.d, self.var_ub, self.var_lb = np.copy(d), np.copy(ub), np.copy(lb)
+
+    # restore the right hand sides shifted by shift_near_tight and recompute the active constraints at the
+    # current point (the shifted constraints stay active only if they are tight). Returns the number of shifts
+    def remove_shifts(self):
+        n_shifts = self.n_shifts
+        if self.unshifted is not None:
+            self.d, self.var_ub, self.var_lb = self.unshifted
+            self.unshifted = None
+            self.get_active_constraints(self.x_current)
+        self.n_shifts = 0
+        return n_shifts
+    
+    # build an LP model for the polyhedron with the selected backend
+    def build_lp_model(self, c=None, verbose=False, method='primal_simplex'):
         if c is None:
             c = self.c
         assert c is not None, 'Provide an objective function'
 
-        self.model = gp.Model()
-        self.x = []
-        for i in range(self.n):
-            self.x.append(self.model.addVar(lb=-INF, ub=INF, name='x_{}'.format(i)))
-        for i in range(self.m_A):
-            self.model.addConstr(gp.LinExpr(self.A[i], self.x) == self.b[i], name='A_{}'.format(i))
-        for i in range(self.m_B):
-            self.model.addConstr(gp.LinExpr(self.B[i], self.x) <= self.d[i], name='B_{}'.format(i))
+        # variables and constraints are added in matrix form (dense or sparse B/A)
+        self.model = make_backend(self.backend)
+        self.x = self.model.add_variables(self.var_lb, self.var_ub)
+        if self.m_A > 0:
+            self.model.add_constraints(self.A, '=', self.b)
+        self.model.add_constraints(self.B, '<', self.d)
             
         self.set_objective(c)     
         self.set_verbose(verbose)
@@ -127,36 +253,33 @@ class Polyhedron:
     def set_objective(self, c):
         self.c = c
         if self.model is not None:
-            self.model.setObjective(gp.LinExpr(self.c, self.x))
+            self.model.set_objective(self.c, self.x)
 
           
     # change model verbose settings
     def set_verbose(self, verbose):
-        flag = 1 if verbose else 0
-        with contextlib.redirect_stdout(None):
-            self.model.setParam(gp.GRB.Param.OutputFlag, flag)
+        self.model.set_verbose(verbose)
             
     # set lp solve method        
     def set_method(self, method):
         self.method = method
-        with contextlib.redirect_stdout(None):
-            self.model.Params.method = METHODS[method]
+        self.model.set_method(method)
                         
     # find a feasible solution in the polyhedron
     def find_feasible_solution(self, verbose=False):
         c_orig = np.copy(self.c)
         c = np.zeros(self.n)
         if self.model is None:
-            self.build_gurobi_model(c, verbose)
+            self.build_lp_model(c, verbose)
         else:
             self.set_objective(c)           
         
         self.model.optimize()
-        if self.model.status != gp.GRB.Status.OPTIMAL:
+        if self.model.status != OPTIMAL:
             raise RuntimeError('Failed to find feasible solution.')        
         
         self.set_objective(c_orig)
-        x_feasible = self.model.getAttr('x', self.x)  
+        x_feasible = self.model.get_values(self.x)  
         return x_feasible
                
     # sovle linear program using the given method
@@ -167,94 +290,112 @@ class Polyhedron:
             c = self.c
          
         if self.model is None:
-            self.build_gurobi_model(c=c)
+            self.build_lp_model(c=c)
         self.set_objective(c)
         self.set_method(method)
-        t0 = time.time()
+        t0 = time.perf_counter()
             
         obj_values = []
         iter_times = []
         iter_counts = []
-        def obj_callback(model, where):
-            if where == gp.GRB.Callback.SIMPLEX:
-                obj = model.cbGet(gp.GRB.Callback.SPX_OBJVAL)
-                obj_values.append(obj)
-                iter_times.append(time.time() - t0)
-                
-                iter_count = model.cbGet(gp.GRB.Callback.SPX_ITRCNT)
-                iter_counts.append(iter_count)
+        def obj_callback(query):
+            obj = query('obj')
+            obj_values.append(obj)
+            iter_times.append(time.perf_counter() - t0)
+            
+            iter_count = query('iter_count')
+            iter_counts.append(iter_count)
                 
         if record_objs:
             self.model.optimize(obj_callback)
         else:
             self.model.optimize()
-        if self.model.status != gp.GRB.Status.OPTIMAL:
+        if self.model.status != OPTIMAL:
             raise RuntimeError('Model failed to solve')
             
-        x_optimal = self.model.getAttr('x', self.x)        
-        obj_optimal = self.model.objVal
-        num_steps = self.model.getAttr('IterCount')
-        #solve_time = self.model.getAttr('Runtime')
-        solve_time = time.time() - t0
+        x_optimal = self.model.get_values(self.x)        
+        obj_optimal = self.model.obj_val
+        num_steps = self.model.iter_count
+        solve_time = time.perf_counter() - t0
         output = result(0, x=x_optimal, obj=obj_optimal, n_iters=num_steps, solve_time=solve_time,
                         iter_times=iter_times, obj_values=obj_values, iter_counts=iter_counts)        
         return output
     
     # warm start the model with the provided solution
-    # (not needed if model already used to find feasible solution)
+    # (not needed if model already used to find feasible solution).
+    # The point is passed to the solver as a start for its next solve, without solving the model
     def set_solution(self, x):
-        for i in range(self.n):
-            self.x[i].lb = x[i]
-            self.x[i].ub = x[i]
-            
-        self.model.optimize()
-        if self.model.status != gp.GRB.Status.OPTIMAL:
-            raise RuntimeError('Failed to find feasible solution.')
-        print('Feasible solution found with objective {}'.format(self.model.objVal))
-        
-        # reset the model to its original state
-        for i in range(self.n):
-            self.x[i].lb = -INF
-            self.x[i].ub = INF
-        c_orig = np.copy(self.c)
-        self.set_objective(np.zeros(self.n))                  
-        self.model.optimize()
-        if self.model.status != gp.GRB.Status.OPTIMAL:
-            raise RuntimeError('Failed to set feasible solution.')                
-        self.set_objective(c_orig)
+        self.model.set_start(x, self.x)
+        print('Warm start set with objective {}'.format(self.c.dot(x)))
         
                 
-    # return normalized circuit given a circuit direction of P
+    # solve min{c^T x : x in P} with the steepest-descent scheme for each row c of C. The feasible
+    # point x (found once if not given) and one circuit model per process are reused for all objectives,
+    # and with n_workers > 1 the objectives are shared between worker processes with the given number
+    # of solver threads. If warm_start is True, the circuit model keeps the basis of the previous objective,
+    # otherwise each objective is solved as in a separate run. Returns a result per objective
+    # (with running totals instead of per-iteration lists)
+    def solve_batch(self, C, x=None, n_workers=1, threads=1, method='dual_simplex', max_time=300,
+                    warm_start=False, verbose=False):
+        if x is None:
+            x = self.find_feasible_solution()
+        C = np.atleast_2d(C)
+        c_orig = self.c
+        if n_workers == 1:
+            _init_batch_worker(self, x, method, max_time, None, warm_start, verbose)
+            results = [_solve_batch_objective(c) for c in C]
+            _batch_state.clear()
+        else:
+            ctx = mp.get_context('spawn')
+            with ctx.Pool(n_workers, initializer=_init_batch_worker,
+                          initargs=(self, x, method, max_time, threads, warm_start, verbose)) as pool:
+                results = pool.map(_solve_batch_objective, list(C), chunksize=1)
+        self.set_objective(c_orig)
+        return results
+    
+    
+    # return normalized circuit given a circuit direction of P: the primitive integer vector with the sign of g
+    # spanning the kernel of A and of the rows of B and bounds that stay tight along g. The kernel is first
+    # computed on the support of g only (entries outside of it are 0). If that fails, it is computed on the
+    # support and the columns without bounds, as the tight bounds of the other columns fix them at 0.
+    # Entries of g and B g are taken as 0 below the tolerances of CIRCUIT_TOLS, which are tried in order
     def get_normalized_circuit(self, g):
         B_g = self.B.dot(g)
-        B_0 = np.zeros((1, self.n), dtype=int)
-        
-        for i in range(self.m_B):
-            if abs(B_g[i]) <= EPS:
-                B_0 = np.concatenate((B_0, self.B[i,:].reshape((1 ,self.n))))
-        if self.A is not None:
-            B_0 = np.concatenate((self.A, B_0), axis=0)
-                
-        D = sympy.Matrix(B_0)
-        ker_D = D.nullspace()
-        #if len(ker_D) != 1:
-        #    raise ValueError('The direction {} is not a circuit of P'.format(g.T))
-        circuit = np.array(ker_D[0]).reshape(self.n)
-        
-        #normalize
-        circuit= circuit*sympy.lcm([circuit[i].q for i in range(self.n) if circuit[i] != 0])
+        for tol in CIRCUIT_TOLS:
+            circuit = self._get_normalized_circuit(g, B_g, tol)
+            if circuit is not None:
+                break
+        else:
+            raise ValueError('The direction is not a circuit of P')
         
         #make sure circuit has correct sign
-        for i in range(self.n):
-            if abs(g[i]) >= EPS:
-                if circuit[i]*g[i] < 0:
-                    circuit = -1*circuit
-                break
+        i = np.argmax(np.abs(g))
+        if (circuit[i] > 0) != (g[i] > 0):
+            circuit = -1*circuit
         return circuit
     
+    def _get_normalized_circuit(self, g, B_g, tol):
+        tight = np.flatnonzero(np.abs(B_g) <= tol)
+        support = np.flatnonzero(np.abs(g) > tol)
+        rows = [self.B[tight]] if self.A is None else [self.A, self.B[tight]]
+        unbounded = np.flatnonzero(~(self.has_lb | self.has_ub) & (np.abs(g) <= tol))
+        for cols in [support] + ([np.union1d(support, unbounded)] if len(unbounded) else []):
+            if len(cols) == 0:
+                continue
+            B_0 = np.concatenate([to_dense(M[:, cols]) for M in rows])
+            kernel = kernel_vector(B_0)
+            if kernel is not None:
+                circuit = np.zeros(self.n, dtype=kernel.dtype)
+                circuit[cols] = kernel
+                return circuit
+        return None
+    
     
-    # add random facets containing the given points well keeping the other given points feasible
+    # add random facets containing the given points well keeping the other given points feasible.
+    # Circuit models built from P before would no longer match its rows, so facets can only be added before
     def add_facets(self, include_point, feasible_points=[], n_facets=1):
+        if self.has_polyhedral_model:
+            raise RuntimeError('Facets must be added before a circuit model of the polyhedron is built')
         if not isinstance(feasible_points, list):
             feasible_points = [feasible_points]
         print('Adding {} facets...'.format(n_facets))
@@ -269,11 +410,42 @@ class Polyhedron:
                 if keep: 
                     break
                     
-            self.B = np.concatenate((self.B, np.expand_dims(row, axis=0)))
+            if sp.issparse(self.B):
+                self.B = sp.vstack((self.B, sp.csr_matrix(row)), format='csr')
+            else:
+                self.B = np.concatenate((self.B, np.expand_dims(row, axis=0)))
             self.d = np.concatenate((self.d, np.array([rhs])))
-            
-            
+            if self.model is not None:
+                self.model.add_constraints(sp.csr_matrix(row), '<', np.array([rhs]))
         
+        # the new rows come before the bounds in the constraint indexing, and the active set is recomputed
+        self.set_constraint_indexing()
+        if hasattr(self, 'x_current'):
+            self.get_active_constraints(self.x_current)
+
+
+# state of a process solving a batch of objectives: the polyhedron, feasible point and circuit model
+_batch_state = {}
+
+
+def _quiet(quiet):
+    return contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext()
+
+
+def _init_batch_worker(P, x, method, max_time, threads, warm_start, verbose):
+    if threads:
+        set_default_threads(threads)
+    with _quiet(not verbose):
+        active_inds = P.get_active_constraints(np.copy(x))
+        pm = P.build_polyhedral_model(active_inds=active_inds, method=method)
+    _batch_state.update({'P': P, 'x': x, 'pm': pm, 'max_time': max_time, 'warm_start': warm_start,
+                         'verbose': verbose})
 
-    
 
+def _solve_batch_objective(c):
+    s = _batch_state
+    if not s['warm_start']:
+        s['pm'].reset()
+    with _quiet(not s['verbose']):
+        return sdac(s['P'], np.copy(s['x']), c=c, method=s['pm'].method, max_time=s['max_time'],
+                    sink=IterationSink(), pm=s['pm'])
@@ -0,0 +1,227 @@
+import numpy as np
+import scipy.sparse as sp
+
+from utils import EPS
+
+# Presolve for linear programs min{c^T x : Bx <= d, Ax = b} as returned by read_mps_preprocess.
+# Each round applies the following reductions until nothing changes:
+#   - empty rows are removed (after checking their right hand side)
+#   - singleton rows of B become bounds of their variable, singleton rows of A fix their variable
+#   - variables with equal bounds are fixed, and empty columns are fixed at their best bound
+#   - fixed variables are substituted into the right hand sides and the objective offset
+#   - rows of B that cannot be violated within the variable bounds are removed
+#   - rows that are positive multiples of another row of B (keeping the tightest) or multiples of
+#     another row of A are removed
+# The remaining bounds are added back to B as one row per finite bound, so that duplicate and
+# dominated bound rows are removed, or returned as vectors lb, ub if bound_rows is False.
+# Postsolve maps solutions of the reduced problem back to x.
+
+
+class Postsolve():
+    def __init__(self, n, cols, fixed_values, obj_offset):
+        self.n = n
+        self.cols = cols
+        self.fixed_values = fixed_values
+        self.obj_offset = obj_offset
+
+    # solution of the original problem for a solution x of the reduced problem
+    def postsolve(self, x):
+        x_full = np.copy(self.fixed_values)
+        x_full[self.cols] = x
+        return x_full
+
+    # objective value of the original problem for an objective value of the reduced problem
+    def postsolve_obj(self, obj):
+        return obj + self.obj_offset
+
+    # map the solution and objective values of a result for the reduced problem back to the original problem
+    def postsolve_result(self, r):
+        if r.x is not None:
+            r.x = self.postsolve(r.x)
+        if r.obj is not None:
+            r.obj = self.postsolve_obj(r.obj)
+        r.obj_values = [self.postsolve_obj(obj) for obj in r.obj_values]
+        # the objective values in the statistics of a steepest-descent run as well
+        if r.stats is not None:
+            if r.stats.get('last_obj') is not None:
+                r.stats['last_obj'] = self.postsolve_obj(r.stats['last_obj'])
+            for key in ('crossover', 'perturbation'):
+                if key in r.stats:
+                    r.stats[key]['sd_obj'] = self.postsolve_obj(r.stats[key]['sd_obj'])
+        return r
+
+
+# remove the given rows from a CSR matrix and rhs vector
+def _remove_rows(M, rhs, remove):
+    keep = ~remove
+    return M[keep], rhs[keep]
+
+
+# keys identifying rows up to scaling: each row is divided by its largest absolute value
+# (signed=False) or by its first nonzero (signed=True)
+def _row_keys(M, signed):
+    keys, scales = [], np.ones(M.shape[0])
+    for i in range(M.shape[0]):
+        start, end = M.indptr[i], M.indptr[i+1]
+        values = M.data[start:end]
+        if len(values) == 0:
+            keys.append((b'', b''))
+            continue
+        scale = values[0] if signed else np.abs(values).max()
+        scales[i] = scale
+        keys.append((M.indices[start:end].tobytes(), np.round(values / scale, 10).tobytes()))
+    return keys, scales
+
+
+# returns the reduced problem (c, B, d, A, b), or (c, B, d, A, b, lb, ub) if bound_rows is False,
+# and a Postsolve object; raises a RuntimeError if the presolve finds that the problem is infeasible
+# or unbounded. Variable bounds lb and ub can be given in addition to the rows of B
+def presolve(c, B, d, A=None, b=None, lb=None, ub=None, max_rounds=100, bound_rows=True):
+    n = len(c)
+    c = np.asarray(c, dtype=float)
+    B = sp.csr_matrix(B, dtype=float, copy=True)
+    d = np.asarray(d, dtype=float)
+    A = sp.csr_matrix(A, dtype=float, copy=True) if A is not None else sp.csr_matrix((0, n))
+    b = np.asarray(b, dtype=float) if b is not None else np.zeros(0)
+    B.eliminate_zeros()
+    A.eliminate_zeros()
+
+    cols = np.arange(n)                     # original index of each remaining column
+    fixed_values = np.zeros(n)
+    lb = np.array(lb, dtype=float) if lb is not None else np.full(n, -np.inf)
+    ub = np.array(ub, dtype=float) if ub is not None else np.full(n, np.inf)
+    obj_offset = 0.0
+
+    for _ in range(max_rounds):
+        m_B, m_A, n_cols = B.shape[0], A.shape[0], len(cols)
+
+        # empty rows
+        B_nnz, A_nnz = np.diff(B.indptr), np.diff(A.indptr)
+        if np.any(d[B_nnz == 0] < -EPS) or np.any(np.abs(b[A_nnz == 0]) > EPS):
+            raise RuntimeError('Presolve: problem is infeasible (empty row)')
+
+        # singleton rows of B become bounds
+        singletons = np.flatnonzero(B_nnz == 1)
+        j, a = B.indices[B.indptr[singletons]], B.data[B.indptr[singletons]]
+        bound = d[singletons] / a
+        np.minimum.at(ub, j[a > 0], bound[a > 0])
+        np.maximum.at(lb, j[a < 0], bound[a < 0])
+        B, d = _remove_rows(B, d, B_nnz <= 1)
+
+        # singleton rows of A fix their variable
+        singletons = np.flatnonzero(A_nnz == 1)
+        j, a = A.indices[A.indptr[singletons]], A.data[A.indptr[singletons]]
+        value = b[singletons] / a
+        np.minimum.at(ub, j, value)
+        np.maximum.at(lb, j, value)
+        A, b = _remove_rows(A, b, A_nnz <= 1)
+        if np.any(lb > ub + EPS):
+            raise RuntimeError('Presolve: problem is infeasible (conflicting bounds)')
+
+        # fix variables with equal bounds, and empty columns at the bound that is best for the objective
+        fixed = np.zeros(n_cols, dtype=bool)
+        values = np.zeros(n_cols)
+        equal = ub - lb <= EPS
+        fixed[equal], values[equal] = True, lb[equal]
+        col_nnz = np.bincount(B.indices, minlength=n_cols) + np.bincount(A.indices, minlength=n_cols)
+        for k in np.flatnonzero((col_nnz == 0) & ~equal):
+            if c[k] > 0 or (c[k] == 0 and np.isfinite(lb[k])):
+                values[k] = lb[k]
+            elif c[k] < 0 or np.isfinite(ub[k]):
+                values[k] = ub[k]
+            if not np.isfinite(values[k]):
+                raise RuntimeError('Presolve: problem is unbounded (empty column)')
+            fixed[k] = True
+
+        # substitute fixed variables
+        if np.any(fixed):
+            v = values[fixed]
+            d = d - B[:, fixed].dot(v)
+            b = b - A[:, fixed].dot(v)
+            obj_offset += c[fixed].dot(v)
+            fixed_values[cols[fixed]] = v
+            keep = ~fixed
+            B, A, c, lb, ub, cols = B[:, keep], A[:, keep], c[keep], lb[keep], ub[keep], cols[keep]
+
+        # rows of B whose largest activity within the bounds satisfies the constraint
+        B_pos, B_neg = B.maximum(0), B.minimum(0)
+        with np.errstate(invalid='ignore'):
+            max_activity = B_pos.dot(np.where(np.isinf(ub), 0, ub)) + B_neg.dot(np.where(np.isinf(lb), 0, lb))
+        unbounded_activity = B_pos.dot(np.isinf(ub).astype(float)) - B_neg.dot(np.isinf(lb).astype(float))
+        B, d = _remove_rows(B, d, (unbounded_activity == 0) & (max_activity <= d + EPS))
+
+        # duplicate rows of B (the row with the smallest scaled rhs is kept)
+        B.sort_indices()
+        keys, scales = _row_keys(B, signed=False)
+        best = {}
+        for i, key in enumerate(keys):
+            if key not in best or d[i] / scales[i] < d[best[key]] / scales[best[key]]:
+                best[key] = i
+        remove = np.ones(B.shape[0], dtype=bool)
+        remove[list(best.values())] = False
+        B, d = _remove_rows(B, d, remove)
+
+        # duplicate rows of A
+        A.sort_indices()
+        keys, scales = _row_keys(A, signed=True)
+        first = {}
+        remove = np.zeros(A.shape[0], dtype=bool)
+        for i, key in enumerate(keys):
+            if key in first:
+                if abs(b[i] / scales[i] - b[first[key]] / scales[first[key]]) > EPS:
+                    raise RuntimeError('Presolve: problem is infeasible (inconsistent equations)')
+                remove[i] = True
+            else:
+                first[key] = i
+        A, b = _remove_rows(A, b, remove)
+
+        if (B.shape[0], A.shape[0], len(cols)) == (m_B, m_A, n_cols):
+            break
+
+    postsolve = Postsolve(n, cols, fixed_values, obj_offset)
+    if not bound_rows:
+        return (c, B, d, A, b, lb, ub), postsolve
+
+    # add the bounds back as rows of B
+    n_cols = len(cols)
+    has_lb, has_ub = np.flatnonzero(np.isfinite(lb)), np.flatnonzero(np.isfinite(ub))
+    n_bounds = len(has_lb) + len(has_ub)
+    bound_rows = sp.csr_matrix((np.concatenate((-np.ones(len(has_lb)), np.ones(len(has_ub)))),
+                                (np.arange(n_bounds), np.concatenate((has_lb, has_ub)))), shape=(n_bounds, n_cols))
+    B = sp.vstack((B, bound_rows), format='csr')
+    d = np.concatenate((d, -lb[has_lb], ub[has_ub]))
+    return (c, B, d, A, b), postsolve
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    import argparse
+    from problem_cache import read_mps_cached
+    parser = argparse.ArgumentParser(description='Report the problem size before and after presolve')
+    parser.add_argument('mps_fns', help='MPS files to presolve', nargs='+')
+    parser.add_argument('--check', help='compare the optimal objective of the original and reduced problems '
+                                        '(solved with scipy linprog)', action='store_true')
+    args = parser.parse_args()
+
+    print('{:<12} {:>7} {:>7} {:>7} {:>7} {:>7} {:>7} {:>9} {:>12}'.format(
+          'problem', 'n', 'm_B', 'm_A', 'n\'', 'm_B\'', 'm_A\'', 'time (s)', 'obj error'))
+    for mps_fn in args.mps_fns:
+        c, B, d, A, b = read_mps_cached(mps_fn)
+        t0 = time.perf_counter()
+        try:
+            (c_r, B_r, d_r, A_r, b_r), ps = presolve(c, B, d, A, b)
+        except RuntimeError as e:
+            print('{:<12} {}'.format(os.path.basename(mps_fn), e))
+            continue
+        presolve_time = time.perf_counter() - t0
+        error = ''
+        if args.check:
+            from scipy.optimize import linprog
+            solve = lambda c, B, d, A, b: linprog(c, A_ub=B, b_ub=d, A_eq=A if A.shape[0] else None,
+                                                  b_eq=b if A.shape[0] else None, bounds=(None, None), method='highs')
+            r, r_reduced = solve(c, B, d, A, b), solve(c_r, B_r, d_r, A_r, b_r)
+            error = '{:.2e}'.format(abs(r.fun - ps.postsolve_obj(r_reduced.fun)) / max(1.0, abs(r.fun)))
+        print('{:<12} {:>7} {:>7} {:>7} {:>7} {:>7} {:>7} {:>9.4f} {:>12}'.format(
+              os.path.basename(mps_fn), len(c), B.shape[0], A.shape[0], len(c_r), B_r.shape[0], A_r.shape[0],
+              presolve_time, error))
@@ -0,0 +1,115 @@
+import os
+import hashlib
+import numpy as np
+import scipy.sparse as sp
+
+from mps_reader_preprocessor import read_mps_preprocess, add_bound_rows
+
+# Cache of parsed MPS files. Each problem is stored in cache_dir/<name>-<hash>/ as .npy arrays
+# (c, d, b, the variable bounds lb and ub and the CSR arrays of B and A, without bound rows), where
+# hash is the sha1 of the MPS file contents and CACHE_VERSION, so edited files and changes to the
+# parser never load stale data. The arrays are memory-mapped when loaded, so parallel workers share
+# the pages of the same problem (the vectors c, d and b are small and loaded into memory). Randomly
+# generated instances are cached by their parameters and seed (see generated_instance).
+
+CACHE_VERSION = b'2'
+CSR_ARRAYS = ['data', 'indices', 'indptr']
+
+
+# sha1 of the file contents (and the cache version)
+def file_hash(filepath):
+    h = hashlib.sha1(CACHE_VERSION)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_path(filepath, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(filepath)), '.cache')
+    name = os.path.basename(filepath).split('.')[0]
+    return os.path.join(cache_dir, '{}-{}'.format(name, file_hash(filepath)))
+
+
+# save the named arrays to path/<name>.npy (written to a temporary directory that is renamed to path)
+def save_arrays(path, arrays):
+    tmp_path = path + '.tmp{}'.format(os.getpid())
+    os.makedirs(tmp_path)
+    for name, v in arrays.items():
+        np.save(os.path.join(tmp_path, name + '.npy'), v)
+    # another process may have written the same arrays in the meantime
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        for fn in os.listdir(tmp_path):
+            os.remove(os.path.join(tmp_path, fn))
+        os.rmdir(tmp_path)
+
+
+def save_problem(path, c, B, d, A, b, lb, ub):
+    arrays = {'c': c, 'd': d, 'b': b, 'lb': lb, 'ub': ub}
+    for name, M in (('B', B), ('A', A)):
+        for array in CSR_ARRAYS:
+            arrays['{}_{}'.format(name, array)] = getattr(M, array)
+        arrays[name + '_shape'] = np.array(M.shape)
+    save_arrays(path, arrays)
+
+
+def load_cached_problem(path, mmap_mode='r'):
+    load = lambda name, mmap_mode=mmap_mode: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+    c, d, b, lb, ub = [load(name, None) for name in ('c', 'd', 'b', 'lb', 'ub')]
+    B, A = [sp.csr_matrix(tuple(load('{}_{}'.format(name, array)) for array in CSR_ARRAYS),
+                          shape=tuple(load(name + '_shape')), copy=False) for name in ('B', 'A')]
+    return c, B, d, A, b, lb, ub
+
+
+# read an MPS file as read_mps_preprocess(filepath, bound_rows=bound_rows) does (with sparse B and A),
+# using the cached arrays if the file was parsed before and adding it to the cache otherwise.
+# The bound rows are added to copies of the cached matrices, so only B and A without bound rows
+# (bound_rows=False) are memory-mapped
+def read_mps_cached(filepath, cache_dir=None, mmap_mode='r', bound_rows=True):
+    path = cache_path(filepath, cache_dir)
+    if not os.path.exists(path):
+        save_problem(path, *read_mps_preprocess(filepath, bound_rows=False))
+    c, B, d, A, b, lb, ub = load_cached_problem(path, mmap_mode=mmap_mode)
+    if bound_rows:
+        B, d, A, b = add_bound_rows(B, d, A, b, lb, ub)
+        return c, B, d, A, b
+    return c, B, d, A, b, lb, ub
+
+
+# named arrays of a random instance (partition polytope or spindle) drawn by generate(rng), a function of a
+# numpy.random.Generator returning a dict of arrays. The arrays of the instance key (generator and parameters)
+# with a given seed are cached in cache_dir/<key>_seed-<seed>-<CACHE_VERSION>/ (by default .cache next to this
+# module), so that they are drawn only once. Without a seed the instance is drawn from fresh entropy and not cached
+def generated_instance(key, seed, generate, cache=True, cache_dir=None):
+    if seed is None or not cache:
+        return generate(np.random.default_rng(seed))
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+    path = os.path.join(cache_dir, '{}_seed-{}-{}'.format(key, seed, CACHE_VERSION.decode()))
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        save_arrays(path, generate(np.random.default_rng(seed)))
+    return {fn[:-len('.npy')]: np.load(os.path.join(path, fn)) for fn in os.listdir(path)}
+
+
+if __name__ == "__main__":
+    import time
+    import argparse
+    parser = argparse.ArgumentParser(description='Parse MPS files into the problem cache and compare load times')
+    parser.add_argument('mps_fns', help='MPS files to cache', nargs='+')
+    parser.add_argument('--cache_dir', help='cache directory (default is .cache next to each MPS file)', default=None)
+    args = parser.parse_args()
+
+    print('{:<12} {:>10} {:>10}'.format('problem', 'parse (s)', 'cache (s)'))
+    for mps_fn in args.mps_fns:
+        t0 = time.perf_counter()
+        read_mps_preprocess(mps_fn)
+        t1 = time.perf_counter()
+        read_mps_cached(mps_fn, args.cache_dir)
+        t2 = time.perf_counter()
+        read_mps_cached(mps_fn, args.cache_dir)
+        t3 = time.perf_counter()
+        print('{:<12} {:>10.4f} {:>10.4f}'.format(os.path.basename(mps_fn), t1 - t0, t3 - t2))
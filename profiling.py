@@ -0,0 +1,82 @@
+import io
+import time
+import pstats
+import cProfile
+import contextlib
+import tracemalloc
+
+# Sections of a steepest-descent iteration timed by the Profiler. The sections are disjoint and
+# 'python_overhead' is the rest of the iteration; the phases are parts of 'oracle_solve'
+SECTIONS = ['ratio_test', 'bound_update', 'oracle_solve', 'oracle_overhead', 'logging', 'python_overhead']
+NESTED_SECTIONS = ['phase1', 'phase2']
+
+
+# accumulates perf_counter timings of the sections of each iteration, with optional
+# cProfile (function level) and tracemalloc (peak memory) hooks around the whole run
+class Profiler():
+    def __init__(self, cprofile=False, trace_memory=False):
+        self.totals = {name: 0.0 for name in SECTIONS + NESTED_SECTIONS}
+        self.counts = {name: 0 for name in SECTIONS + NESTED_SECTIONS}
+        self.iteration = {}
+        self.n_iterations = 0
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self.trace_memory = trace_memory
+        self.peak_memory = None
+
+    def start(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.cprofile is not None:
+            self.cprofile.enable()
+
+    def stop(self):
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        if self.trace_memory and tracemalloc.is_tracing():
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def start_iteration(self):
+        self.iteration = {}
+        self._iteration_start = time.perf_counter()
+
+    # close the current iteration and return its section times (in seconds)
+    def end_iteration(self):
+        total = time.perf_counter() - self._iteration_start
+        measured = sum(t for name, t in self.iteration.items() if name not in NESTED_SECTIONS)
+        self.add('python_overhead', max(total - measured, 0.0))
+        self.n_iterations += 1
+        return self.iteration
+
+    def add(self, name, seconds):
+        self.totals[name] += seconds
+        self.counts[name] += 1
+        self.iteration[name] = self.iteration.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    # table of the total and mean time of each section and its share of the iteration time
+    def summary(self, n_functions=20):
+        total = sum(self.totals[name] for name in SECTIONS)
+        lines = ['{:<18} {:>8} {:>12} {:>12} {:>8}'.format('section', 'calls', 'total (s)', 'mean (ms)', 'share')]
+        for name in SECTIONS + NESTED_SECTIONS:
+            if self.counts[name] == 0:
+                continue
+            label = name if name in SECTIONS else '  ' + name
+            lines.append('{:<18} {:>8} {:>12.4f} {:>12.4f} {:>7.1f}%'.format(
+                         label, self.counts[name], self.totals[name], 1000 * self.totals[name] / self.counts[name],
+                         100 * self.totals[name] / total if total > 0 else 0.0))
+        lines.append('{:<18} {:>8} {:>12.4f}'.format('total', self.n_iterations, total))
+        if self.peak_memory is not None:
+            lines.append('Peak traced memory: {:.3f} MB'.format(self.peak_memory / 2**20))
+        if self.cprofile is not None:
+            s = io.StringIO()
+            pstats.Stats(self.cprofile, stream=s).sort_stats('cumulative').print_stats(n_functions)
+            lines.append(s.getvalue())
+        return '\n'.join(lines)
@@ -0,0 +1,277 @@
+import os
+import re
+import json
+import time
+import pickle
+import sqlite3
+import itertools
+import numpy as np
+
+from utils import result, SD_ALG_TYPES
+
+# SQLite store of the results of many runs. Each run (a simplex or steepest-descent solve of one problem) is a row
+# of the table runs, with its totals and the parameters it was run with, and each of its iterations is a row of the
+# table iterations. Runs from many sweeps and result directories can be appended to one database file (also from
+# parallel worker processes) and aggregated with a single query, without unpickling every result.
+#
+# Iteration i of a steepest-descent (or hybrid) run has the fields of record i of its iteration log (see
+# iteration_log.py): the step to iteration i (for i >= 1) and the oracle solve for the next direction. Iteration i
+# of a simplex run is the i-th solver callback, with the simplex iterations so far in iter_count.
+
+RUN_COLUMNS = [('problem', 'TEXT'), ('alg_type', 'TEXT'), ('sd_method', 'TEXT'), ('backend', 'TEXT'),
+               ('rule', 'TEXT'), ('anti_stalling', 'TEXT'), ('formulation', 'TEXT'), ('crossover', 'TEXT'),
+               ('reset', 'INTEGER'), ('presolve', 'INTEGER'), ('seed', 'INTEGER'), ('max_time', 'REAL'),
+               ('status', 'INTEGER'), ('obj', 'REAL'), ('n_iters', 'INTEGER'), ('total_time', 'REAL'),
+               ('n_solves', 'INTEGER'), ('total_simplex_iters', 'INTEGER'), ('total_solve_time', 'REAL'),
+               ('n_degenerate_steps', 'INTEGER'), ('stats', 'TEXT'), ('params', 'TEXT'), ('log_fn', 'TEXT'),
+               ('source', 'TEXT'), ('created', 'REAL')]
+ITERATION_COLUMNS = [('obj', 'REAL'), ('time', 'REAL'), ('step_size', 'REAL'), ('step_time', 'REAL'),
+                     ('bound_changes', 'INTEGER'), ('steepness', 'REAL'), ('simplex_iters', 'INTEGER'),
+                     ('solve_time', 'REAL'), ('sd_time', 'REAL'), ('iter_count', 'INTEGER')]
+RUN_FIELDS = [name for name, _ in RUN_COLUMNS]
+ITERATION_FIELDS = [name for name, _ in ITERATION_COLUMNS]
+# parameters of a run that are stored in their own columns (any others are kept as json in params)
+PARAM_FIELDS = RUN_FIELDS[:RUN_FIELDS.index('status')]
+# statistics computed by SQLite, and those computed with numpy from the values of each group
+SQL_STATS = {'count': 'COUNT', 'sum': 'SUM', 'mean': 'AVG', 'min': 'MIN', 'max': 'MAX'}
+NUMPY_STATS = {'median': np.median, 'std': np.std}
+STATS = list(SQL_STATS) + list(NUMPY_STATS)
+# aggregation levels: one value per iteration or per run
+LEVELS = ['iteration', 'run']
+
+
+class ResultsStore():
+    def __init__(self, fn, timeout=60):
+        self.fn = fn
+        # parallel writers wait up to timeout seconds for the database lock
+        self.conn = sqlite3.connect(fn, timeout=timeout)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY, {})'.format(
+                ', '.join('{} {}'.format(name, sql_type) for name, sql_type in RUN_COLUMNS)))
+            self.conn.execute('CREATE TABLE IF NOT EXISTS iterations (run_id INTEGER REFERENCES runs(run_id), '
+                              'iteration INTEGER, {})'.format(
+                ', '.join('{} {}'.format(name, sql_type) for name, sql_type in ITERATION_COLUMNS)))
+            self.conn.execute('CREATE INDEX IF NOT EXISTS iterations_run ON iterations (run_id, iteration)')
+
+    def close(self):
+        self.conn.close()
+
+    # append the run res (a result object) and its iterations in one transaction, with the parameters
+    # given as keyword arguments (e.g. problem, sd_method, backend, rule). Returns the run_id
+    def add_run(self, res, source=None, **params):
+        stats = res.stats or {}
+        row = {key: params.pop(key) for key in PARAM_FIELDS if key in params}
+        row.update({'alg_type': res.alg_type, 'status': res.status, 'obj': _to_float(res.obj),
+                    'n_iters': res.n_iters, 'total_time': res.solve_time, 'n_solves': stats.get('n_solves'),
+                    'total_simplex_iters': stats.get('total_simplex_iters'),
+                    'total_solve_time': stats.get('total_solve_time'),
+                    'n_degenerate_steps': stats.get('n_degenerate_steps'),
+                    'stats': json.dumps(stats, default=_to_json) if res.stats is not None else None,
+                    'params': json.dumps(params, default=_to_json) if params else None,
+                    'log_fn': res.log_fn, 'source': source, 'created': time.time()})
+        if res.alg_type in SD_ALG_TYPES and row['n_solves'] is None:
+            row['n_solves'] = len(res.simplex_iters)
+            row['total_simplex_iters'] = int(sum(res.simplex_iters))
+            row['total_solve_time'] = float(sum(res.solve_times))
+        names = list(row)
+        with self.conn:
+            cursor = self.conn.execute('INSERT INTO runs ({}) VALUES ({})'.format(
+                ', '.join(names), ', '.join('?' * len(names))), [row[name] for name in names])
+            run_id = cursor.lastrowid
+            self.conn.executemany('INSERT INTO iterations (run_id, iteration, {}) VALUES ({})'.format(
+                ', '.join(ITERATION_FIELDS), ', '.join('?' * (len(ITERATION_FIELDS) + 2))),
+                ([run_id, i] + [_to_float(record.get(name)) for name in ITERATION_FIELDS]
+                 for i, record in iteration_records(res)))
+        return run_id
+
+    # rows of the runs table (as dicts) whose columns have the given values
+    def runs(self, **filters):
+        where, values = _where(filters)
+        cursor = self.conn.execute('SELECT run_id, {} FROM runs{} ORDER BY run_id'.format(
+            ', '.join(RUN_FIELDS), where), values)
+        names = [col[0] for col in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+    # iterations of a run as a dict of arrays (one per column, nan where a field was not recorded)
+    def iterations(self, run_id):
+        rows = self.conn.execute('SELECT iteration, {} FROM iterations WHERE run_id = ? ORDER BY iteration'.format(
+            ', '.join(ITERATION_FIELDS)), (run_id,)).fetchall()
+        columns = np.array(rows, dtype=float).reshape(len(rows), len(ITERATION_FIELDS) + 1)
+        return dict(zip(['iteration'] + ITERATION_FIELDS, columns.T))
+
+    def has_source(self, source):
+        return self.conn.execute('SELECT 1 FROM runs WHERE source = ?', (source,)).fetchone() is not None
+
+    # stat of metric grouped by the run columns in by, over the runs matching filters. With level 'iteration'
+    # the metric is an iteration column and every iteration is one value, with level 'run' it is a run column.
+    # Returns a list of (group values, stat, number of values) sorted by group
+    def aggregate(self, metric, by=(), stat='mean', level='iteration', **filters):
+        if level not in LEVELS:
+            raise ValueError('Unknown level: {}. Options: {}'.format(level, ', '.join(LEVELS)))
+        if metric not in (ITERATION_FIELDS if level == 'iteration' else RUN_FIELDS):
+            raise ValueError('Unknown {} metric: {}'.format(level, metric))
+        if stat not in STATS:
+            raise ValueError('Unknown statistic: {}. Options: {}'.format(stat, ', '.join(STATS)))
+        for key in by:
+            if key not in RUN_FIELDS:
+                raise ValueError('Unknown run column: {}'.format(key))
+        where, values = _where(filters, prefix='runs.')
+        where += (' AND ' if where else ' WHERE ') + '{}.{} IS NOT NULL'.format(
+            'iterations' if level == 'iteration' else 'runs', metric)
+        tables = 'runs JOIN iterations USING (run_id)' if level == 'iteration' else 'runs'
+        group = ', '.join('runs.' + key for key in by)
+        value = '{}.{}'.format('iterations' if level == 'iteration' else 'runs', metric)
+        if stat in SQL_STATS:
+            query = 'SELECT {}{}({}), COUNT({}) FROM {}{}'.format(group + ', ' if by else '', SQL_STATS[stat],
+                                                                value, value, tables, where)
+            if by:
+                query += ' GROUP BY {0} ORDER BY {0}'.format(group)
+            return [(tuple(row[:len(by)]), row[len(by)], row[len(by) + 1])
+                    for row in self.conn.execute(query, values)]
+        # only the group columns and the values of the metric are read, already sorted by group
+        query = 'SELECT {}{} FROM {}{}'.format(group + ', ' if by else '', value, tables, where)
+        if by:
+            query += ' ORDER BY {}'.format(group)
+        groups = itertools.groupby(self.conn.execute(query, values), key=lambda row: tuple(row[:len(by)]))
+        output = []
+        for key, rows in groups:
+            group_values = np.array([row[-1] for row in rows], dtype=float)
+            output.append((key, float(NUMPY_STATS[stat](group_values)), len(group_values)))
+        return output
+
+    # add the result pickles <prefix>_lp.p and <prefix>_sd.p saved by main.py in results_dir (with the given
+    # parameters), skipping files imported before. The problem, seed and rule are read from the prefix
+    def import_pickles(self, results_dir, **params):
+        n_imported = 0
+        for fn in sorted(os.listdir(results_dir)):
+            match = re.match(r'(.+?)(_s-(\d+))?(_r-(\w+?))?_(lp|sd)\.p$', fn)
+            path = os.path.abspath(os.path.join(results_dir, fn))
+            if match is None or self.has_source(path):
+                continue
+            with open(path, 'rb') as f:
+                saved = pickle.load(f)
+            run_params = {'problem': match.group(1), 'seed': match.group(3),
+                          'rule': match.group(5) or ('steepest' if match.group(6) == 'sd' else None)}
+            run_params.update(params)
+            if match.group(6) == 'lp':
+                for key in ('sd_method', 'rule', 'anti_stalling', 'formulation', 'crossover'):
+                    run_params.pop(key, None)
+            self.add_run(result_from_pickle(saved), source=path, **run_params)
+            n_imported += 1
+        return n_imported
+
+
+# result object of a dict saved by result.save (the status is not saved)
+def result_from_pickle(saved):
+    return result(None, obj=saved['obj'], n_iters=saved['n_iters'], solve_time=saved['solve_time_total'],
+                  iter_times=saved['iter_times'], alg_type=saved['alg_type'], obj_values=saved['obj_values'],
+                  iter_counts=saved['iter_counts'], simplex_iters=saved.get('simplex_iters', []),
+                  solve_times=saved.get('solve_times', []), sub_times=saved.get('sub_times'),
+                  bound_changes=saved.get('bound_changes', []), stats=saved.get('stats'), log_fn=saved.get('log_fn'))
+
+
+# (iteration, record) pairs of a result. Runs streamed to a log file are read from the log, in-memory runs
+# are rebuilt from the lists of the result: obj, time and the solve fields of entry i belong to record i,
+# and the step fields of entry i to record i + 1 (record 0 has no step)
+def iteration_records(res):
+    if res.alg_type not in SD_ALG_TYPES:
+        for i, (obj, t) in enumerate(zip(res.obj_values, res.iter_times)):
+            yield i, {'obj': obj, 'time': t,
+                      'iter_count': res.iter_counts[i] if i < len(res.iter_counts) else None}
+        return
+    if res.log_fn is not None and os.path.exists(res.log_fn):
+        with open(res.log_fn) as f:
+            for line in f:
+                record = json.loads(line)
+                yield record['iteration'], record
+        return
+    sub_times = res.sub_times or {}
+    solve_fields = {'obj': res.obj_values, 'time': res.iter_times, 'simplex_iters': res.simplex_iters,
+                    'solve_time': res.solve_times, 'sd_time': sub_times.get('sd', [])}
+    step_fields = {'step_size': res.steps, 'step_time': sub_times.get('step', []),
+                   'bound_changes': res.bound_changes}
+    n_records = max([len(v) for v in solve_fields.values()] + [len(v) + 1 for v in step_fields.values()])
+    for i in range(n_records):
+        record = {key: v[i] for key, v in solve_fields.items() if i < len(v)}
+        record.update({key: v[i - 1] for key, v in step_fields.items() if 0 < i <= len(v)})
+        yield i, record
+
+
+def _where(filters, prefix=''):
+    for key in filters:
+        if key not in RUN_FIELDS and key != 'run_id':
+            raise ValueError('Unknown run column: {}'.format(key))
+    if not filters:
+        return '', []
+    return ' WHERE ' + ' AND '.join('{}{} = ?'.format(prefix, key) for key in filters), list(filters.values())
+
+
+def _to_float(value):
+    if isinstance(value, (np.integer, np.floating)):
+        return value.item()
+    return value
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (np.integer, np.floating)):
+        return value.item()
+    raise TypeError('Cannot serialize {}'.format(type(value).__name__))
+
+
+# parse key=value arguments of the command line into a dict
+def _parse_pairs(pairs):
+    output = {}
+    for pair in pairs:
+        if '=' not in pair:
+            raise ValueError('Expected key=value, got: {}'.format(pair))
+        key, value = pair.split('=', 1)
+        output[key] = value
+    return output
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Import results into a results database and aggregate them')
+    parser.add_argument('db', help='SQLite database file of the results')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help='add the result pickles of results directories')
+    import_parser.add_argument('results_dirs', help='directories of _lp.p and _sd.p files saved by main.py', nargs='+')
+    import_parser.add_argument('--set', help='parameter of the imported runs (e.g. sd_method=dual_simplex, '
+                                             'backend=highs), since the pickles do not record them',
+                               nargs='*', default=[])
+    runs_parser = subparsers.add_parser('runs', help='list the runs')
+    aggregate_parser = subparsers.add_parser('aggregate', help='statistic of a metric grouped by run columns')
+    aggregate_parser.add_argument('--metric', help='iteration column ({}) or, with --level run, run column'.format(
+                                      ', '.join(ITERATION_FIELDS)), default='solve_time')
+    aggregate_parser.add_argument('--by', help='run columns to group by (e.g. sd_method problem)', nargs='*',
+                                  default=[])
+    aggregate_parser.add_argument('--stat', help='statistic of each group', choices=STATS, default='median')
+    aggregate_parser.add_argument('--level', help='aggregate over iterations or over runs', choices=LEVELS,
+                                  default='iteration')
+    for subparser in (runs_parser, aggregate_parser):
+        subparser.add_argument('--where', help='only runs with these column values (e.g. backend=highs)',
+                               nargs='*', default=[])
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db)
+    if args.command == 'import':
+        for results_dir in args.results_dirs:
+            n_imported = store.import_pickles(results_dir, **_parse_pairs(args.set))
+            print('Imported {} results from {}'.format(n_imported, results_dir))
+    elif args.command == 'runs':
+        columns = ['run_id', 'problem', 'alg_type', 'sd_method', 'backend', 'rule', 'status', 'obj', 'n_iters',
+                   'total_time']
+        print(' '.join('{:>16}'.format(column) for column in columns))
+        for run in store.runs(**_parse_pairs(args.where)):
+            print(' '.join('{:>16.6g}'.format(run[column]) if isinstance(run[column], float)
+                           else '{:>16}'.format(str(run[column])) for column in columns))
+    else:
+        rows = store.aggregate(args.metric, by=args.by, stat=args.stat, level=args.level,
+                               **_parse_pairs(args.where))
+        print(' '.join('{:>16}'.format(column) for column in args.by + [args.stat + ' ' + args.metric, 'count']))
+        for key, value, count in rows:
+            print(' '.join('{:>16}'.format(str(v)) for v in key) + ' {:>16.6g} {:>16}'.format(value, count))
+    store.close()
@@ -0,0 +1,147 @@
+import os
+import csv
+import time
+import contextlib
+import traceback
+import multiprocessing as mp
+
+PROBLEM_DIR = 'netlib_lp_subset'
+
+FIELDS = ['problem', 'status', 'exitcode', 'n', 'm_B', 'm_A',
+          'lp_obj', 'lp_iters', 'lp_time',
+          'sd_obj', 'sd_iters', 'sd_time', 'sd_simplex_iters', 'sd_oracle_time',
+          'wall_time', 'error']
+
+
+# runs main.main on one MPS file inside a worker process and sends a summary row back through conn.
+# All output of the run is written to log_fn
+def run_problem(conn, mps_fn, log_fn, threads, main_kwargs):
+    row = {'problem': os.path.basename(mps_fn)}
+    with open(log_fn, 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            from lp_backend import set_default_threads
+            from main import main
+            if threads:
+                set_default_threads(threads)
+            P, lp_result, sd_result = main(mps_fn=mps_fn, **main_kwargs)
+            row.update({'n': P.n, 'm_B': P.m_B, 'm_A': P.m_A,
+                        'lp_obj': lp_result.obj, 'lp_iters': lp_result.n_iters, 'lp_time': lp_result.solve_time})
+            if sd_result.status == 0:
+                row.update({'status': 'optimal', 'sd_obj': sd_result.obj, 'sd_iters': sd_result.n_iters,
+                            'sd_time': sd_result.solve_time, 'sd_simplex_iters': sd_result.stats['total_simplex_iters'],
+                            'sd_oracle_time': sd_result.stats['total_solve_time']})
+            else:
+                row['status'] = 'unbounded' if sd_result.status == 1 else 'time_limit'
+        except Exception as e:
+            traceback.print_exc()
+            row.update({'status': 'error', 'error': '{}: {}'.format(type(e).__name__, e)})
+    conn.send(row)
+    conn.close()
+
+
+# run main.main on each MPS file in a separate process, with at most n_workers processes at a time.
+# Each process is killed if it runs longer than timeout seconds, and a crash of one process
+# only affects the row of its own problem. Returns one summary row per problem.
+def run_tests(mps_fns, n_workers=1, threads=1, timeout=None, log_dir='logs', **main_kwargs):
+    if not os.path.exists(log_dir): os.makedirs(log_dir)
+    ctx = mp.get_context('spawn')
+
+    # start the largest problems first so that the slowest runs overlap with the others
+    pending = sorted(mps_fns, key=os.path.getsize, reverse=True)
+    running = []
+    rows = {}
+    while pending or running:
+        while pending and len(running) < n_workers:
+            mps_fn = pending.pop(0)
+            problem = os.path.basename(mps_fn)
+            log_fn = os.path.join(log_dir, problem + '.log')
+            recv_conn, send_conn = ctx.Pipe(duplex=False)
+            p = ctx.Process(target=run_problem, args=(send_conn, mps_fn, log_fn, threads, main_kwargs))
+            p.start()
+            send_conn.close()
+            running.append((problem, p, recv_conn, time.time()))
+            print('Started {} ({} running, {} pending)'.format(problem, len(running), len(pending)))
+
+        still_running = []
+        for problem, p, conn, t0 in running:
+            row = None
+            if conn.poll():
+                try:
+                    row = conn.recv()
+                except EOFError:
+                    row = {'problem': problem, 'status': 'crashed'}
+            elif not p.is_alive():
+                row = {'problem': problem, 'status': 'crashed'}
+            elif timeout is not None and time.time() - t0 > timeout:
+                p.kill()
+                row = {'problem': problem, 'status': 'timeout'}
+
+            if row is None:
+                still_running.append((problem, p, conn, t0))
+                continue
+            p.join()
+            conn.close()
+            row['exitcode'] = p.exitcode
+            row['wall_time'] = time.time() - t0
+            rows[problem] = row
+            print('Finished {}: {} ({:.1f}s)'.format(problem, row['status'], row['wall_time']))
+        running = still_running
+        time.sleep(0.05)
+
+    return [rows[os.path.basename(mps_fn)] for mps_fn in mps_fns]
+
+
+# write summary rows as a csv table
+def save_table(rows, fn):
+    with open(fn, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Run the simplex method and steepest descent on a set of '
+                                                 'MPS files in parallel worker processes')
+    parser.add_argument('mps_fns', help='MPS files to solve (default is every problem in problem_dir)', nargs='*')
+    parser.add_argument('--problem_dir', help='directory of MPS files used if none are given', default=PROBLEM_DIR)
+    parser.add_argument('--workers', help='number of worker processes', type=int, default=os.cpu_count())
+    parser.add_argument('--threads', help='solver threads per worker process', type=int, default=1)
+    parser.add_argument('--timeout', help='wall time limit in seconds for each problem (the worker is killed)',
+                        type=float, default=None)
+    parser.add_argument('--out', help='csv file for the summary table (default is results_dir/summary.csv)')
+
+    parser.add_argument('--sd_method', help='algorithm for computing s.d. directions', type=str, default='dual_simplex')
+    parser.add_argument('--reset', help='reset polyhedral model at each iteration (no warm starts)', action='store_true')
+    parser.add_argument('--backend', help='LP solver used for all models (gurobi or highs)', type=str, default='gurobi')
+    parser.add_argument('--results_dir', help='directory for saving results', default='results')
+    parser.add_argument('--max_time', help='max time for steepest descent algorithm in seconds', type=float, default=300)
+    parser.add_argument('--presolve', help='run steepest descent on the presolved problems', action='store_true')
+    parser.add_argument('--bound_rows', help='add the variable bounds as rows of B', action='store_true')
+    parser.add_argument('--no_cache', help='parse the MPS files instead of loading them from the problem cache',
+                        action='store_true')
+    parser.add_argument('--stream_log', help='stream s.d. iterations to results_dir instead of keeping them in memory',
+                        action='store_true')
+    parser.add_argument('--circuit_format', help='how to save circuits in the streamed log',
+                        choices=['none', 'dense', 'sparse'], default='none')
+    parser.add_argument('--normalize_circuits', help='record the circuits as primitive integer vectors',
+                        action='store_true')
+    parser.add_argument('--results_db', help='also append every run to this SQLite results database '
+                                             '(see results_store.py)', default=None)
+    args = parser.parse_args()
+
+    mps_fns = args.mps_fns or [os.path.join(args.problem_dir, fn) for fn in sorted(os.listdir(args.problem_dir))
+                               if not fn.startswith('.')]
+    if not os.path.exists(args.results_dir): os.makedirs(args.results_dir)
+    t0 = time.time()
+    rows = run_tests(mps_fns, n_workers=args.workers, threads=args.threads, timeout=args.timeout,
+                     log_dir=os.path.join(args.results_dir, 'logs'),
+                     results_dir=args.results_dir, max_time=args.max_time, sd_method=args.sd_method,
+                     reset=args.reset, backend=args.backend,
+                     stream_log=args.stream_log, circuit_format=args.circuit_format,
+                     normalize_circuits=args.normalize_circuits, cache=not args.no_cache,
+                     bound_rows=args.bound_rows, presolve=args.presolve, results_db=args.results_db)
+    out = args.out or os.path.join(args.results_dir, 'summary.csv')
+    save_table(rows, out)
+    print('Solved {} problems in {:.1f}s. Summary saved to {}'.format(len(rows), time.time() - t0, out))
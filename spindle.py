@@ -3,78 +3,84 @@ from utils import EPS
 
 from polyhedron import Polyhedron
 
-# constructs a bounded/fixed-size partition polytope with the given parameters
-# n is number of items,  k is the number of clusters,
-# ub are cluster size upper bounds, and lb are cluster size lower bounds
+# maximum number of entries of a batch of random rows drawn when generating facets
+MAX_BATCH_ENTRIES = 2**22
+
+# constructs a spindle in R^n, the intersection of two cones with apexes p1 = 0 and p2 = 1 with n_cone_facets
+# random facets each, and n_parallel_facets random pairs of parallel facets. The facets are drawn with the
+# numpy.random.Generator (or seed) rng, or given as facets = (B, d) (see spindle_facets)
 class Spindle(Polyhedron):
-    def __init__(self, n, n_cone_facets, n_parallel_facets, c=None):
+    def __init__(self, n, n_cone_facets, n_parallel_facets, c=None, backend='gurobi', rng=None, facets=None):
         
         self.n = n
         self.n_cone_facets = n_cone_facets
         self.n_parallel_facets = n_parallel_facets
-        self.B = []
-        self.d = []
 
         # two points in R^n used to define the spindle
         self.p1 = np.zeros(n)
         self.p2 = np.ones(n)
         self.c = self.p1 - self.p2
 
-        # add facets containing p1 that do not contain p2
-        for _ in range(self.n_cone_facets):
-            row = np.random.randint(-100, 25, size=self.n)
-            rhs = row.dot(self.p1)
-            while row.dot(self.p2) >= rhs:
-                row = np.random.randint(-100, 25, size=self.n)   
-                rhs = row.dot(self.p1)
-            self.B.append(row)
-            self.d.append(rhs)
-            assert row.dot(self.p2) < rhs
-            
-        # add facets containing p2 that do not contain p1
-        for _ in range(self.n_cone_facets):
-            row = np.random.randint(-25, 100, size=self.n)
-            rhs = row.dot(self.p2)
-            while row.dot(self.p1) >= rhs:
-                row = np.random.randint(-25, 100, size=self.n)   
-                rhs = row.dot(self.p2)
-            self.B.append(row)
-            self.d.append(rhs)
-            assert row.dot(self.p1) < rhs
-            
-        # add parallel facets that don't contain p1 or p2 but contain other points of the unit cube
-        for _ in range(self.n_parallel_facets):
-            row = np.random.randint(-10, 10, size=self.n)
-            point = np.random.randint(0, 2, size=self.n)
-            rhs = row.dot(point)
-            while row.dot(self.p1) >= rhs or row.dot(self.p2) >= rhs:
-                row = np.random.randint(-10, 10, size=self.n)
-                point = np.random.randint(0, 2, size=self.n)
-                rhs = row.dot(point)
-            self.B.append(row)
-            self.d.append(rhs)
-            row2 = -1*row
-            rhs2 = row2.dot(np.ones(self.n) - point)
-            assert row2.dot(self.p1) < rhs2 and row2.dot(self.p2) < rhs2
-            self.B.append(row2)
-            self.d.append(rhs2)      
-
-        self.B = np.asarray(self.B, dtype=np.int16)
-        self.d = np.asarray(self.d, dtype=np.int16)        
-        super(Spindle, self).__init__(self.B, self.d, A=None, b=None, c=self.c)
+        if facets is None:
+            facets = spindle_facets(n, n_cone_facets, n_parallel_facets, np.random.default_rng(rng))
+        self.B, self.d = facets
+        super(Spindle, self).__init__(self.B, self.d, A=None, b=None, c=self.c, backend=backend)
 
     def find_feasible_solution(self, verbose=False):
-        self.x_current = self.p1
+        self.x_current = np.copy(self.p1)
         self.B_x_current = self.B.dot(self.x_current)
         return self.x_current
     
     def get_active_constraints(self, x_current=None):
         if x_current is not None: self.x_current = x_current
         if np.array_equal(self.x_current, self.p1):
-            inds = list(range(self.n_cone_facets))
-            self.active_inds = [False]*self.m_B
-            for i in inds:
-                self.active_inds[i] = True
+            inds = np.arange(self.n_cone_facets)
+            self.active_inds = np.zeros(self.n_constraints, dtype=bool)
+            self.active_inds[inds] = True
             return inds
         else:
-            return super(Spindle, self).get_active_constraints(x_current)
\ No newline at end of file
+            return super(Spindle, self).get_active_constraints(x_current)
+
+
+# draws n_rows samples with sample(size), which returns a tuple of arrays with size rows of length n, in
+# batches until accept (a mask of the rows of such a tuple) holds for n_rows of them. The batch size follows
+# the acceptance rate so far, and batches have at most MAX_BATCH_ENTRIES entries
+def _rejection_sample(sample, accept, n_rows, n):
+    batches = []
+    n_accepted = n_drawn = 0
+    while not batches or n_accepted < n_rows:
+        rate = max(n_accepted, 1) / max(n_drawn, 1)
+        size = min(int(1.5*(n_rows - n_accepted)/rate) + 1, max(MAX_BATCH_ENTRIES // max(n, 1), 1))
+        arrays = sample(size if n_rows > 0 else 0)
+        mask = accept(*arrays)
+        batches.append(tuple(array[mask] for array in arrays))
+        n_accepted += np.count_nonzero(mask)
+        n_drawn += size
+    return tuple(np.concatenate(arrays)[:n_rows] for arrays in zip(*batches))
+
+
+# random facets (B, d) of a spindle in R^n with apexes p1 = 0 and p2 = 1: n_cone_facets facets containing p1
+# but not p2, n_cone_facets facets containing p2 but not p1, and n_parallel_facets pairs of parallel facets
+# containing neither (but other points of the unit cube). Rows are drawn in batches with the numpy.random.Generator rng
+def spindle_facets(n, n_cone_facets, n_parallel_facets, rng):
+    # row.p1 = 0 is the right-hand side of the facets containing p1 and row.p2 = sum(row) of those containing p2
+    B1, = _rejection_sample(lambda size: (rng.integers(-100, 25, size=(size, n), dtype=np.int8),),
+                            lambda rows: rows.sum(axis=1, dtype=np.int64) < 0, n_cone_facets, n)
+    B2, = _rejection_sample(lambda size: (rng.integers(-25, 100, size=(size, n), dtype=np.int8),),
+                            lambda rows: rows.sum(axis=1, dtype=np.int64) > 0, n_cone_facets, n)
+    # parallel facets row.x <= row.point with row.p1 = 0 < row.point and row.p2 < row.point
+    def parallel_facet(rows, points):
+        return ((np.einsum('ij,ij->i', rows, points, dtype=np.int64) > 0)
+                & (np.einsum('ij,ij->i', rows, 1 - points, dtype=np.int64) < 0))
+    B3, points = _rejection_sample(lambda size: (rng.integers(-10, 10, size=(size, n), dtype=np.int8),
+                                                 rng.integers(0, 2, size=(size, n), dtype=np.int8)),
+                                   parallel_facet, n_parallel_facets, n)
+    B1, B2, B3 = [M.astype(np.int64) for M in (B1, B2, B3)]
+    d3 = np.einsum('ij,ij->i', B3, points)
+    
+    # each parallel facet row.x <= row.point is followed by -row.x <= -row.(1 - point)
+    B = np.concatenate((B1, B2, np.stack((B3, -B3), axis=1).reshape(-1, n)))
+    d = np.concatenate((np.zeros(n_cone_facets, dtype=np.int64), B2.sum(axis=1),
+                        np.column_stack((d3, d3 - B3.sum(axis=1))).ravel()))
+    assert np.all(d >= 0) and np.all(B.sum(axis=1) <= d)
+    return B.astype(np.int16), d.astype(np.int64)
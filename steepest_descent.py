@@ -1,108 +1,348 @@
+import os
 import math
 import time
+import pickle
+import collections
 import numpy as np
 
 from utils import result, EPS
+from iteration_log import MemorySink
+from profiling import Profiler
+from augmentation_rules import make_rule
+
+
+# write a checkpoint of a steepest-descent run (the file is replaced atomically,
+# so an interrupted write leaves the previous checkpoint intact)
+def save_checkpoint(fn, checkpoint):
+    with open(fn + '.tmp', 'wb') as f:
+        pickle.dump(checkpoint, f)
+    os.replace(fn + '.tmp', fn)
+
+
+def load_checkpoint(fn):
+    with open(fn, 'rb') as f:
+        return pickle.load(f)
+
+
+# triggers of the hybrid mode, which hands the run over to the simplex method once the steepest-descent steps
+# stop paying off, with their default thresholds: the steepness drops below threshold times the first steepness,
+# the relative objective improvement over the last CROSSOVER_WINDOW steps drops below threshold, the last
+# CROSSOVER_WINDOW steps are all shorter (in Euclidean length) than threshold times the longest step so far,
+# or the run used threshold times max_time
+CROSSOVER_THRESHOLDS = {'steepness': 1e-3, 'improvement': 1e-4, 'step_length': 1e-3, 'time_share': 0.5}
+CROSSOVER_WINDOW = 10
+
+
+# decides after each step whether the hybrid mode switches to the simplex method (see CROSSOVER_THRESHOLDS)
+class CrossoverTrigger():
+    def __init__(self, trigger, threshold=None, max_time=300):
+        if trigger not in CROSSOVER_THRESHOLDS:
+            raise ValueError('Unknown crossover trigger: {}'.format(trigger))
+        self.trigger = trigger
+        self.threshold = threshold if threshold is not None else CROSSOVER_THRESHOLDS[trigger]
+        self.max_time = max_time
+        self.first_steepness = None
+        self.longest_step = 0.0
+        self.objs = collections.deque(maxlen=CROSSOVER_WINDOW + 1)
+        self.step_lengths = collections.deque(maxlen=CROSSOVER_WINDOW)
+    
+    # objective and steepness of the first oracle solve
+    def start(self, obj, steepness):
+        self.first_steepness = abs(steepness)
+        self.objs.append(obj)
+    
+    # whether to switch after a step of the given Euclidean length to a point with objective obj and the
+    # given steepness of its next direction, elapsed seconds into the run
+    def fires(self, obj, steepness, step_length, elapsed):
+        self.objs.append(obj)
+        self.step_lengths.append(step_length)
+        self.longest_step = max(self.longest_step, step_length)
+        if self.trigger == 'steepness':
+            return abs(steepness) < self.threshold * self.first_steepness
+        if self.trigger == 'improvement':
+            return (len(self.objs) > CROSSOVER_WINDOW
+                    and self.objs[0] - self.objs[-1] < self.threshold * max(abs(self.objs[-1]), 1))
+        if self.trigger == 'step_length':
+            return (len(self.step_lengths) == CROSSOVER_WINDOW
+                    and max(self.step_lengths) < self.threshold * self.longest_step)
+        return elapsed > self.threshold * self.max_time
+
+
+# finish the solve of min{c^T x : x in P} with the simplex method of the LP model of P, started from the
+# point x reached by steepest descent (the solver pushes it to a basis, so its tight constraints, the
+# active set, become the starting basis). The model is reset first, so no basis of an earlier solve is reused
+def simplex_crossover(P, x):
+    if P.model is None:
+        P.build_lp_model(c=P.c)
+    P.model.reset()
+    P.set_solution(x)
+    return P.solve_lp(record_objs=False)
+
 
 def steepest_descent_augmentation_scheme(P, x, c=None, verbose=False, method='dual_simplex', reset=False,
                                          max_time=300, first_warm_start=None,
-                                         save_first_steps=0, problem_name=''):
+                                         save_first_steps=0, problem_name='', sink=None,
+                                         checkpoint_fn=None, checkpoint_interval=None, resume=None,
+                                         profiler=None, phase_mode='off', pm=None, primal='auto',
+                                         normalize_circuits=False, crossover='off', crossover_threshold=None,
+                                         rule='steepest', anti_stalling='off', perturb_tol=None):
     """
 Given a polyhedron P with feasible point x and an objective function c,
 solve the linear program min{c^T x : x in P} via the steepest descent circuit augmentation scheme.
 Returns result object containing optimal solution, objective objective, solve time, and other stats.
+Per-iteration records are written to sink (an iteration_log sink, by default a MemorySink
+that keeps them in memory, with only the last circuit); use MemorySink(keep_circuits=True) for the
+circuits of all steps, or a FileSink to stream the records and circuits to disk instead.
+If checkpoint_fn is given, the current point, active set, basis of the polyhedral model and
+accumulated stats are saved there every checkpoint_interval seconds and when max_time is reached.
+A run continues from a checkpoint loaded with load_checkpoint if it is passed as resume
+(x is then ignored, and max_time includes the time spent before the checkpoint).
+The time of each iteration is split into sections by a profiling.Profiler; if one is passed as
+profiler, its cProfile/tracemalloc hooks run around the loop and each record includes the sections.
+The phase-1/phase-2 split of the oracle solves is only measured if phase_mode is 'sampled' or 'full'.
+A circuit model pm of P built for an earlier run can be reused; it is then warm started from its last basis.
+pm can also be another direction oracle with the same interface (e.g. PartitionPolytope.build_exchange_oracle()).
+Otherwise the primal or dual circuit model is built as chosen by primal (True, False or 'auto', see
+Polyhedron.build_polyhedral_model).
+If normalize_circuits is True, the circuits are recorded as primitive integer vectors
+(see Polyhedron.get_normalized_circuit), which is timed as part of the logging section.
+With crossover set to a trigger of CROSSOVER_THRESHOLDS (hybrid mode), the run switches to the simplex
+method from the current point once the trigger fires (with crossover_threshold, or the default threshold).
+The result then has the optimum found by simplex and alg_type 'hybrid' (n_iters counts the circuit steps), and
+stats['crossover'] describes the switch, with the simplex iterations and time.
+rule is the circuit augmentation rule (a name of augmentation_rules.AUGMENTATION_RULES or an AugmentationRule)
+that chooses the norm of the circuit model before each oracle call; updating the norm is timed as part of
+the bound_update section. Rules other than steepest descent need the circuit model as pm.
+anti_stalling selects the anti-stalling mode of the ratio test (see polyhedron.ANTI_STALLING), with the
+tolerance perturb_tol of the 'perturb' mode (default polyhedron.PERTURB_TOL). When a perturbed run converges,
+the shifted right hand sides are restored and the simplex method finishes the solve from the current point
+(as simplex codes clean up after removing a perturbation). Such runs have alg_type 'hybrid': n_iters counts
+the circuit steps, and stats['perturbation'] has the simplex iterations and time of the clean-up.
+Degenerate steps are counted in stats['n_degenerate_steps'] with the oracle time after them.
     """
     
     if c is not None:
         P.set_objective(c)
+    P.set_anti_stalling(anti_stalling, perturb_tol)
+ 
+    if resume is not None:
+        if not (np.array_equal(resume['c'], P.c) and np.array_equal(resume['d'], P.d)
+                and np.array_equal(resume['lb'], P.var_lb) and np.array_equal(resume['ub'], P.var_ub)):
+            raise RuntimeError('Checkpoint was saved for a different problem')
+        x = np.copy(resume['x'])
+        print('Resuming from iteration {}'.format(resume['iteration']))
  
-    t0 = time.time()
+    t0 = time.perf_counter()
     x_current = x
     if save_first_steps:
         np.save('solutions/{}_0.npy'.format(problem_name), x_current)      
     active_inds = P.get_active_constraints(x_current)
+    if resume is not None:
+        # the active set after a ratio test can differ from the rows that are tight at x, and it includes the
+        # constraints shifted by the 'perturb' mode, whose shifts are restored as well
+        P.set_shifts(resume.get('shifts'))
+        P.active_inds[:] = resume['active_mask'].tolist()
+        active_inds = np.flatnonzero(resume['active_mask'])
     
-    pm = P.build_polyhedral_model(active_inds=active_inds, method=method)
+    if isinstance(rule, str):
+        rule = make_rule(rule)
+    if pm is None:
+        pm = P.build_polyhedral_model(active_inds=active_inds, method=method, phase_mode=phase_mode, primal=primal,
+                                      split_all=rule.split_all)
+    else:
+        if rule.name != 'steepest' and not hasattr(pm, 'set_norm_weights'):
+            raise ValueError('The {} rule needs the circuit model as direction oracle'.format(rule.name))
+        if rule.split_all and not pm.split_all:
+            raise ValueError('The {} rule needs a circuit model built with split_all=True'.format(rule.name))
+        pm.set_objective(P.c)
+        pm.set_active_inds(active_inds)
     if first_warm_start is not None:
         print('Using custom warm start')
         pm.set_solution(first_warm_start)
-    t1 = time.time()
+    if (resume is not None and resume['basis'] is not None and resume['backend'] == P.backend
+            and resume['primal'] == pm.primal):
+        pm.model.set_basis(*resume['basis'])
+    t1 = time.perf_counter()
     build_time = t1 - t0
     print('Polyhedral model build time: {}'.format(build_time))
     
-    sub_times = {'sd': [], 'step': [], 'solve': [], 'phase_times': []}    
-    descent_circuits = []
-    obj_values = []
-    step_sizes = []
-    iter_times = []
-    simplex_iters = []
+    trigger = CrossoverTrigger(crossover, crossover_threshold, max_time) if crossover != 'off' else None
+    if sink is None:
+        sink = MemorySink()
+    record_profile = profiler is not None
+    if profiler is None:
+        profiler = Profiler()
     iteration = 0
+    if resume is not None:
+        sink.set_state(resume['sink'])
+        iteration = resume['iteration']
+        t1 -= resume['elapsed']
+    
+    # save everything needed to continue the run after the given iteration. The checkpoint has the right hand
+    # sides of the problem, and the shifts of the 'perturb' mode separately, as the active set includes the
+    # shifted constraints
+    def write_checkpoint(iteration, elapsed):
+        d, ub, lb = P.unshifted_rhs()
+        save_checkpoint(checkpoint_fn, {'iteration': iteration, 'elapsed': elapsed, 'x': np.copy(x_current),
+                                        'active_mask': np.asarray(P.active_inds, dtype=bool),
+                                        'basis': pm.model.get_basis() if pm.model is not None else None,
+                                        'backend': P.backend, 'primal': pm.primal,
+                                        'c': P.c, 'd': d, 'lb': lb, 'ub': ub, 'shifts': P.get_shifts(),
+                                        'sink': sink.get_state()})
+        print('Checkpoint saved to {}'.format(checkpoint_fn))
+    
+    # set the norm of the circuit model at the current point as chosen by the augmentation rule
+    def update_norm():
+        with profiler.timer('bound_update'):
+            weights = rule.norm_weights(P, pm, x_current)
+            if weights is not None:
+                pm.set_norm_weights(weights)
+    
+    # compute the steepest-descent direction and time the solve, the rest of the oracle call and the phases
+    def compute_sd_direction():
+        t = time.perf_counter()
+        output = pm.compute_sd_direction(verbose=verbose)
+        solve_time, phase_times = output[5], output[6]
+        profiler.add('oracle_solve', solve_time)
+        profiler.add('oracle_overhead', max(time.perf_counter() - t - solve_time, 0.0))
+        if phase_times[0] is not None:
+            profiler.add('phase1', phase_times[0])
+            profiler.add('phase2', phase_times[1])
+        return output
+    
+    # write the record of an iteration with the section times of the profiler
+    def write_record(record):
+        with profiler.timer('logging'):
+            if normalize_circuits and record.get('circuit') is not None:
+                record['circuit'] = P.get_normalized_circuit(record['circuit'])
+            if record_profile:
+                record['profile'] = dict(profiler.iteration)
+            sink.write(record)
+    
+    profiler.start()
+    profiler.start_iteration()
     obj_value = P.c.dot(x_current)
-    obj_values.append(obj_value)
-    t2 = time.time()
-    iter_times.append(t2 - t1)
+    record = {'iteration': iteration, 'obj': obj_value}
+    t2 = time.perf_counter()
+    record['time'] = t2 - t1
     
     # compute steepest-descent direction
-    descent_direction, y_pos, y_neg, steepness, num_steps, solve_time, phase_times = pm.compute_sd_direction(verbose=verbose)
-    simplex_iters.append(num_steps)
-    sub_times['solve'].append(solve_time)
-    sub_times['phase_times'].append(phase_times)
-    
-    t3 = time.time()
-    sub_times['sd'].append(t3 - t2)
+    update_norm()
+    descent_direction, y_pos, y_neg, steepness, num_steps, solve_time, phase_times = compute_sd_direction()
+    t3 = time.perf_counter()
+    record.update({'steepness': steepness, 'simplex_iters': num_steps, 'solve_time': solve_time,
+                   'phase_times': phase_times, 'sd_time': t3 - t2})
+    # on resume this solve repeats the last one before the checkpoint, so it is not recorded
+    if resume is None:
+        write_record(record)
+    if trigger is not None:
+        trigger.start(obj_value, steepness)
+    profiler.end_iteration()
+    bound_change = None
+    last_checkpoint = t3
     
     while abs(steepness) > EPS:
         
-        t3 = time.time()
+        profiler.start_iteration()
+        t3 = time.perf_counter()
         if reset:
             pm.reset()
         
         # take maximal step
-        x_current, alpha, active_inds = P.take_maximal_step(descent_direction, y_pos, y_neg)  
+        with profiler.timer('ratio_test'):
+            x_current, alpha, changed_inds = P.take_maximal_step(descent_direction, y_pos, y_neg)  
         
         if iteration % 50 == 0 or iteration == 1:
             print('\nIteration {}'.format(iteration))
             print('Objective: {}'.format(obj_value))
             print('Steepness: {}'.format(steepness))
             print('Step length: {}'.format(alpha))
+            if bound_change is not None:
+                print('Bound changes: {}'.format(bound_change))
+            print('Degenerate steps: {}'.format(sink.n_degenerate_steps))
         
-        t4 = time.time()
+        t4 = time.perf_counter()
+        step_length = alpha * np.linalg.norm(descent_direction) if trigger is not None else None
         obj_value = P.c.dot(x_current)
-        obj_values.append(obj_value)
-        iter_times.append(t4 - t1)
-        sub_times['step'].append(t4 - t3) 
-        descent_circuits.append(descent_direction)
-        step_sizes.append(alpha)     
+        record = {'iteration': iteration + 1, 'obj': obj_value, 'time': t4 - t1, 'step_size': alpha,
+                  'step_time': t4 - t3, 'circuit': descent_direction}
                 
         if math.isinf(alpha):
             # problem is unbounded
-            return result(status=1, circuits=descent_circuits, steps=step_sizes)
+            write_record(record)
+            profiler.end_iteration()
+            profiler.stop()
+            sink.close()
+            P.remove_shifts()
+            return result(status=1, **sink.result_fields())
         
         # compute steepest-descent direction
-        pm.set_active_inds(active_inds)
-        descent_direction, y_pos, y_neg, steepness, num_steps, solve_time, phase_times = pm.compute_sd_direction(
-                                                                                                verbose=verbose)
+        with profiler.timer('bound_update'):
+            bound_change = pm.update_active_inds(changed_inds, P.active_inds)
+        update_norm()
+        descent_direction, y_pos, y_neg, steepness, num_steps, solve_time, phase_times = compute_sd_direction()
         
-        t5 = time.time()
-        sub_times['sd'].append(t5 - t4)
-        sub_times['solve'].append(solve_time)
-        sub_times['phase_times'].append(phase_times)
-        simplex_iters.append(num_steps)
+        t5 = time.perf_counter()
+        record.update({'bound_changes': bound_change, 'steepness': steepness, 'simplex_iters': num_steps,
+                       'solve_time': solve_time, 'phase_times': phase_times, 'sd_time': t5 - t4})
+        write_record(record)
+        profiler.end_iteration()
         
         iteration += 1
         current_time = t5 - t1
+        # the run converged for the shifted right hand sides of the 'perturb' mode: they are restored and the
+        # simplex method takes the remaining steps from the current point
+        if abs(steepness) <= EPS and P.has_shifts():
+            profiler.stop()
+            sink.close()
+            n_shifts = P.remove_shifts()
+            print('\nRestored {} shifted right hand sides after iteration {}, cleaning up with simplex...'.format(
+                  n_shifts, iteration))
+            lp_result = simplex_crossover(P, x_current)
+            total_time = time.perf_counter() - t1
+            print('Total time for steepest-descent scheme with simplex clean-up: {}'.format(total_time))
+            fields = sink.result_fields()
+            fields['stats']['perturbation'] = {'iteration': iteration, 'n_shifts': n_shifts, 'sd_time': current_time,
+                                               'sd_obj': obj_value, 'simplex_iters': lp_result.n_iters,
+                                               'simplex_time': lp_result.solve_time}
+            return result(status=0, x=lp_result.x, obj=lp_result.obj, n_iters=sink.n_steps, solve_time=total_time,
+                          alg_type='hybrid', **fields)
+        # hybrid mode: the simplex method finishes the solve (unless the current point is already optimal)
+        if (trigger is not None and abs(steepness) > EPS
+                and trigger.fires(obj_value, steepness, step_length, current_time)):
+            profiler.stop()
+            sink.close()
+            print('\nSwitching to simplex after iteration {} ({} trigger)...'.format(iteration, crossover))
+            P.remove_shifts()
+            lp_result = simplex_crossover(P, x_current)
+            total_time = time.perf_counter() - t1
+            print('Total time for hybrid scheme: {}'.format(total_time))
+            fields = sink.result_fields()
+            fields['stats']['crossover'] = {'trigger': crossover, 'iteration': iteration, 'sd_time': current_time,
+                                            'sd_obj': obj_value, 'simplex_iters': lp_result.n_iters,
+                                            'simplex_time': lp_result.solve_time}
+            return result(status=0, x=lp_result.x, obj=lp_result.obj, n_iters=sink.n_steps, solve_time=total_time,
+                          alg_type='hybrid', **fields)
         if current_time > max_time:
-            return result(status=2)
+            profiler.stop()
+            if checkpoint_fn is not None:
+                write_checkpoint(iteration, current_time)
+            P.remove_shifts()
+            sink.close()
+            return result(status=2, x=x_current, obj=obj_value, n_iters=sink.n_steps, solve_time=current_time,
+                          alg_type='steepest-descent', **sink.result_fields())
+        if checkpoint_fn is not None and checkpoint_interval is not None and t5 - last_checkpoint > checkpoint_interval:
+            write_checkpoint(iteration, current_time)
+            last_checkpoint = time.perf_counter()
         if iteration <= save_first_steps:
             np.save('solutions/{}_{}.npy'.format(problem_name, iteration), x_current)
 
-    t6 = time.time()
+    profiler.stop()
+    t6 = time.perf_counter()
     total_time = t6 - t1   
     print('Total time for steepest-descent scheme: {}'.format(total_time))
+    sink.close()
         
     return result(status=0, x=x_current, 
-                  obj=P.c.dot(x_current), n_iters=len(step_sizes), solve_time=total_time,
-                  iter_times=iter_times, alg_type='steepest-descent',
-                  circuits=descent_circuits, steps=step_sizes,
-                  simplex_iters=simplex_iters, solve_times=sub_times['solve'],
-                  sub_times=sub_times, obj_values=obj_values)
+                  obj=P.c.dot(x_current), n_iters=sink.n_steps, solve_time=total_time,
+                  alg_type='steepest-descent', **sink.result_fields())
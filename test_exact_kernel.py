@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from exact_kernel import kernel_vector, sympy_kernel_vector, modular_kernel_vector, integer_rows
+
+
+# matrices with s columns and a one-dimensional kernel
+def random_matrices(seed=0):
+    rng = np.random.default_rng(seed)
+    matrices = [rng.integers(-5, 6, size=(s - 1, s)).astype(float) for s in (2, 3, 5, 8, 12)]
+    # a dependent row (the kernel is still one-dimensional)
+    M = rng.integers(-3, 4, size=(5, 6)).astype(float)
+    matrices.append(np.vstack((M, 2*M[0] - M[1])))
+    # decimal entries, scaled to integers by integer_rows
+    matrices.append(np.round(rng.uniform(-1, 1, size=(5, 6)), 3))
+    # large entries, whose kernel vector does not fit in int64
+    matrices.append(rng.integers(-10**6, 10**6, size=(7, 8)).astype(float))
+    return [M for M in matrices if np.linalg.matrix_rank(M) == M.shape[1] - 1]
+
+
+def same_up_to_sign(u, v):
+    u, v = [int(a) for a in u], [int(a) for a in v]
+    return u == v or u == [-a for a in v]
+
+
+@pytest.mark.parametrize('M', random_matrices())
+def test_kernel_vector_matches_sympy(M):
+    z = kernel_vector(M)
+    assert z is not None
+    assert same_up_to_sign(z, sympy_kernel_vector(M))
+    assert not np.any(integer_rows(M).astype(object).dot(np.array(z, dtype=object)))
+
+
+def test_modular_kernel_vector_matches_sympy():
+    for M in random_matrices(seed=1):
+        M_int = integer_rows(M)
+        assert same_up_to_sign(modular_kernel_vector(M_int), sympy_kernel_vector(M_int))
+
+
+def test_large_kernel_vector_is_exact():
+    z = kernel_vector(random_matrices()[-1])
+    assert z.dtype == object
+    assert max(abs(a) for a in z) >= 2**63
+
+
+def test_modular_kernel_vector_of_larger_kernel():
+    M = np.array([[1, 2, 3, 4], [2, 4, 6, 8]], dtype=np.int64)
+    assert modular_kernel_vector(M) is None
+    # kernel_vector falls back to sympy, which returns one of the kernel vectors
+    z = kernel_vector(M.astype(float))
+    assert not np.any(M.dot(z))
+
+
+def test_trivial_kernel():
+    assert kernel_vector(np.eye(4)) is None
+    assert kernel_vector(np.array([[1.0, 2.0], [3.0, 4.0]])) is None
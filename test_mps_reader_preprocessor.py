@@ -0,0 +1,32 @@
+import os
+import numpy as np
+import pytest
+from scipy.optimize import linprog
+
+from mps_reader_preprocessor import read_mps_preprocess
+
+PROBLEM_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'netlib_lp_subset')
+# optimal objective values published with the Netlib problems
+NETLIB_OPTIMA = {'afiro': -4.6475314286e+02, 'sc50a': -6.4575077059e+01}
+
+
+def solve(c, B, d, A, b, lb=None, ub=None):
+    bounds = (None, None) if lb is None else list(zip(*[[None if np.isinf(v) else v for v in bound]
+                                                         for bound in (lb, ub)]))
+    res = linprog(c, A_ub=B, b_ub=d, A_eq=A if A.shape[0] else None, b_eq=b if A.shape[0] else None,
+                  bounds=bounds, method='highs')
+    assert res.status == 0
+    return res.fun
+
+
+@pytest.mark.parametrize('problem', sorted(NETLIB_OPTIMA))
+def test_optimum_with_bound_rows(problem):
+    c, B, d, A, b = read_mps_preprocess(os.path.join(PROBLEM_DIR, problem))
+    assert np.isclose(solve(c, B, d, A, b), NETLIB_OPTIMA[problem], rtol=1e-8)
+
+
+@pytest.mark.parametrize('problem', sorted(NETLIB_OPTIMA))
+def test_optimum_with_bound_vectors(problem):
+    c, B, d, A, b, lb, ub = read_mps_preprocess(os.path.join(PROBLEM_DIR, problem), bound_rows=False)
+    assert len(lb) == len(ub) == len(c) == B.shape[1] == A.shape[1]
+    assert np.isclose(solve(c, B, d, A, b, lb, ub), NETLIB_OPTIMA[problem], rtol=1e-8)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from scipy.optimize import linprog
+
+from partition_polytope import PartitionPolytope, random_partition_instance, min_mean_cycle
+from steepest_descent import steepest_descent_augmentation_scheme as sdac
+from utils import to_dense
+
+
+def lp_optimum(P):
+    res = linprog(P.c, A_ub=to_dense(P.B), b_ub=P.d, A_eq=to_dense(P.A), b_eq=P.b, bounds=(0, None),
+                  method='highs')
+    assert res.status == 0
+    return res.fun
+
+
+def test_min_mean_cycle():
+    inf = np.inf
+    # cycles 0 -> 1 -> 0 (mean 1.5) and 1 -> 2 -> 3 -> 1 (mean -1)
+    W = np.array([[inf, 1, inf, inf],
+                  [2, inf, 0, inf],
+                  [inf, inf, inf, -1],
+                  [inf, -2, inf, inf]])
+    cycle = min_mean_cycle(W)
+    assert sorted(cycle) == [1, 2, 3]
+    assert min_mean_cycle(np.full((3, 3), np.inf)) is None
+
+
+# the exchange oracle stops at an optimal clustering (the LP optimum, as the partition polytope is integral)
+# and finds the same steepness as the circuit model at the feasible start point
+@pytest.mark.parametrize('n, k, seed', [(8, 2, 0), (12, 3, 1), (15, 4, 2), (20, 5, 3)])
+def test_exchange_oracle_optimal(n, k, seed):
+    ub, lb, c = random_partition_instance(n, k, np.random.default_rng(seed))
+    P = PartitionPolytope(n, k, ub, lb, c, backend='highs')
+    x = P.find_feasible_solution()
+
+    pm = P.build_polyhedral_model(active_inds=P.get_active_constraints(x), primal=True)
+    steepness = pm.compute_sd_direction()[3]
+    oracle = P.build_exchange_oracle()
+    assert np.isclose(oracle.compute_sd_direction()[3], steepness, atol=1e-9)
+
+    res = sdac(P, x, c=c, pm=oracle, max_time=60)
+    assert res.status == 0
+    assert np.isclose(res.obj, lp_optimum(P))
+    y = res.x.reshape(k, n)
+    assert np.allclose(y.sum(axis=0), 1) and np.all(y >= 0)
+
+
+# a step returns only the constraints that entered or left the active set, and the active set it leaves equals
+# the one computed from the new clustering, with the support of the oracle circuits and without it
+@pytest.mark.parametrize('use_oracle', [True, False])
+def test_step_changed_constraints(use_oracle):
+    ub, lb, c = random_partition_instance(15, 4, np.random.default_rng(2))
+    P = PartitionPolytope(15, 4, ub, lb, c, backend='highs')
+    x = P.find_feasible_solution()
+    active = np.zeros(P.n_constraints, dtype=bool)
+    active[P.get_active_constraints(x)] = True
+    pm = P.build_exchange_oracle() if use_oracle else P.build_polyhedral_model(active_inds=np.flatnonzero(active))
+    g, y_pos, y_neg, steepness = pm.compute_sd_direction()[:4]
+    while steepness < -1e-9:
+        _, _, changed = P.take_maximal_step(g, y_pos, y_neg)
+        assert P.circuit_support is None
+        assert set(changed) >= set(np.flatnonzero(P.active_inds != active))
+        active = np.copy(P.active_inds)
+        P.get_active_constraints(np.copy(P.y_current))
+        assert np.array_equal(P.active_inds, active)
+        pm.update_active_inds(changed, P.active_inds)
+        g, y_pos, y_neg, steepness = pm.compute_sd_direction()[:4]
+    assert np.isclose(c.dot(P.y_current), lp_optimum(P))
@@ -0,0 +1,136 @@
+import os
+import numpy as np
+import pytest
+
+from mps_reader_preprocessor import read_mps_preprocess
+from polyhedron import Polyhedron, PERTURB_TOL
+from steepest_descent import steepest_descent_augmentation_scheme as sdac, load_checkpoint
+from iteration_log import MemorySink
+from utils import METHODS
+
+PROBLEM_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'netlib_lp_subset')
+
+
+def load(problem, bound_rows=False, backend='highs'):
+    if bound_rows:
+        c, B, d, A, b = read_mps_preprocess(os.path.join(PROBLEM_DIR, problem))
+        return Polyhedron(B, d, A, b, c, backend=backend)
+    c, B, d, A, b, lb, ub = read_mps_preprocess(os.path.join(PROBLEM_DIR, problem), bound_rows=False)
+    return Polyhedron(B, d, A, b, c, backend=backend, lb=lb, ub=ub)
+
+
+# the perturb mode takes no step shorter than PERTURB_TOL, restores the right hand sides and ends at the optimum
+def test_perturb_anti_stalling():
+    P = load('scsd6')
+    d, lb, ub = np.copy(P.d), np.copy(P.var_lb), np.copy(P.var_ub)
+    x = P.find_feasible_solution()
+    lp = P.solve_lp(record_objs=False)
+
+    r = sdac(P, np.copy(x), max_time=60, anti_stalling='perturb')
+    assert r.status == 0 and r.alg_type == 'hybrid'
+    assert r.n_iters == len(r.steps) == r.stats['perturbation']['iteration']
+    assert r.stats['perturbation']['simplex_time'] <= r.solve_time
+    assert np.min(r.steps) >= PERTURB_TOL
+    assert r.stats['n_degenerate_steps'] == 0
+    assert r.stats['perturbation']['n_shifts'] > 0
+    assert np.isclose(r.obj, lp.obj, rtol=1e-9)
+    assert not P.has_shifts()
+    assert np.array_equal(P.d, d) and np.array_equal(P.var_lb, lb) and np.array_equal(P.var_ub, ub)
+
+    r_off = sdac(P, np.copy(x), max_time=60, anti_stalling='off')
+    assert np.min(r_off.steps) < PERTURB_TOL
+    assert np.isclose(r_off.obj, lp.obj, rtol=1e-7)
+
+
+def test_shifts_only_tighten():
+    P = load('afiro')
+    x = P.find_feasible_solution()
+    P.get_active_constraints(x)
+    d = np.copy(P.d)
+    P.set_anti_stalling('perturb', perturb_tol=1e6)
+    n_shifted = P.shift_near_tight()
+    assert n_shifted > 0 and P.has_shifts()
+    assert np.all(P.d <= d) and np.all(P.B.dot(x) <= P.d + 1e-9)
+    assert P.remove_shifts() == n_shifted
+    assert np.array_equal(P.d, d) and not P.has_shifts()
+
+
+# a checkpoint of a perturbed run has the unshifted right hand sides and the shifts, and the resumed run
+# continues with them
+def test_perturb_checkpoint(tmp_path):
+    P = load('scsd6')
+    d, lb, ub = np.copy(P.d), np.copy(P.var_lb), np.copy(P.var_ub)
+    x = P.find_feasible_solution()
+    lp = P.solve_lp(record_objs=False)
+    checkpoint_fn = str(tmp_path / 'checkpoint.p')
+    r = sdac(P, np.copy(x), max_time=60, anti_stalling='perturb', checkpoint_fn=checkpoint_fn, checkpoint_interval=0)
+    checkpoint = load_checkpoint(checkpoint_fn)
+    assert checkpoint['iteration'] == r.n_iters - 1
+    assert np.array_equal(checkpoint['lb'], lb) and checkpoint['shifts'] is not None
+    # right hand sides of Bx <= d, x <= ub and -x <= -lb, with and without the shifts
+    rhs = np.concatenate((d, ub, -lb))
+    shifted_d, shifted_ub, shifted_lb, _ = checkpoint['shifts']
+    shifted_rhs = np.concatenate((shifted_d, shifted_ub, -shifted_lb))
+    assert np.all(shifted_rhs <= rhs) and np.any(checkpoint['active_mask'] & (shifted_rhs < rhs))
+
+    r_resumed = sdac(P, None, max_time=60, anti_stalling='perturb', resume=checkpoint)
+    assert r_resumed.status == 0
+    assert np.isclose(r_resumed.obj, lp.obj, rtol=1e-9)
+    assert np.array_equal(P.d, d) and np.array_equal(P.var_lb, lb) and not P.has_shifts()
+
+
+# normalized circuits are primitive integer vectors parallel to the circuits of a run, also with free variables
+# (in the bound-row form no variable has bounds)
+@pytest.mark.parametrize('bound_rows', [False, True])
+def test_normalized_circuits(bound_rows):
+    P = load('sc50a', bound_rows)
+    x = P.find_feasible_solution()
+    r = sdac(P, np.copy(x), max_time=60, sink=MemorySink(keep_circuits=True))
+    assert len(r.circuits) == r.n_iters
+    for g in r.circuits:
+        g = np.ravel(g)
+        circuit = P.get_normalized_circuit(g)
+        assert np.gcd.reduce(np.abs(circuit).astype(int)) == 1
+        i = np.argmax(np.abs(g))
+        assert np.allclose(circuit * g[i] / circuit[i], g, atol=1e-9)
+
+
+# added facets come before the bounds in the constraint indexing, and cannot be added once a circuit model
+# copied the rows of B
+def test_add_facets():
+    P = load('afiro')
+    x = P.find_feasible_solution()
+    P.get_active_constraints(np.copy(x))
+    m_B = P.m_B
+    np.random.seed(0)
+    P.add_facets(x, n_facets=2)
+    assert P.m_B == P.B.shape[0] == m_B + 2 and P.n_constraints == m_B + 2 + 2*P.n
+    assert len(P.active_inds) == P.n_constraints and P.active_inds[m_B:m_B + 2].all()
+    lp = P.solve_lp(record_objs=False)
+    r = sdac(P, np.copy(x), max_time=60)
+    assert np.isclose(r.obj, lp.obj, rtol=1e-9)
+    # by default only the circuit of the last step is kept
+    assert len(r.circuits) == 1 and len(r.steps) == r.n_iters
+    with pytest.raises(RuntimeError):
+        P.add_facets(x)
+
+
+# a warm start at the optimum takes fewer simplex iterations than a cold solve, and gurobi runs the solves
+# after the pushed start with the method and warm start setting chosen before
+@pytest.mark.parametrize('backend', ['highs', 'gurobi'])
+def test_warm_start(backend):
+    if backend == 'gurobi':
+        pytest.importorskip('gurobipy')
+    P = load('scsd6', backend=backend)
+    cold = P.solve_lp(record_objs=False)
+
+    Q = load('scsd6', backend=backend)
+    Q.build_lp_model(c=Q.c)
+    if backend == 'gurobi':
+        warm_start_param = Q.model.model.Params.LPWarmStart
+    Q.set_solution(cold.x)
+    warm = Q.solve_lp(record_objs=False, method='dual_simplex')
+    assert warm.n_iters < cold.n_iters
+    assert np.isclose(warm.obj, cold.obj, rtol=1e-9)
+    if backend == 'gurobi':
+        assert Q.model.model.Params.Method == METHODS['dual_simplex'] and Q.model.model.Params.LPWarmStart == warm_start_param
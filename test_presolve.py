@@ -0,0 +1,55 @@
+import os
+import numpy as np
+import pytest
+from scipy.optimize import linprog
+
+from mps_reader_preprocessor import read_mps_preprocess
+from presolve import presolve
+from utils import result
+
+PROBLEM_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'netlib_lp_subset')
+
+
+def solve(c, B, d, A, b, lb, ub):
+    bounds = [(None if np.isinf(l) else l, None if np.isinf(u) else u) for l, u in zip(lb, ub)]
+    res = linprog(c, A_ub=B if B.shape[0] else None, b_ub=d if B.shape[0] else None,
+                  A_eq=A if A.shape[0] else None, b_eq=b if A.shape[0] else None, bounds=bounds, method='highs')
+    assert res.status == 0
+    return res.x, res.fun
+
+
+# presolve -> solve -> postsolve gives a feasible optimal solution of the original problem
+# (beaconfd and bandm have fixed variables, i.e. a nonzero objective offset)
+@pytest.mark.parametrize('problem', ['afiro', 'sc50a', 'beaconfd', 'bandm'])
+def test_round_trip(problem):
+    c, B, d, A, b, lb, ub = read_mps_preprocess(os.path.join(PROBLEM_DIR, problem), bound_rows=False)
+    _, obj = solve(c, B, d, A, b, lb, ub)
+
+    (c_r, B_r, d_r, A_r, b_r, lb_r, ub_r), postsolve = presolve(c, B, d, A, b, lb, ub, bound_rows=False)
+    assert len(c_r) <= len(c) and B_r.shape[0] <= B.shape[0] and A_r.shape[0] <= A.shape[0]
+    x_r, obj_r = solve(c_r, B_r, d_r, A_r, b_r, lb_r, ub_r)
+
+    x = postsolve.postsolve(x_r)
+    scale = max(1.0, abs(obj))
+    assert np.isclose(postsolve.postsolve_obj(obj_r), obj, rtol=1e-7, atol=1e-7 * scale)
+    assert np.isclose(c.dot(x), obj, rtol=1e-7, atol=1e-7 * scale)
+    assert np.all(B.dot(x) <= d + 1e-6 * np.maximum(1, np.abs(d)))
+    assert np.allclose(A.dot(x), b, atol=1e-6)
+    assert np.all(x >= lb - 1e-6) and np.all(x <= ub + 1e-6)
+
+    # results of the reduced problem, including the statistics of a steepest-descent run
+    r = result(0, x=x_r, obj=obj_r, obj_values=[obj_r], alg_type='steepest-descent',
+               stats={'last_obj': obj_r, 'crossover': {'sd_obj': obj_r}})
+    postsolve.postsolve_result(r)
+    assert np.allclose(r.x, x)
+    for value in (r.obj, r.obj_values[0], r.stats['last_obj'], r.stats['crossover']['sd_obj']):
+        assert value == postsolve.postsolve_obj(obj_r)
+
+
+def test_bound_rows_keep_optimum():
+    c, B, d, A, b, lb, ub = read_mps_preprocess(os.path.join(PROBLEM_DIR, 'beaconfd'), bound_rows=False)
+    _, obj = solve(c, B, d, A, b, lb, ub)
+    (c_r, B_r, d_r, A_r, b_r), postsolve = presolve(c, B, d, A, b, lb, ub)
+    n_r = len(c_r)
+    _, obj_r = solve(c_r, B_r, d_r, A_r, b_r, np.full(n_r, -np.inf), np.full(n_r, np.inf))
+    assert np.isclose(postsolve.postsolve_obj(obj_r), obj, rtol=1e-7)
@@ -0,0 +1,65 @@
+import os
+import shutil
+import numpy as np
+import pytest
+
+from main import main
+from results_store import ResultsStore
+
+PROBLEM_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'netlib_lp_subset')
+RUNS = {'afiro_dantzig': dict(mps_fn=os.path.join(PROBLEM_DIR, 'afiro'), rule='dantzig'),
+        'spindle_seed': dict(spindle=True, spindle_dim=6, n_cone_facets=5, n_parallel_facets=3, seed=1)}
+
+
+# a run ingested by main (--results_db) and by importing its pickles has the same problem, seed and rule,
+# so the two copies fall into one group
+@pytest.mark.parametrize('run', sorted(RUNS))
+def test_ingest_both_ways(tmp_path, run):
+    results_dir, db = str(tmp_path / 'results'), str(tmp_path / 'results.db')
+    P, lp_result, sd_result = main(results_dir=results_dir, results_db=db, backend='highs', max_time=60,
+                                   cache=False, **RUNS[run])
+    # the pickles of a copy of the results directory are imported as new runs
+    shutil.copytree(results_dir, str(tmp_path / 'copy'))
+    store = ResultsStore(db)
+    assert store.import_pickles(str(tmp_path / 'copy'), backend='highs', sd_method='dual_simplex') == 2
+    assert store.import_pickles(str(tmp_path / 'copy')) == 0
+
+    runs = store.runs(alg_type='steepest-descent')
+    assert len(runs) == 2
+    for key in ('problem', 'seed', 'rule', 'sd_method', 'backend', 'n_iters'):
+        assert runs[0][key] == runs[1][key]
+    assert runs[0]['seed'] == RUNS[run].get('seed')
+    assert runs[0]['rule'] == RUNS[run].get('rule', 'steepest')
+    assert '_s-' not in runs[0]['problem'] and '_r-' not in runs[0]['problem']
+
+    groups = store.aggregate('total_time', by=['problem', 'alg_type', 'rule', 'seed'], stat='count', level='run')
+    assert [count for _, _, count in groups] == [2, 2]
+    groups = store.aggregate('simplex_iters', by=['problem'], stat='sum')
+    assert len(groups) == 1 and groups[0][1] == 2 * sd_result.stats['total_simplex_iters']
+    store.close()
+
+
+# per-iteration records are stored in the order of the run, and the statistics match numpy
+def test_aggregate_iterations(tmp_path):
+    db = str(tmp_path / 'results.db')
+    results = {}
+    for sd_method in ('dual_simplex', 'primal_simplex'):
+        _, _, results[sd_method] = main(mps_fn=os.path.join(PROBLEM_DIR, 'sc50a'), results_dir='', results_db=db,
+                                        backend='highs', sd_method=sd_method, cache=False)
+    store = ResultsStore(db)
+    for run in store.runs(alg_type='steepest-descent'):
+        r = results[run['sd_method']]
+        iterations = store.iterations(run['run_id'])
+        assert np.array_equal(iterations['iteration'], np.arange(len(r.solve_times)))
+        assert np.allclose(iterations['solve_time'], r.solve_times)
+        assert np.allclose(iterations['step_size'][1:], r.steps)
+        assert np.isnan(iterations['step_size'][0])
+
+    for stat, f in (('median', np.median), ('mean', np.mean), ('max', np.max), ('count', len)):
+        groups = dict((key[0], value) for key, value, _ in
+                      store.aggregate('solve_time', by=['sd_method'], stat=stat, alg_type='steepest-descent'))
+        for sd_method, r in results.items():
+            assert np.isclose(groups[sd_method], f(r.solve_times))
+    with pytest.raises(ValueError):
+        store.aggregate('no_such_column', by=['sd_method'])
+    store.close()
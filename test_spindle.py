@@ -0,0 +1,14 @@
+import numpy as np
+
+from spindle import Spindle
+
+
+# the feasible solution is the apex p1, as a copy that the steps of the scheme can move without moving p1
+def test_feasible_solution_is_a_copy():
+    S = Spindle(6, 4, 2, backend='highs', rng=0)
+    x = S.find_feasible_solution()
+    assert np.array_equal(S.get_active_constraints(x), np.arange(4))
+    x += 0.5
+    assert not S.p1.any()
+    # halfway to the other apex none of the cone facets at p1 is tight
+    assert np.all(S.get_active_constraints(x) >= 4)
@@ -1,6 +1,6 @@
 import pickle
-import random
 import numpy as np
+import scipy.sparse as sp
 
 METHODS = {'auto': -1,
 		   'primal_simplex': 0,
@@ -10,17 +10,43 @@ METHODS = {'auto': -1,
            'deterministic_concurrent': 4,
            'deterministic_concurrent_simplex': 5,}
 
+# HiGHS options corresponding to the methods above
+HIGHS_METHODS = {'auto': {'solver': 'choose'},
+                 'primal_simplex': {'solver': 'simplex', 'simplex_strategy': 4},
+                 'dual_simplex': {'solver': 'simplex', 'simplex_strategy': 1},
+                 'barrier': {'solver': 'ipm'},
+                 'concurrent': {'solver': 'choose'},
+                 'deterministic_concurrent': {'solver': 'choose'},
+                 'deterministic_concurrent_simplex': {'solver': 'simplex', 'simplex_strategy': 0},}
+
 INF = 10e100
 EPS = 10e-8
 
+# algorithm types of results that have the iteration lists and stats of a steepest-descent run (hybrid runs take
+# circuit steps first and are finished by the simplex method)
+SD_ALG_TYPES = ('steepest-descent', 'hybrid')
+
 def avg(x):
     return float(sum(x)) / float(len(x))
 
+# return the nonzero coefficients and their column indices for row i of a dense or CSR matrix
+def get_row(M, i):
+    if sp.issparse(M):
+        start, end = M.indptr[i], M.indptr[i+1]
+        return M.data[start:end], M.indices[start:end]
+    row = np.asarray(M[i]).ravel()
+    inds = np.flatnonzero(row)
+    return row[inds], inds
+
+# convert a dense or sparse matrix to a dense numpy array
+def to_dense(M):
+    return M.toarray() if sp.issparse(M) else M
+
 
 class result:  
     def __init__(self, status, x=None, obj=None, n_iters=None, solve_time=None, iter_times=[], alg_type='simplex',
                  circuits=[], steps=[], simplex_iters=[], solve_times=[], sub_times=None,
-                 obj_values=[], iter_counts=[]):
+                 obj_values=[], iter_counts=[], bound_changes=[], stats=None, log_fn=None):
         self.status = status
         self.x = x
         self.obj = obj
@@ -37,6 +63,11 @@ class result:
         
         self.sub_times = sub_times
         self.obj_values = obj_values
+        self.bound_changes = bound_changes
+        
+        # running totals of a steepest-descent run, and the file its iterations were streamed to
+        self.stats = stats
+        self.log_fn = log_fn
           
     def __str__(self):
         if self.status == 1:
@@ -48,14 +79,37 @@ class result:
                    + '\nTotal solve time: {}'.format(self.solve_time)
                    + '\nNumber of iterations: {}'.format(self.n_iters)
             )
-            if self.alg_type == 'steepest-descent':
-                output += ('\nFirst simplex iterations {}'.format(self.simplex_iters[0])
-                       + '\nAverage num simplex iterations {}'.format(sum(self.simplex_iters)/len(self.simplex_iters))
-                       + '\nTotal simplex iterations: {}'.format(sum(self.simplex_iters))
-                       + '\nFirst solve time {}'.format(self.solve_times[0])
-                       + '\nAverage solve time {}'.format(sum(self.solve_times)/len(self.solve_times))
-                       + '\nTotal solve time: {}'.format(sum(self.solve_times))
+            if self.alg_type in SD_ALG_TYPES:
+                stats = self.stats
+                if stats is None:
+                    stats = {'n_solves': len(self.simplex_iters), 'first_simplex_iters': self.simplex_iters[0],
+                             'total_simplex_iters': sum(self.simplex_iters), 'first_solve_time': self.solve_times[0],
+                             'total_solve_time': sum(self.solve_times), 'total_bound_changes': sum(self.bound_changes)}
+                output += ('\nFirst simplex iterations {}'.format(stats['first_simplex_iters'])
+                       + '\nAverage num simplex iterations {}'.format(stats['total_simplex_iters']/stats['n_solves'])
+                       + '\nTotal simplex iterations: {}'.format(stats['total_simplex_iters'])
+                       + '\nFirst solve time {}'.format(stats['first_solve_time'])
+                       + '\nAverage solve time {}'.format(stats['total_solve_time']/stats['n_solves'])
+                       + '\nTotal solve time: {}'.format(stats['total_solve_time'])
                        )
+                if self.n_iters:
+                    output += '\nAverage bound changes per iteration: {}'.format(
+                                  stats['total_bound_changes']/float(self.n_iters))
+                if stats.get('n_degenerate_steps'):
+                    output += '\nDegenerate steps: {} (oracle time after them: {})'.format(
+                                  stats['n_degenerate_steps'], stats['degenerate_solve_time'])
+                if 'crossover' in stats:
+                    output += ('\nSwitched to simplex after iteration {} ({} trigger), with {} simplex iterations'
+                               .format(stats['crossover']['iteration'], stats['crossover']['trigger'],
+                                       stats['crossover']['simplex_iters']))
+                if 'perturbation' in stats:
+                    output += ('\nRestored {} shifted right hand sides after iteration {}, with {} simplex iterations'
+                               ' of clean-up ({} s)'.format(stats['perturbation']['n_shifts'],
+                                                           stats['perturbation']['iteration'],
+                                                           stats['perturbation']['simplex_iters'],
+                                                           stats['perturbation']['simplex_time']))
+                if self.log_fn is not None:
+                    output += '\nIteration log: {}'.format(self.log_fn)
             return output
         else:
             return 'Problem unsolved'
@@ -68,10 +122,13 @@ class result:
                    'iter_times': self.iter_times,
                    'iter_counts': self.iter_counts,
                    'alg_type': self.alg_type}
-        if self.alg_type == 'steepest-descent':
+        if self.alg_type in SD_ALG_TYPES:
             results['simplex_iters'] = self.simplex_iters
             results['solve_times'] = self.solve_times
             results['sub_times'] = self.sub_times
+            results['bound_changes'] = self.bound_changes
+            results['stats'] = self.stats
+            results['log_fn'] = self.log_fn
             
         with open(fn, 'wb') as f:
             pickle.dump(results, f)